@@ -5,9 +5,14 @@ Sử dụng Pydantic Settings để đọc, xác thực và quản lý cấu hì
 như tệp .env và biến môi trường. Điều này đảm bảo rằng tất cả các giá trị
 cấu hình đều đúng kiểu dữ liệu, nhất quán và dễ dàng truy cập thông qua
 một đối tượng `settings` duy nhất.
+
+Các phần chỉ pipeline ETL cần được tải khi dùng tới lần đầu, để API khởi động
+nhanh và không đòi hỏi cấu hình mà nó không dùng:
+- `TABLE_CONFIG` và `TIME_OFFSETS` (đọc từ các tệp YAML trong `configs/`).
+- `db`: thông tin kết nối SQL Server chỉ bắt buộc khi ETL đọc từ SQL Server.
 """
 
-import yaml
+from datetime import datetime, timedelta
 from pathlib import Path
 from typing import (
     Any,
@@ -16,6 +21,7 @@ from typing import (
     Literal,
     Optional,
     Annotated,
+    Union,
 )
 from urllib import parse
 
@@ -26,6 +32,7 @@ from pydantic import (
     TypeAdapter,
     ValidationError,
     AnyUrl,
+    PrivateAttr,
     model_validator,
 )
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -55,6 +62,101 @@ class CleaningRule(BaseModel):
     action: Literal["strip"]
 
 
+class StorageOptions(BaseModel):
+    """
+    Định nghĩa bố cục vật lý của các tệp Parquet trong staging area.
+
+    Dữ liệu được sắp xếp theo `sort_by` trong mỗi row group, nhờ đó thống kê
+    min/max (và page index) cho phép DuckDB bỏ qua các row group không chứa
+    cửa hàng hoặc khoảng thời gian cần truy vấn.
+    """
+
+    sort_by: List[str] = Field(default_factory=list)
+    compression: Literal["zstd", "snappy", "gzip", "lz4", "none"] = "zstd"
+    compression_level: Optional[int] = None
+    row_group_size: Optional[int] = Field(default=None, gt=0)
+    dictionary_columns: Optional[List[str]] = None
+    write_statistics: bool = True
+    write_page_index: bool = True
+
+
+class OutlierOptions(BaseModel):
+    """
+    Phát hiện và hiệu chỉnh giá trị bất thường (outlier) khi nạp vào DuckDB.
+
+    Mỗi giá trị được so với baseline bền vững (median và MAD) của cùng nhóm
+    `group_by` (và cùng giờ trong ngày nếu `by_hour`) trong `window_days` ngày
+    trước đó. Giá trị vượt quá `median + threshold * 1.4826 * MAD` bị đánh dấu
+    và được thay bằng median. Khi nhóm chưa đủ `min_samples` giá trị, quy tắc
+    toàn cục `OUTLIER_THRESHOLD`/`OUTLIER_SCALE_RATIO` được dùng thay thế.
+    """
+
+    columns: Dict[str, str]  # Cột gốc -> cột đã hiệu chỉnh
+    group_by: List[str] = Field(default_factory=list)
+    by_hour: bool = True
+    window_days: int = Field(default=28, gt=0)
+    threshold: float = Field(default=5.0, gt=0)
+    min_samples: int = Field(default=20, gt=0)
+    min_mad: float = Field(default=1.0, gt=0)  # Tránh MAD = 0 ở cửa hàng vắng
+
+
+class TimeOffsetPeriod(BaseModel):
+    """
+    Một mức chênh lệch thời gian của thiết bị trong khoảng hiệu lực của nó.
+
+    Khoảng hiệu lực [effective_from, effective_to) tính theo đồng hồ của thiết
+    bị (timestamp gốc ở nguồn). Bỏ trống một đầu nghĩa là không giới hạn.
+    """
+
+    minutes: int
+    effective_from: Optional[datetime] = None
+    effective_to: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def _validate_range(self) -> "TimeOffsetPeriod":
+        if (
+            self.effective_from is not None
+            and self.effective_to is not None
+            and self.effective_from >= self.effective_to
+        ):
+            raise ValueError("'effective_from' phải trước 'effective_to'.")
+        return self
+
+
+# Mỗi cửa hàng: một số phút (áp dụng mọi lúc) hoặc danh sách các khoảng hiệu lực.
+_RawTimeOffsets = Dict[str, Dict[int, Union[int, List[TimeOffsetPeriod]]]]
+
+
+def parse_time_offsets(raw: Any) -> Dict[str, Dict[int, List[TimeOffsetPeriod]]]:
+    """
+    Xác thực nội dung `time_offsets.yaml` và chuẩn hóa về danh sách khoảng hiệu lực.
+
+    Raises:
+        ValueError: Nếu cấu hình sai kiểu hoặc các khoảng của một cửa hàng chồng
+            lên nhau.
+    """
+    offsets = {}
+    for table, stores in TypeAdapter(_RawTimeOffsets).validate_python(raw).items():
+        offsets[table] = {}
+        for store_id, value in stores.items():
+            periods = (
+                [TimeOffsetPeriod(minutes=value)] if isinstance(value, int) else value
+            )
+            periods = sorted(periods, key=lambda p: p.effective_from or datetime.min)
+            for previous, current in zip(periods, periods[1:]):
+                if (
+                    previous.effective_to is None
+                    or current.effective_from is None
+                    or current.effective_from < previous.effective_to
+                ):
+                    raise ValueError(
+                        f"Các khoảng offset của cửa hàng {store_id} trong "
+                        f"'{table}' bị chồng lên nhau."
+                    )
+            offsets[table][store_id] = periods
+    return offsets
+
+
 class DatabaseSettings(BaseModel):
     """Cấu hình kết nối đến MS SQL Server."""
 
@@ -98,19 +200,46 @@ class TableConfig(BaseModel):
     incremental: bool = True
     description: Optional[str] = None
     processing_order: int = 99
+    depends_on: List[str] = Field(default_factory=list)
+    poll_interval: int = Field(default=60, gt=0)
     rename_map: Dict[str, str] = Field(default_factory=dict)
+    dtypes: Dict[str, str] = Field(default_factory=dict)
     partition_cols: List[str] = Field(default_factory=list)
     cleaning_rules: List[CleaningRule] = Field(default_factory=list)
     timestamp_col: Optional[str] = None
+    key_col: Optional[str] = None
+    primary_key: List[str] = Field(default_factory=list)
+    lookback: Optional[timedelta] = None
+    chunk_size: Optional[int] = Field(default=None, gt=0)
+    chunk_memory_mb: Optional[int] = Field(default=None, gt=0)
+    transform_engine: Literal["pandas", "arrow"] = "pandas"
+    validation: Literal["pandera", "compiled"] = "pandera"
+    validation_fallback: bool = True
+    validation_sample_rate: float = Field(default=1.0, gt=0, le=1)
+    storage: StorageOptions = Field(default_factory=StorageOptions)
+    outliers: Optional[OutlierOptions] = None
+    hot_months: Optional[int] = Field(default=None, gt=0)
 
     @model_validator(mode="after")
     def _validate_incremental_config(self) -> "TableConfig":
-        """Đảm bảo `timestamp_col` tồn tại nếu `incremental` là True."""
+        """Kiểm tra các tùy chọn phụ thuộc `timestamp_col` và `partition_cols`."""
         if self.incremental and not self.timestamp_col:
             raise ValueError(
                 f"Bảng '{self.source_table}': 'timestamp_col' là bắt buộc "
                 f"khi 'incremental' được bật."
             )
+        if self.outliers is not None and not self.timestamp_col:
+            raise ValueError(
+                f"Bảng '{self.source_table}': 'timestamp_col' là bắt buộc "
+                f"khi cấu hình 'outliers'."
+            )
+        if self.hot_months is not None and (
+            not self.incremental or self.partition_cols != ["year", "month"]
+        ):
+            raise ValueError(
+                f"Bảng '{self.source_table}': 'hot_months' chỉ dùng được với bảng "
+                f"incremental có 'partition_cols: [year, month]'."
+            )
         return self
 
     @property
@@ -144,30 +273,48 @@ class Settings(BaseSettings):
     ] = []
 
     # --- Cấu hình logic nghiệp vụ ---
+    # Quy tắc outlier toàn cục, dùng khi chưa đủ lịch sử để tính baseline.
     OUTLIER_THRESHOLD: int = 100
     OUTLIER_SCALE_RATIO: float = 0.00001
     WORKING_HOUR_START: int = 9
     WORKING_HOUR_END: int = 2
 
     # --- Cấu hình Database (sẽ được nhóm vào đối tượng `db`) ---
+    # Chỉ bắt buộc khi ETL đọc từ SQL Server (`ETL_SOURCE=sqlserver`).
     SQLSERVER_DRIVER: str = "ODBC Driver 17 for SQL Server"
-    SQLSERVER_SERVER: str
-    SQLSERVER_DATABASE: str
-    SQLSERVER_UID: str
-    SQLSERVER_PWD: str
+    SQLSERVER_SERVER: Optional[str] = None
+    SQLSERVER_DATABASE: Optional[str] = None
+    SQLSERVER_UID: Optional[str] = None
+    SQLSERVER_PWD: Optional[str] = None
 
     # --- Cấu hình ETL ---
+    ETL_SOURCE: Literal["sqlserver", "sqlite", "duckdb", "parquet"] = "sqlserver"
+    ETL_SOURCE_PATH: Optional[Path] = None  # Tệp/thư mục của nguồn cục bộ
     DATA_DIR: Path = Path("data")
-    ETL_CHUNK_SIZE: int = 100_000
+    ETL_CHUNK_SIZE: int = 100_000  # Số dòng tối đa của một chunk
+    ETL_CHUNK_MIN_SIZE: int = 1_000
+    ETL_CHUNK_PROBE_SIZE: int = 10_000  # Kích thước chunk đầu tiên (để đo bytes/dòng)
+    ETL_CHUNK_MEMORY_MB: int = 64  # Ngân sách bộ nhớ cho một chunk
     ETL_DEFAULT_TIMESTAMP: str = "1900-01-01 00:00:00"
     ETL_CLEANUP_ON_FAILURE: bool = True
+    ETL_PARQUET_ROW_GROUP_SIZE: int = 250_000
+    ETL_PARQUET_MAX_ROWS_PER_FILE: int = 2_000_000
+    ETL_DAEMON_MAX_BACKOFF: int = 900
+    ETL_CHECKPOINT_INTERVAL: int = 10
+    ETL_REPORT_DIR: Path = Path("logs/etl_runs")
+    DUCKDB_SNAPSHOTS: bool = True  # API đọc snapshot do ETL công bố (snapshots.py)
+    DUCKDB_SNAPSHOT_RETAIN: int = 3  # Số snapshot gần nhất được giữ lại trên đĩa
+    PROFILE_MEMORY: bool = False  # Bật memory profiling (tracemalloc)
+    PROFILE_DIR: Path = Path("logs/profiles")
     TABLE_CONFIG_PATH: Path = Path("configs/tables.yaml")
     TIME_OFFSETS_PATH: Path = Path("configs/time_offsets.yaml")
 
-    # --- Thuộc tính được tính toán và tải động ---
-    db: Optional[DatabaseSettings] = None
-    TABLE_CONFIG: Dict[str, TableConfig] = Field(default_factory=dict)
-    TIME_OFFSETS: Dict[str, Dict[int, int]] = Field(default_factory=dict)
+    # --- Thuộc tính được tính toán và tải động (khi dùng lần đầu) ---
+    _db: Optional[DatabaseSettings] = PrivateAttr(default=None)
+    _table_config: Optional[Dict[str, TableConfig]] = PrivateAttr(default=None)
+    _time_offsets: Optional[Dict[str, Dict[int, List[TimeOffsetPeriod]]]] = (
+        PrivateAttr(default=None)
+    )
 
     @property
     def DUCKDB_PATH(self) -> Path:
@@ -179,29 +326,51 @@ class Settings(BaseSettings):
         """Đường dẫn đầy đủ đến tệp JSON lưu trạng thái ETL."""
         return self.DATA_DIR / "etl_state.json"
 
-    @model_validator(mode="after")
-    def _assemble_settings(self) -> "Settings":
-        """Tự động tạo các đối tượng cấu hình phụ sau khi load .env."""
-        # 1. Nhóm các biến kết nối DB vào một đối tượng `db`
-        if not self.db:
-            self.db = DatabaseSettings(
-                SQLSERVER_DRIVER=self.SQLSERVER_DRIVER,
-                SQLSERVER_SERVER=self.SQLSERVER_SERVER,
-                SQLSERVER_DATABASE=self.SQLSERVER_DATABASE,
-                SQLSERVER_UID=self.SQLSERVER_UID,
-                SQLSERVER_PWD=self.SQLSERVER_PWD,
-            )
+    @property
+    def db(self) -> DatabaseSettings:
+        """
+        Cấu hình kết nối SQL Server, được tạo khi dùng lần đầu.
 
-        # 2. Tải cấu hình bảng và time offsets từ file YAML
-        self._load_table_config()
-        self._load_time_offsets()
+        Raises:
+            ValueError: Nếu thiếu một trong các biến `SQLSERVER_*`.
+        """
+        if self._db is None:
+            try:
+                self._db = DatabaseSettings(
+                    SQLSERVER_DRIVER=self.SQLSERVER_DRIVER,
+                    SQLSERVER_SERVER=self.SQLSERVER_SERVER,
+                    SQLSERVER_DATABASE=self.SQLSERVER_DATABASE,
+                    SQLSERVER_UID=self.SQLSERVER_UID,
+                    SQLSERVER_PWD=self.SQLSERVER_PWD,
+                )
+            except ValidationError:
+                missing = [
+                    name
+                    for name in DatabaseSettings.model_fields
+                    if getattr(self, name) is None
+                ]
+                raise ValueError(
+                    f"Thiếu cấu hình kết nối SQL Server: {', '.join(missing)}."
+                ) from None
+        return self._db
 
-        return self
+    @property
+    def TABLE_CONFIG(self) -> Dict[str, TableConfig]:
+        """Cấu hình ETL của các bảng (`tables.yaml`), tải khi cần."""
+        if self._table_config is None:
+            self._table_config = self._load_table_config()
+        return self._table_config
 
-    def _load_table_config(self):
+    @property
+    def TIME_OFFSETS(self) -> Dict[str, Dict[int, List[TimeOffsetPeriod]]]:
+        """Chênh lệch thời gian của thiết bị (`time_offsets.yaml`), tải khi cần."""
+        if self._time_offsets is None:
+            self._time_offsets = self._load_time_offsets()
+        return self._time_offsets
+
+    def _load_table_config(self) -> Dict[str, TableConfig]:
         """Tải và xác thực cấu hình bảng từ tệp YAML."""
-        if self.TABLE_CONFIG:
-            return
+        import yaml
 
         try:
             with self.TABLE_CONFIG_PATH.open("r", encoding="utf-8") as f:
@@ -210,26 +379,25 @@ class Settings(BaseSettings):
                 raise ValueError(f"Tệp cấu hình '{self.TABLE_CONFIG_PATH}' rỗng.")
 
             adapter = TypeAdapter(Dict[str, TableConfig])
-            self.TABLE_CONFIG = adapter.validate_python(raw_config)
+            return adapter.validate_python(raw_config)
         except FileNotFoundError:
             raise ValueError(f"Không tìm thấy tệp cấu hình: {self.TABLE_CONFIG_PATH}")
         except (yaml.YAMLError, ValidationError) as e:
             raise ValueError(f"Lỗi cú pháp trong tệp '{self.TABLE_CONFIG_PATH}':\n{e}")
 
-    def _load_time_offsets(self):
+    def _load_time_offsets(self) -> Dict[str, Dict[int, List[TimeOffsetPeriod]]]:
         """Tải cấu hình chênh lệch thời gian từ tệp YAML."""
-        if self.TIME_OFFSETS:
-            return
+        import yaml
 
         try:
             with self.TIME_OFFSETS_PATH.open("r", encoding="utf-8") as f:
                 raw_offsets = yaml.safe_load(f)
             if not raw_offsets:
                 raise ValueError(f"Tệp cấu hình '{self.TIME_OFFSETS_PATH}' rỗng.")
-            self.TIME_OFFSETS = raw_offsets
+            return parse_time_offsets(raw_offsets)
         except FileNotFoundError:
             raise ValueError(f"Không tìm thấy tệp: {self.TIME_OFFSETS_PATH}")
-        except yaml.YAMLError as e:
+        except (yaml.YAMLError, ValidationError) as e:
             raise ValueError(f"Lỗi cú pháp trong tệp '{self.TIME_OFFSETS_PATH}':\n{e}")
 
 
@@ -0,0 +1,298 @@
+"""
+Module công bố (publish) và đọc snapshot của cơ sở dữ liệu DuckDB.
+
+DuckDB chỉ cho phép một tiến trình mở tệp ở chế độ ghi, và khi đó các tiến
+trình khác không mở được tệp ở chế độ chỉ đọc. Vì vậy ETL và API không dùng
+chung một tệp:
+- ETL ghi vào tệp làm việc `analytics.duckdb` như trước. Sau mỗi lần nạp
+  thành công, tệp được CHECKPOINT rồi sao chép thành một snapshot bất biến
+  `data/snapshots/analytics-<version>.duckdb`.
+- Tệp con trỏ `data/snapshots/CURRENT` (JSON gồm phiên bản và tên tệp) được
+  ghi đè nguyên tử bằng `os.replace`, nên người đọc luôn thấy hoặc snapshot
+  cũ hoặc snapshot mới, không bao giờ thấy tệp ghi dở.
+- API chỉ mở snapshot ở chế độ read-only, nên không bao giờ tranh khóa với
+  ETL (xem `app/dependencies.py`).
+
+Snapshot mới chỉ được tạo khi tệp làm việc đã thay đổi kể từ snapshot hiện
+tại (so sánh kích thước và thời điểm sửa đổi sau CHECKPOINT; DuckDB không
+ghi vào tệp nếu không có thay đổi). Tệp được sao chép bằng
+`os.copy_file_range`, nên trên hệ thống tệp hỗ trợ reflink (XFS, Btrfs) các
+khối dữ liệu được chia sẻ (copy-on-write) thay vì sao chép lại toàn bộ.
+
+Chỉ `DUCKDB_SNAPSHOT_RETAIN` snapshot mới nhất được giữ lại. Trên Linux, kết
+nối đang mở tới một snapshot đã bị xóa vẫn đọc được cho tới khi đóng.
+
+Snapshot có thể tham chiếu tới tệp bên ngoài (view `<bảng>_all` đọc Parquet
+của tầng lạnh). Các thư mục như vậy không được xóa ngay khi tệp làm việc
+không còn dùng chúng, mà được ghi vào danh sách chờ `data/snapshots/RETIRED`
+(`retire`) và chỉ bị xóa khi mọi snapshot còn giữ lại đều mới hơn thời điểm
+đó (xem `_delete_retired`).
+"""
+
+import json
+import logging
+import os
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Iterable, List, Optional, Set, Tuple
+
+from duckdb import DuckDBPyConnection
+
+from .config import settings
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT_DIR = settings.DATA_DIR / "snapshots"
+CURRENT_FILE = SNAPSHOT_DIR / "CURRENT"
+RETIRED_FILE = SNAPSHOT_DIR / "RETIRED"
+
+
+@dataclass(frozen=True)
+class Snapshot:
+    """Một snapshot đã được công bố."""
+
+    version: int
+    path: Path
+    published_at: str
+    # (kích thước, mtime_ns) của tệp làm việc tại thời điểm công bố.
+    source: Optional[Tuple[int, int]] = None
+
+
+# Con trỏ đã đọc gần nhất, theo (mtime, kích thước) của tệp CURRENT.
+_cache_lock = Lock()
+_cached: Tuple[Optional[Tuple[int, int]], Optional[Snapshot]] = (None, None)
+
+
+def current_snapshot() -> Optional[Snapshot]:
+    """
+    Snapshot hiện tại theo tệp con trỏ, None nếu chưa có snapshot nào.
+
+    Tệp con trỏ chỉ được đọc lại khi nó thay đổi, nên hàm này đủ rẻ để gọi
+    trước mỗi truy vấn.
+    """
+    global _cached
+    try:
+        stat = CURRENT_FILE.stat()
+    except FileNotFoundError:
+        return None
+    signature = (stat.st_mtime_ns, stat.st_size)
+    with _cache_lock:
+        if _cached[0] == signature:
+            return _cached[1]
+
+    try:
+        with CURRENT_FILE.open("r", encoding="utf-8") as f:
+            pointer = json.load(f)
+        source = pointer.get("source")
+        snapshot = Snapshot(
+            version=int(pointer["version"]),
+            path=SNAPSHOT_DIR / pointer["file"],
+            published_at=pointer.get("published_at", ""),
+            source=tuple(source) if source else None,
+        )
+    except (OSError, ValueError, KeyError) as e:
+        logger.error(f"Không đọc được con trỏ snapshot '{CURRENT_FILE}': {e}")
+        return None
+    with _cache_lock:
+        _cached = (signature, snapshot)
+    return snapshot
+
+
+def _write_json(path: Path, data):
+    """Ghi tệp JSON mới rồi thay thế tệp cũ bằng một lệnh đổi tên."""
+    temp_file = path.with_suffix(".tmp")
+    with temp_file.open("w", encoding="utf-8") as f:
+        json.dump(data, f)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_file, path)
+
+
+def _write_pointer(snapshot: Snapshot):
+    """Ghi tệp con trỏ mới rồi thay thế tệp cũ bằng một lệnh đổi tên."""
+    _write_json(
+        CURRENT_FILE,
+        {
+            "version": snapshot.version,
+            "file": snapshot.path.name,
+            "published_at": snapshot.published_at,
+            "source": snapshot.source,
+        },
+    )
+
+
+# --- Các đường dẫn chờ xóa ---
+
+
+def _load_retired() -> List[dict]:
+    """Danh sách chờ xóa: mỗi phần tử gồm `path` và `after_version`."""
+    try:
+        with RETIRED_FILE.open("r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return []
+    except (OSError, ValueError) as e:
+        logger.error(f"Không đọc được danh sách chờ xóa '{RETIRED_FILE}': {e}")
+        return []
+
+
+def _save_retired(entries: List[dict]):
+    """Ghi lại danh sách chờ xóa (xóa tệp nếu danh sách rỗng)."""
+    if not entries:
+        RETIRED_FILE.unlink(missing_ok=True)
+        return
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    _write_json(RETIRED_FILE, entries)
+
+
+def retire(paths: Iterable[Path]):
+    """
+    Xóa các thư mục mà snapshot đã công bố có thể còn tham chiếu tới.
+
+    Mỗi đường dẫn được ghi cùng phiên bản snapshot hiện tại (phiên bản mới
+    nhất có thể tham chiếu tới nó) và bị xóa bởi `_prune` khi không còn
+    snapshot nào cũ như vậy. Nếu `DUCKDB_SNAPSHOTS` tắt, xóa ngay.
+
+    Args:
+        paths: Các thư mục không còn được tệp làm việc sử dụng.
+    """
+    paths = [Path(p).resolve() for p in paths]
+    if not paths:
+        return
+    if not settings.DUCKDB_SNAPSHOTS:
+        for path in paths:
+            shutil.rmtree(path, ignore_errors=True)
+        return
+
+    current = current_snapshot()
+    after_version = current.version if current else 0
+    names = {str(path) for path in paths}
+    entries = [e for e in _load_retired() if e["path"] not in names]
+    entries += [{"path": name, "after_version": after_version} for name in names]
+    _save_retired(entries)
+
+
+def unretire(path: Path):
+    """Bỏ một đường dẫn khỏi danh sách chờ xóa (vì nó lại được sử dụng)."""
+    name = str(Path(path).resolve())
+    entries = _load_retired()
+    remaining = [e for e in entries if e["path"] != name]
+    if len(remaining) != len(entries):
+        _save_retired(remaining)
+
+
+def retired_paths() -> Set[Path]:
+    """Các đường dẫn đang chờ xóa (không còn được tệp làm việc sử dụng)."""
+    return {Path(e["path"]) for e in _load_retired()}
+
+
+def _delete_retired(oldest_version: int):
+    """Xóa các đường dẫn không snapshot nào từ `oldest_version` trở đi sử dụng."""
+    entries = _load_retired()
+    remaining = []
+    for entry in entries:
+        if entry["after_version"] < oldest_version:
+            shutil.rmtree(entry["path"], ignore_errors=True)
+            logger.info(f"Đã xóa '{entry['path']}' (không còn snapshot nào sử dụng).")
+        else:
+            remaining.append(entry)
+    if len(remaining) != len(entries):
+        _save_retired(remaining)
+
+
+def _file_signature(path: Path) -> Tuple[int, int]:
+    """(kích thước, mtime_ns) của một tệp, dùng để nhận biết tệp đã thay đổi."""
+    stat = path.stat()
+    return stat.st_size, stat.st_mtime_ns
+
+
+def _copy_file(source: Path, target: Path):
+    """
+    Sao chép tệp bằng `os.copy_file_range`, quay về `shutil.copyfile` nếu
+    hệ điều hành hoặc hệ thống tệp không hỗ trợ.
+
+    Trên hệ thống tệp hỗ trợ reflink, nhân Linux chỉ chia sẻ các khối dữ liệu
+    nên chi phí gần như không phụ thuộc kích thước tệp.
+    """
+    try:
+        with source.open("rb") as src, target.open("wb") as dst:
+            remaining = os.fstat(src.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(src.fileno(), dst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except (AttributeError, OSError):
+        shutil.copyfile(source, target)
+
+
+def _prune(keep: int):
+    """Xóa các snapshot cũ, chỉ giữ lại `keep` phiên bản mới nhất."""
+    prefix = f"{settings.DUCKDB_PATH.stem}-"
+    versions = []
+    for path in SNAPSHOT_DIR.glob(f"{prefix}*.duckdb"):
+        suffix = path.stem[len(prefix) :]
+        if suffix.isdigit():
+            versions.append((int(suffix), path))
+    versions.sort()
+    for _, path in versions[:-keep]:
+        path.unlink(missing_ok=True)
+        logger.debug(f"Đã xóa snapshot cũ '{path.name}'.")
+    if versions:
+        _delete_retired(versions[-keep:][0][0])
+
+
+def publish(conn: DuckDBPyConnection) -> Optional[Snapshot]:
+    """
+    Công bố trạng thái hiện tại của tệp làm việc thành một snapshot mới.
+
+    Phải được gọi trên luồng đang giữ kết nối ghi (ví dụ qua
+    `DuckDBWriter.execute`) để không có thao tác ghi nào xen vào giữa
+    CHECKPOINT và lúc sao chép tệp. Nếu tệp làm việc không thay đổi kể từ
+    snapshot hiện tại, không có snapshot mới nào được tạo.
+
+    Args:
+        conn: Kết nối ghi tới `analytics.duckdb`.
+
+    Returns:
+        Snapshot vừa công bố (hoặc snapshot hiện tại nếu không có thay đổi),
+        hoặc None nếu `DUCKDB_SNAPSHOTS` tắt.
+    """
+    if not settings.DUCKDB_SNAPSHOTS:
+        return None
+
+    # Ghi mọi thay đổi từ WAL vào tệp chính để bản sao là một tệp hoàn chỉnh.
+    conn.execute("CHECKPOINT;")
+
+    source = _file_signature(settings.DUCKDB_PATH)
+    current = current_snapshot()
+    if current is not None and current.source == source and current.path.exists():
+        logger.info(
+            f"Không có thay đổi kể từ snapshot phiên bản {current.version}, "
+            f"bỏ qua việc công bố."
+        )
+        return current
+
+    SNAPSHOT_DIR.mkdir(parents=True, exist_ok=True)
+    version = current.version + 1 if current else 1
+    target = SNAPSHOT_DIR / f"{settings.DUCKDB_PATH.stem}-{version}.duckdb"
+    temp_file = target.with_suffix(".inprogress")
+
+    _copy_file(settings.DUCKDB_PATH, temp_file)
+    with temp_file.open("rb") as f:
+        os.fsync(f.fileno())
+    os.replace(temp_file, target)
+
+    snapshot = Snapshot(
+        version=version,
+        path=target,
+        published_at=datetime.now().isoformat(timespec="seconds"),
+        source=source,
+    )
+    _write_pointer(snapshot)
+    _prune(max(1, settings.DUCKDB_SNAPSHOT_RETAIN))
+    logger.info(f"📸 Đã công bố snapshot DuckDB phiên bản {version} ('{target.name}').")
+    return snapshot
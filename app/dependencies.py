@@ -4,37 +4,166 @@ Module định nghĩa các dependency cho API, giúp tái sử dụng logic.
 Dependency Injection là một tính năng cốt lõi của FastAPI, cho phép tách biệt
 và tái sử dụng các thành phần như kết nối database, xác thực người dùng.
 Điều này giúp mã nguồn trở nên module hóa, dễ kiểm thử và bảo trì hơn.
+
+Truy vấn đọc snapshot DuckDB mới nhất do ETL công bố (`app/core/snapshots.py`)
+thay vì tệp đang được ETL ghi, nên không bao giờ bị chặn bởi khóa ghi. Các
+cursor tới snapshot được giữ trong một pool và dùng lại giữa các truy vấn,
+nhờ đó các prepared statement đã tạo trên chúng (`app/queries.py`) cũng được
+dùng lại.
 """
 
 import logging
 from contextlib import contextmanager
-from typing import Iterator
+from dataclasses import dataclass, field
+from pathlib import Path
+from threading import Lock
+from typing import Iterator, List, Optional, Set, Tuple
 
 import duckdb
 import pandas as pd
+import pyarrow as pa
 from duckdb import DuckDBPyConnection
 from duckdb import Error as DuckDBError
 
+from .core import snapshots
 from .core.config import settings
 
 logger = logging.getLogger(__name__)
 
+# Số cursor rảnh tối đa được giữ lại cho mỗi snapshot.
+_MAX_IDLE_CURSORS = 16
+
+
+@dataclass
+class PooledConnection:
+    """Một cursor DuckDB cùng tên các prepared statement đã tạo trên nó."""
+
+    conn: DuckDBPyConnection
+    prepared: Set[str] = field(default_factory=set)
+
+
+@dataclass
+class _OpenSnapshot:
+    """Kết nối read-only tới một snapshot, số truy vấn đang dùng và cursor rảnh."""
+
+    path: Path
+    conn: DuckDBPyConnection
+    users: int = 0
+    retired: bool = False
+    idle: List[PooledConnection] = field(default_factory=list)
+
+
+class SnapshotConnections:
+    """
+    Giữ một kết nối read-only tới snapshot hiện tại, dùng chung giữa các request.
+
+    Mỗi truy vấn dùng một cursor riêng của kết nối này (an toàn giữa các
+    luồng); cursor được trả về pool sau truy vấn để dùng lại. Trước mỗi truy
+    vấn, con trỏ snapshot được kiểm tra: nếu ETL đã công bố phiên bản mới,
+    các truy vấn sau dùng kết nối tới snapshot mới, còn kết nối cũ (cùng các
+    cursor của nó) bị "nghỉ hưu" và được đóng khi truy vấn cuối cùng của nó
+    kết thúc.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._current: Optional[_OpenSnapshot] = None
+
+    def _acquire(self, path: Path) -> Tuple[_OpenSnapshot, PooledConnection]:
+        """Lấy kết nối tới snapshot `path` (mở mới nếu đã đổi) và một cursor."""
+        with self._lock:
+            current = self._current
+            if current is None or current.path != path:
+                logger.info(f"Chuyển truy vấn sang snapshot DuckDB '{path.name}'.")
+                conn = duckdb.connect(database=str(path.resolve()), read_only=True)
+                if current is not None:
+                    self._retire(current)
+                current = self._current = _OpenSnapshot(path, conn)
+            current.users += 1
+            pooled = current.idle.pop() if current.idle else None
+        if pooled is None:
+            pooled = PooledConnection(current.conn.cursor())
+        return current, pooled
+
+    def _retire(self, entry: _OpenSnapshot):
+        """Đánh dấu kết nối cũ và đóng ngay nếu không còn truy vấn nào dùng nó."""
+        entry.retired = True
+        for pooled in entry.idle:
+            pooled.conn.close()
+        entry.idle.clear()
+        if entry.users == 0:
+            entry.conn.close()
+            logger.debug(f"Đã đóng kết nối tới snapshot cũ '{entry.path.name}'.")
+
+    def _release(self, entry: _OpenSnapshot, pooled: PooledConnection, reuse: bool):
+        """Trả cursor về pool (hoặc đóng nó) và trả kết nối sau một truy vấn."""
+        with self._lock:
+            entry.users -= 1
+            if reuse and not entry.retired and len(entry.idle) < _MAX_IDLE_CURSORS:
+                entry.idle.append(pooled)
+                return
+            pooled.conn.close()
+            if entry.retired and entry.users == 0:
+                entry.conn.close()
+                logger.debug(f"Đã đóng kết nối tới snapshot cũ '{entry.path.name}'.")
+
+    @contextmanager
+    def cursor(self, path: Path) -> Iterator[PooledConnection]:
+        """
+        Cursor riêng cho một truy vấn trên snapshot `path`, lấy từ pool.
+
+        Cursor gặp lỗi trong truy vấn được đóng thay vì trả về pool.
+        """
+        entry, pooled = self._acquire(path)
+        reuse = False
+        try:
+            yield pooled
+            reuse = True
+        finally:
+            self._release(entry, pooled, reuse)
+
+    def close(self):
+        """Đóng kết nối hiện tại (khi tắt server)."""
+        with self._lock:
+            if self._current is not None:
+                self._retire(self._current)
+                self._current = None
+
+
+snapshot_connections = SnapshotConnections()
+
 
 @contextmanager
-def get_db_connection() -> Iterator[DuckDBPyConnection]:
+def get_pooled_connection() -> Iterator[PooledConnection]:
     """
     Context manager để quản lý vòng đời kết nối đến DuckDB.
 
-    Hàm này tạo ra một kết nối khi vào khối `with` và đảm bảo nó được đóng lại
-    an toàn khi kết thúc, kể cả khi có lỗi xảy ra. Kết nối được mở ở chế độ
-    chỉ đọc (read-only) để đảm bảo an toàn cho dữ liệu trong môi trường API.
+    Nếu ETL đã công bố snapshot, trả về một cursor trên snapshot mới nhất
+    (cursor được lấy từ pool và dùng lại giữa các request). Nếu chưa có
+    snapshot nào (hoặc `DUCKDB_SNAPSHOTS` tắt), hàm tạo ra một kết nối tới tệp
+    `analytics.duckdb` khi vào khối `with` và đảm bảo nó được đóng lại an toàn
+    khi kết thúc, kể cả khi có lỗi xảy ra. Kết nối luôn ở chế độ chỉ đọc
+    (read-only) để đảm bảo an toàn cho dữ liệu trong môi trường API.
 
     Yields:
-        Một đối tượng kết nối DuckDB (DuckDBPyConnection) đang hoạt động.
+        `PooledConnection` chứa kết nối DuckDB đang hoạt động.
 
     Raises:
         DuckDBError: Nếu không thể kết nối tới tệp database.
     """
+    snapshot = snapshots.current_snapshot() if settings.DUCKDB_SNAPSHOTS else None
+    if snapshot is not None:
+        try:
+            with snapshot_connections.cursor(snapshot.path) as pooled:
+                yield pooled
+            return
+        except DuckDBError as e:
+            logger.critical(
+                f"Không thể truy vấn snapshot DuckDB '{snapshot.path}': {e}",
+                exc_info=True,
+            )
+            raise
+
     conn = None
     try:
         db_path = str(settings.DUCKDB_PATH.resolve())
@@ -42,7 +171,7 @@ def get_db_connection() -> Iterator[DuckDBPyConnection]:
 
         # Kết nối ở chế độ READ_ONLY để đảm bảo an toàn, API chỉ có quyền đọc.
         conn = duckdb.connect(database=db_path, read_only=True)
-        yield conn
+        yield PooledConnection(conn)
 
     except DuckDBError as e:
         logger.critical(f"Không thể kết nối tới DuckDB: {e}", exc_info=True)
@@ -55,6 +184,52 @@ def get_db_connection() -> Iterator[DuckDBPyConnection]:
             logger.debug("Kết nối DuckDB đã được đóng.")
 
 
+@contextmanager
+def get_db_connection() -> Iterator[DuckDBPyConnection]:
+    """
+    Kết nối DuckDB (read-only) cho một truy vấn, xem `get_pooled_connection`.
+
+    Yields:
+        Một đối tượng kết nối DuckDB (DuckDBPyConnection) đang hoạt động.
+    """
+    with get_pooled_connection() as pooled:
+        yield pooled.conn
+
+
+def check_database() -> bool:
+    """Kiểm tra API có truy vấn được DuckDB hay không (dùng cho readiness)."""
+    try:
+        with get_db_connection() as conn:
+            conn.execute("SELECT 1").fetchall()
+        return True
+    except Exception:
+        return False
+
+
+# Chuỗi trong kết quả được giữ trong bộ đệm Arrow thay vì đối tượng Python.
+_ARROW_STRING_TYPES = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+
+def arrow_to_df(table: pa.Table) -> pd.DataFrame:
+    """
+    Chuyển kết quả truy vấn (Arrow) thành DataFrame với kiểu dữ liệu gọn.
+
+    Số nguyên giữ đúng độ rộng của cột trong DuckDB (`INTEGER` -> `int32`),
+    chuỗi dùng `string[pyarrow]`. Cột `DECIMAL`/`HUGEINT` (ví dụ kết quả của
+    `SUM`) được chuyển thành `float64` như `DuckDBPyConnection.df()`.
+    """
+    schema = pa.schema(
+        [
+            field.with_type(pa.float64()) if pa.types.is_decimal(field.type) else field
+            for field in table.schema
+        ]
+    )
+    return table.cast(schema).to_pandas(types_mapper=_ARROW_STRING_TYPES.get)
+
+
 def query_db_to_df(query: str, params: list = None) -> pd.DataFrame:
     """
     Hàm tiện ích để thực thi SQL và trả về kết quả dưới dạng DataFrame.
@@ -67,14 +242,12 @@ def query_db_to_df(query: str, params: list = None) -> pd.DataFrame:
         params: Danh sách các tham số cho câu lệnh SQL để chống SQL injection.
 
     Returns:
-        Một Pandas DataFrame chứa kết quả. Trả về DataFrame rỗng nếu có lỗi.
+        Một Pandas DataFrame chứa kết quả.
+
+    Raises:
+        duckdb.Error: Nếu truy vấn thất bại. Lỗi không bị đổi thành DataFrame
+            rỗng, vì kết quả rỗng sẽ bị `async_cache` lưu lại như dữ liệu thật.
     """
-    try:
-        # Sử dụng context manager để đảm bảo kết nối được quản lý an toàn.
-        with get_db_connection() as conn:
-            return conn.execute(query, parameters=params).df()
-    except Exception:
-        # Lỗi đã được log trong `get_db_connection`. Ở đây, chúng ta chỉ cần
-        # trả về một DataFrame rỗng để business logic có thể xử lý trường hợp
-        # không có dữ liệu mà không làm sập ứng dụng.
-        return pd.DataFrame()
+    # Sử dụng context manager để đảm bảo kết nối được quản lý an toàn.
+    with get_db_connection() as conn:
+        return arrow_to_df(conn.execute(query, parameters=params).arrow())
@@ -0,0 +1,125 @@
+"""
+Module chạy ETL liên tục theo từng lô nhỏ (micro-batch).
+
+Khác với `run-etl` (chạy một lần rồi thoát), daemon giữ các kết nối luôn mở
+và định kỳ kiểm tra dữ liệu mới của từng bảng incremental theo chu kỳ riêng
+(`poll_interval` trong `tables.yaml`). Khi một bảng gặp lỗi, lần thử tiếp
+theo được lùi lại theo cấp số nhân có yếu tố ngẫu nhiên (jittered backoff) để
+không dồn tải lên nguồn đang gặp sự cố. Daemon dừng an toàn khi nhận tín hiệu
+SIGINT/SIGTERM: lô đang chạy được hoàn tất trước khi thoát.
+"""
+
+import heapq
+import logging
+import random
+import time
+from threading import Event
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ..core.config import TableConfig, settings
+
+logger = logging.getLogger(__name__)
+
+
+def backoff_delay(interval: float, failures: int, max_delay: float) -> float:
+    """
+    Tính thời gian chờ trước lần thử lại thứ `failures`.
+
+    Thời gian chờ tăng gấp đôi sau mỗi lần lỗi (tối đa `max_delay`) và được
+    chọn ngẫu nhiên trong khoảng [interval, giới hạn] để các bảng không thử
+    lại cùng một lúc.
+    """
+    ceiling = min(max_delay, interval * (2**failures))
+    return random.uniform(min(interval, ceiling), ceiling)
+
+
+class EtlDaemon:
+    """
+    Vòng lặp điều phối các lô nhỏ cho những bảng incremental.
+
+    Args:
+        table_configs: Cấu hình các bảng, theo khóa trong `tables.yaml`. Chỉ
+            các bảng incremental được xử lý.
+        task: Hàm xử lý một lô của một bảng, trả về số dòng đã nạp.
+        on_new_data: Được gọi (một lần cho mỗi vòng) khi có bảng nạp được dữ
+            liệu mới, với danh sách các bảng đó.
+    """
+
+    def __init__(
+        self,
+        table_configs: Dict[str, TableConfig],
+        task: Callable[[TableConfig], int],
+        on_new_data: Optional[Callable[[List[str]], None]] = None,
+    ):
+        self.configs = {
+            config.dest_table: config
+            for config in table_configs.values()
+            if config.incremental
+        }
+        self.task = task
+        self.on_new_data = on_new_data
+        self.stop_event = Event()
+        self.failures: Dict[str, int] = {}
+
+    def stop(self, *_):
+        """Yêu cầu daemon dừng sau lô hiện tại (dùng làm signal handler)."""
+        if not self.stop_event.is_set():
+            logger.info("Đã nhận yêu cầu dừng, đang hoàn tất lô hiện tại...")
+        self.stop_event.set()
+
+    def _run_once(self, name: str) -> Tuple[int, float]:
+        """Xử lý một lô của bảng, trả về (số dòng đã nạp, thời gian chờ tới lô kế)."""
+        config = self.configs[name]
+        try:
+            rows = self.task(config)
+        except Exception as e:
+            failures = self.failures.get(name, 0) + 1
+            self.failures[name] = failures
+            delay = backoff_delay(
+                config.poll_interval, failures, settings.ETL_DAEMON_MAX_BACKOFF
+            )
+            logger.error(
+                f"❌ Lô của '{name}' thất bại (lần {failures}): {e}. "
+                f"Thử lại sau {delay:.0f}s."
+            )
+            return 0, delay
+
+        self.failures.pop(name, None)
+        return rows, config.poll_interval
+
+    def run(self):
+        """Chạy vòng lặp cho tới khi `stop()` được gọi."""
+        if not self.configs:
+            logger.warning("Không có bảng incremental nào để chạy ở chế độ daemon.")
+            return
+
+        now = time.monotonic()
+        schedule = [(now, name) for name in sorted(self.configs)]
+        heapq.heapify(schedule)
+        logger.info(
+            "Daemon theo dõi: "
+            + ", ".join(
+                f"{name} (mỗi {self.configs[name].poll_interval}s)"
+                for name in sorted(self.configs)
+            )
+        )
+
+        while not self.stop_event.is_set():
+            due_at, _ = schedule[0]
+            if self.stop_event.wait(max(0.0, due_at - time.monotonic())):
+                break
+
+            # Xử lý tất cả các bảng đã đến hạn trong vòng này.
+            loaded: List[str] = []
+            now = time.monotonic()
+            while schedule and schedule[0][0] <= now and not self.stop_event.is_set():
+                _, name = heapq.heappop(schedule)
+                rows, delay = self._run_once(name)
+                if rows > 0:
+                    loaded.append(name)
+                heapq.heappush(schedule, (time.monotonic() + delay, name))
+
+            if loaded and self.on_new_data:
+                self.on_new_data(loaded)
+
+        logger.info("Daemon ETL đã dừng.")
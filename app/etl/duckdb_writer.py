@@ -0,0 +1,85 @@
+"""
+Module tuần tự hóa các thao tác ghi vào DuckDB khi ETL chạy đa luồng.
+
+Một kết nối DuckDB không an toàn khi nhiều luồng cùng dùng: các khối
+`BEGIN TRANSACTION ... COMMIT` của những bảng khác nhau có thể đan xen nhau.
+`DuckDBWriter` giữ kết nối ghi trong một luồng riêng và thực hiện lần lượt
+các thao tác (nạp staging, atomic swap, ANALYZE) theo thứ tự được gửi vào
+hàng đợi. Các luồng worker vẫn trích xuất và biến đổi song song và không đọc
+DuckDB: watermark và các partition đang chờ nạp được lấy từ tệp trạng thái,
+còn những truy vấn đọc cần cho việc nạp (partition hiện có, số dòng) chạy bên
+trong chính thao tác ghi, trên luồng ghi.
+"""
+
+import logging
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, Callable
+
+from duckdb import DuckDBPyConnection
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class DuckDBWriter:
+    """
+    Luồng ghi duy nhất cho một kết nối DuckDB.
+
+    Sử dụng như context manager: luồng ghi được khởi động khi vào khối
+    `with` và dừng (sau khi hoàn tất các thao tác còn trong hàng đợi) khi
+    thoát khối.
+    """
+
+    def __init__(self, conn: DuckDBPyConnection):
+        self._conn = conn
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="duckdb-writer", daemon=True
+        )
+
+    def __enter__(self):
+        self._thread.start()
+        logger.debug("Luồng ghi DuckDB đã khởi động.")
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self._queue.put(_STOP)
+        self._thread.join()
+        logger.debug("Luồng ghi DuckDB đã dừng.")
+
+    def _run(self):
+        """Vòng lặp của luồng ghi: lấy từng thao tác ra khỏi hàng đợi và thực hiện."""
+        while True:
+            item = self._queue.get()
+            if item is _STOP:
+                break
+            future, func, args, kwargs = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(func(self._conn, *args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+    def submit(self, func: Callable[..., Any], *args, **kwargs) -> Future:
+        """
+        Gửi một thao tác ghi vào hàng đợi.
+
+        Args:
+            func: Hàm nhận kết nối DuckDB làm tham số đầu tiên, ví dụ
+                `load.refresh_duckdb_table`.
+            *args, **kwargs: Các tham số còn lại của `func`.
+
+        Returns:
+            Future chứa kết quả (hoặc exception) của thao tác.
+        """
+        future: Future = Future()
+        self._queue.put((future, func, args, kwargs))
+        return future
+
+    def execute(self, func: Callable[..., Any], *args, **kwargs) -> Any:
+        """Gửi một thao tác ghi và chờ nó hoàn tất."""
+        return self.submit(func, *args, **kwargs).result()
@@ -4,7 +4,8 @@ Module xử lý giai đoạn 'E' (Extract) của pipeline ETL.
 Chức năng chính là kết nối tới nguồn dữ liệu (MS SQL Server) và trích xuất
 dữ liệu theo từng khối (chunk). Việc xử lý theo chunk giúp tối ưu hóa việc
 sử dụng bộ nhớ, cho phép pipeline xử lý các tập dữ liệu lớn hơn nhiều
-so với dung lượng RAM.
+so với dung lượng RAM. Kích thước chunk được tính riêng cho từng bảng theo
+ngân sách bộ nhớ (`ChunkSizer`), nên bảng có dòng "rộng" dùng chunk nhỏ hơn.
 """
 
 import logging
@@ -12,26 +13,306 @@ import pandas as pd
 from sqlalchemy import text
 from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
-from typing import Iterator
+from typing import Any, Dict, Iterator, List, Optional
 
+from .state import Watermark
 from ..core.config import settings, TableConfig
 
 logger = logging.getLogger(__name__)
 
 
+class ChunkSizer:
+    """
+    Tính số dòng của chunk tiếp theo sao cho vừa ngân sách bộ nhớ của bảng.
+
+    Chunk đầu tiên có `ETL_CHUNK_PROBE_SIZE` dòng; số byte trung bình mỗi dòng
+    được đo trên chunk đó và cập nhật dần (trung bình trượt hàm mũ) qua các
+    chunk sau. Kích thước luôn nằm trong [`ETL_CHUNK_MIN_SIZE`,
+    `ETL_CHUNK_SIZE`]. Nếu bảng khai báo `chunk_size` trong `tables.yaml`, giá
+    trị đó được dùng cố định.
+    """
+
+    _SMOOTHING = 0.3
+    _SAMPLE_ROWS = 1_000
+
+    def __init__(self, config: TableConfig):
+        self.fixed_size = config.chunk_size
+        budget_mb = config.chunk_memory_mb or settings.ETL_CHUNK_MEMORY_MB
+        self.budget_bytes = budget_mb * 1024 * 1024
+        self.bytes_per_row: Optional[float] = None
+
+    @property
+    def size(self) -> int:
+        """Số dòng của chunk tiếp theo."""
+        if self.fixed_size:
+            return self.fixed_size
+        if self.bytes_per_row is None:
+            return min(settings.ETL_CHUNK_PROBE_SIZE, settings.ETL_CHUNK_SIZE)
+        rows = int(self.budget_bytes / max(self.bytes_per_row, 1.0))
+        return max(settings.ETL_CHUNK_MIN_SIZE, min(rows, settings.ETL_CHUNK_SIZE))
+
+    def observe(self, chunk: pd.DataFrame):
+        """Cập nhật số byte mỗi dòng từ một chunk vừa trích xuất."""
+        if self.fixed_size or chunk.empty:
+            return
+        # Đo trên một mẫu dòng cách đều: `memory_usage(deep=True)` phải duyệt
+        # từng chuỗi nên đo cả chunk sẽ tốn thời gian.
+        step = max(1, len(chunk) // self._SAMPLE_ROWS)
+        sample = chunk.iloc[::step]
+        measured = sample.memory_usage(deep=True, index=False).sum() / len(sample)
+        if self.bytes_per_row is None:
+            self.bytes_per_row = measured
+        else:
+            self.bytes_per_row += self._SMOOTHING * (measured - self.bytes_per_row)
+
+
+def apply_dtypes(chunk: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
+    """
+    Ép các cột của một chunk thô về kiểu gọn khai báo trong `dtypes` của bảng.
+
+    Ví dụ `Int32` thay cho `int64`/`float64`, `string[pyarrow]` thay cho chuỗi
+    Python (`object`), giúp mỗi chunk chiếm ít bộ nhớ hơn ngay từ bước
+    Extract. Cột có giá trị không ép được kiểu được giữ nguyên để bước xác
+    thực tách riêng các dòng lỗi.
+    """
+    for col, dtype in config.dtypes.items():
+        if col not in chunk.columns:
+            continue
+        try:
+            chunk[col] = chunk[col].astype(dtype)
+        except (TypeError, ValueError) as e:
+            logger.warning(
+                f"Không thể ép cột '{config.source_table}.{col}' về kiểu "
+                f"'{dtype}', giữ nguyên kiểu gốc: {e}"
+            )
+    return chunk
+
+
+def _iter_result(
+    sql_engine: Engine, config: TableConfig, query: str, params: Dict[str, Any]
+) -> Iterator[pd.DataFrame]:
+    """
+    Thực thi truy vấn và đọc kết quả bằng `fetchmany` theo từng chunk.
+
+    Tương đương `pd.read_sql(..., chunksize=...)` nhưng số dòng mỗi lần đọc
+    được `ChunkSizer` tính lại sau mỗi chunk.
+    """
+    sizer = ChunkSizer(config)
+    try:
+        with sql_engine.connect() as conn:
+            result = conn.execution_options(stream_results=True).execute(
+                text(query), params
+            )
+            columns = list(result.keys())
+            while True:
+                rows = result.fetchmany(sizer.size)
+                if not rows:
+                    return
+                chunk = pd.DataFrame.from_records(
+                    rows, columns=columns, coerce_float=True
+                )
+                chunk = apply_dtypes(chunk, config)
+                sizer.observe(chunk)
+                yield chunk
+    except SQLAlchemyError as e:
+        logger.error(
+            f"Lỗi SQL khi trích xuất từ bảng '{config.source_table}': {e}"
+        )
+        # Ném lại lỗi để cơ chế retry của `cli.py` có thể bắt và xử lý.
+        raise
+
+
+def source_columns(config: TableConfig) -> List[str]:
+    """Danh sách cột cần trích xuất (theo `rename_map`), rỗng nghĩa là mọi cột."""
+    columns = list(config.rename_map.keys())
+
+    # Nếu là incremental, đảm bảo cột timestamp và khóa phụ có trong danh sách.
+    for col in (config.timestamp_col, config.key_col):
+        if col and col not in columns:
+            columns.append(col)
+
+    if not columns:
+        logger.warning(
+            f"Bảng '{config.source_table}': Không có cột nào trong 'rename_map'. "
+            f"Sử dụng 'SELECT *' làm mặc định."
+        )
+    return columns
+
+
+def _columns_selection(config: TableConfig) -> str:
+    """Danh sách cột cần trích xuất, dạng chuỗi T-SQL."""
+    columns = source_columns(config)
+    if not columns:
+        return "*"
+    # Xây dựng chuỗi các cột được chọn, bọc trong `[]` để tương thích T-SQL.
+    return ", ".join(f"[{col}]" for col in columns)
+
+
+def start_watermark(config: TableConfig, watermark: Watermark) -> Watermark:
+    """
+    Điểm bắt đầu trích xuất incremental của một bảng.
+
+    Nếu bảng có `lookback`, điểm bắt đầu được lùi lại một khoảng đó để lấy lại
+    các dòng đến muộn hoặc bị sửa ở nguồn. Các dòng không thay đổi được bỏ đi
+    khi ghi staging (`ParquetLoader`), bản ghi trùng được khử theo
+    `primary_key`.
+    """
+    if config.lookback and watermark.timestamp != settings.ETL_DEFAULT_TIMESTAMP:
+        start = pd.Timestamp(watermark.timestamp) - config.lookback
+        logger.info(
+            f"Lùi high-water-mark của '{config.source_table}' "
+            f"{config.lookback} để lấy lại dữ liệu đến muộn."
+        )
+        return Watermark(start.isoformat(sep=" "))
+    return watermark
+
+
+def _page_query(
+    sql_engine: Engine, config: TableConfig, columns_selection: str, has_key: bool
+) -> str:
+    """
+    Xây dựng câu lệnh lấy một trang dữ liệu sau high-water mark.
+
+    Trang được sắp xếp theo (timestamp_col, key_col). Trên SQL Server dùng
+    `TOP (n) WITH TIES` để trang luôn chứa trọn nhóm dòng trùng khóa ở cuối
+    trang; với các hệ quản trị khác, `LIMIT` được dùng và nhóm cuối trang được
+    bổ sung bằng `_complete_last_group`.
+    """
+    ts_col, key_col = config.timestamp_col, config.key_col
+    order_by = f"[{ts_col}]" + (f", [{key_col}]" if key_col else "")
+
+    condition = f"[{ts_col}] > :last_ts"
+    if key_col and has_key:
+        condition = (
+            f"({condition} OR ([{ts_col}] = :last_ts AND [{key_col}] > :last_key))"
+        )
+
+    if sql_engine.dialect.name == "mssql":
+        return (
+            f"SELECT TOP (:page_size) WITH TIES {columns_selection} "
+            f"FROM {config.source_table} WHERE {condition} ORDER BY {order_by}"
+        )
+    return (
+        f"SELECT {columns_selection} FROM {config.source_table} "
+        f"WHERE {condition} ORDER BY {order_by} LIMIT :page_size"
+    )
+
+
+def _complete_last_group(
+    sql_engine: Engine,
+    config: TableConfig,
+    columns_selection: str,
+    page: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Đảm bảo trang chứa trọn nhóm dòng có cùng khóa với dòng cuối trang.
+
+    Dùng cho các hệ quản trị không hỗ trợ `WITH TIES`: các dòng cuối trang có
+    cùng (timestamp_col, key_col) được bỏ đi và lấy lại đầy đủ bằng một truy
+    vấn so sánh bằng.
+    """
+    group_cols = [c for c in (config.timestamp_col, config.key_col) if c]
+    last = page.iloc[-1]
+    in_last_group = (page[group_cols] == last[group_cols]).all(axis=1)
+
+    condition = " AND ".join(f"[{col}] = :{col}" for col in group_cols)
+    query = f"SELECT {columns_selection} FROM {config.source_table} WHERE {condition}"
+    params = {col: _to_python(last[col]) for col in group_cols}
+    with sql_engine.connect() as conn:
+        group = pd.read_sql(sql=text(query), con=conn, params=params)
+    return pd.concat([page[~in_last_group], group], ignore_index=True)
+
+
+def _to_python(value: Any) -> Any:
+    """Chuyển giá trị numpy/pandas sang kiểu Python để bind vào câu lệnh SQL."""
+    if pd.isna(value):
+        return None
+    if isinstance(value, pd.Timestamp):
+        return value.to_pydatetime()
+    return value.item() if hasattr(value, "item") else value
+
+
+def _iter_pages(
+    sql_engine: Engine,
+    config: TableConfig,
+    columns_selection: str,
+    watermark: Watermark,
+) -> Iterator[pd.DataFrame]:
+    """
+    Trích xuất dữ liệu mới theo từng trang bằng keyset pagination.
+
+    Mỗi trang là một truy vấn ngắn, dùng index trên (timestamp_col, key_col)
+    và giới hạn số dòng theo `ChunkSizer`, thay vì một truy vấn duy nhất bắt
+    SQL Server sắp xếp toàn bộ phần dữ liệu mới và giữ cursor trong suốt lần
+    chạy.
+    """
+    sizer = ChunkSizer(config)
+    last_ts = pd.Timestamp(watermark.timestamp).to_pydatetime()
+    last_key = watermark.key
+
+    while True:
+        page_size = sizer.size
+        query = _page_query(
+            sql_engine, config, columns_selection, has_key=last_key is not None
+        )
+        params = {"last_ts": last_ts, "page_size": page_size}
+        if config.key_col and last_key is not None:
+            params["last_key"] = last_key
+        logger.debug(f"Executing SQL: {query} with params: {params}")
+
+        with sql_engine.connect() as conn:
+            page = pd.read_sql(sql=text(query), con=conn, params=params)
+        if page.empty:
+            return
+
+        is_full_page = len(page) >= page_size
+        if is_full_page and sql_engine.dialect.name != "mssql":
+            page = _complete_last_group(sql_engine, config, columns_selection, page)
+
+        page = apply_dtypes(page, config)
+        sizer.observe(page)
+        yield page
+        if not is_full_page:
+            return
+
+        new_watermark = watermark_of(page, config)
+        last_ts = pd.Timestamp(new_watermark.timestamp).to_pydatetime()
+        last_key = new_watermark.key
+
+
+def watermark_of(chunk: pd.DataFrame, config: TableConfig) -> Watermark:
+    """
+    Lấy high-water mark từ dòng cuối cùng của một chunk thô (chưa biến đổi).
+
+    Chunk incremental đã được sắp xếp theo (timestamp_col, key_col), nên dòng
+    cuối cùng mang khóa lớn nhất. Giá trị được lấy trước bước Transform để
+    high-water mark luôn so sánh được với dữ liệu gốc ở nguồn (không bị lệch
+    bởi time offsets).
+    """
+    last = chunk.iloc[-1]
+    timestamp = pd.Timestamp(last[config.timestamp_col]).isoformat(sep=" ")
+    key = _to_python(last[config.key_col]) if config.key_col else None
+    if isinstance(key, float) and key.is_integer():
+        # Cột số nguyên có NULL bị pandas đọc thành float.
+        key = int(key)
+    return Watermark(timestamp, key)
+
+
 def from_sql_server(
-    sql_engine: Engine, config: TableConfig, last_timestamp: str
+    sql_engine: Engine, config: TableConfig, watermark: Watermark
 ) -> Iterator[pd.DataFrame]:
     """
     Trích xuất dữ liệu từ MS SQL Server theo từng khối (chunk).
 
     Hàm này xây dựng và thực thi câu lệnh SQL để lấy toàn bộ dữ liệu (full-load)
     hoặc chỉ dữ liệu mới (incremental load) dựa trên cấu hình và "high-water mark".
+    Dữ liệu incremental được lấy theo từng trang (keyset pagination) trên cặp
+    (timestamp_col, key_col).
 
     Args:
         sql_engine: SQLAlchemy engine đã kết nối tới SQL Server.
         config: Đối tượng cấu hình cho bảng đang được xử lý.
-        last_timestamp: Giá trị "high-water mark" từ lần chạy thành công cuối cùng.
+        watermark: "High-water mark" từ lần chạy thành công cuối cùng.
 
     Yields:
         Một iterator của các Pandas DataFrame, mỗi DataFrame là một chunk dữ liệu.
@@ -39,52 +320,69 @@ def from_sql_server(
     Raises:
         SQLAlchemyError: Nếu có lỗi xảy ra trong quá trình thực thi truy vấn SQL.
     """
-    source_columns = list(config.rename_map.keys())
-
-    # Nếu là incremental, đảm bảo cột timestamp có trong danh sách để lọc.
-    if config.timestamp_col and config.timestamp_col not in source_columns:
-        source_columns.append(config.timestamp_col)
-
-    if not source_columns:
-        logger.warning(
-            f"Bảng '{config.source_table}': Không có cột nào trong 'rename_map'. "
-            f"Sử dụng 'SELECT *' làm mặc định."
-        )
-        columns_selection = "*"
-    else:
-        # Xây dựng chuỗi các cột được chọn, bọc trong `[]` để tương thích T-SQL.
-        columns_selection = ", ".join(f"[{col}]" for col in source_columns)
-
-    query = f"SELECT {columns_selection} FROM {config.source_table}"
-    params = {}
+    columns_selection = _columns_selection(config)
 
-    # Nếu là incremental load, thêm mệnh đề WHERE và ORDER BY.
+    # Incremental load: lấy theo từng trang sau high-water mark.
     if config.incremental and config.timestamp_col:
-        query += f" WHERE [{config.timestamp_col}] > :last_ts ORDER BY [{config.timestamp_col}]"
-        params["last_ts"] = last_timestamp
+        watermark = start_watermark(config, watermark)
         logger.info(
             f"Trích xuất incremental từ '{config.source_table}' "
-            f"với high-water-mark > '{last_timestamp}'."
+            f"với high-water-mark > ({watermark.timestamp}, {watermark.key})."
         )
-    else:
-        logger.info(f"Trích xuất full-load từ '{config.source_table}'.")
+        return _iter_pages(sql_engine, config, columns_selection, watermark)
+
+    query = f"SELECT {columns_selection} FROM {config.source_table}"
+    logger.info(f"Trích xuất full-load từ '{config.source_table}'.")
 
     # Ghi log câu lệnh SQL đầy đủ ở cấp độ DEBUG để tiện cho việc gỡ lỗi.
+    logger.debug(f"Executing SQL: {query}")
+
+    # Đọc kết quả theo từng chunk có kích thước thích ứng, giúp tiết kiệm
+    # bộ nhớ khi làm việc với dữ liệu lớn.
+    return _iter_result(sql_engine, config, query, {})
+
+
+def from_sql_server_range(
+    sql_engine: Engine, config: TableConfig, start: pd.Timestamp, end: pd.Timestamp
+) -> Iterator[pd.DataFrame]:
+    """
+    Trích xuất các dòng có `timestamp_col` trong khoảng [start, end).
+
+    Dùng cho việc nạp lại lịch sử (backfill) theo từng cửa sổ thời gian, độc
+    lập với high-water mark.
+
+    Args:
+        sql_engine: SQLAlchemy engine đã kết nối tới SQL Server.
+        config: Đối tượng cấu hình cho bảng đang được xử lý.
+        start: Mốc bắt đầu (bao gồm) theo giá trị gốc ở nguồn.
+        end: Mốc kết thúc (không bao gồm).
+
+    Yields:
+        Các chunk dữ liệu thô.
+    """
+    ts_col = config.timestamp_col
+    query = (
+        f"SELECT {_columns_selection(config)} FROM {config.source_table} "
+        f"WHERE [{ts_col}] >= :start AND [{ts_col}] < :end"
+    )
+    params = {"start": start.to_pydatetime(), "end": end.to_pydatetime()}
     logger.debug(f"Executing SQL: {query} with params: {params}")
 
-    try:
-        # Sử dụng `pd.read_sql` với `chunksize` để trả về một iterator,
-        # giúp tiết kiệm bộ nhớ khi làm việc với dữ liệu lớn.
-        # Dùng `text()` và `params` của SQLAlchemy để chống SQL Injection.
-        return pd.read_sql(
-            sql=text(query),
-            con=sql_engine,
-            params=params,
-            chunksize=settings.ETL_CHUNK_SIZE,
-        )
-    except SQLAlchemyError as e:
-        logger.error(
-            f"Lỗi SQL khi trích xuất từ bảng '{config.source_table}': {e}"
-        )
-        # Ném lại lỗi để cơ chế retry của `cli.py` có thể bắt và xử lý.
-        raise
+    return _iter_result(sql_engine, config, query, params)
+
+
+def not_after_watermark(
+    chunk: pd.DataFrame, config: TableConfig, watermark: Watermark
+) -> pd.Series:
+    """
+    Mặt nạ các dòng thô có khóa (timestamp_col, key_col) không vượt high-water mark.
+
+    Những dòng sau high-water mark sẽ do lần chạy incremental tiếp theo nạp.
+    """
+    timestamps = pd.to_datetime(chunk[config.timestamp_col], errors="coerce")
+    watermark_ts = pd.Timestamp(watermark.timestamp)
+    mask = timestamps < watermark_ts
+    at_watermark = timestamps == watermark_ts
+    if config.key_col and watermark.key is not None:
+        at_watermark &= chunk[config.key_col] <= watermark.key
+    return mask | at_watermark
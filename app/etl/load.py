@@ -6,22 +6,164 @@ Chức năng chính bao gồm:
    dưới định dạng Parquet, có hỗ trợ partition.
 2. Nạp dữ liệu từ các tệp Parquet vào DuckDB một cách an toàn và không
    gây gián đoạn bằng kỹ thuật "atomic swap".
+3. Gộp (compact) các tệp nhỏ trong mỗi partition thành một vài tệp lớn.
+4. Lưu trữ phân tầng (tiering) cho bảng có `hot_months`: các tháng gần đây
+   nằm trong bảng DuckDB (tầng nóng), các tháng cũ hơn được chuyển sang
+   Parquet đã gộp trong `data/cold/` (tầng lạnh). View `<bảng>_all` gộp hai
+   tầng; điều kiện trên `year`/`month` được đẩy xuống để DuckDB chỉ đọc các
+   thư mục partition cần thiết.
 """
 
 import logging
 import shutil
 from pathlib import Path
-from typing import Optional
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple, Union
+from uuid import uuid4
 
+import duckdb
 import pandas as pd
 import pyarrow as pa
+import pyarrow.compute as pc
 import pyarrow.parquet as pq
 from duckdb import DuckDBPyConnection
 
-from ..core.config import settings, TableConfig
+from . import outliers
+from .schemas import get_arrow_schema
+from ..core import snapshots
+from ..core.config import settings, StorageOptions, TableConfig
 
 logger = logging.getLogger(__name__)
 BASE_DATA_PATH = Path(settings.DATA_DIR)
+COLD_DATA_PATH = BASE_DATA_PATH / "cold"
+MERGE_WORK_PATH = BASE_DATA_PATH / ".merge"
+
+
+def _partition_dir(partition_cols: List[str], key: Tuple) -> str:
+    """Tên thư mục partition theo chuẩn Hive (ví dụ: `year=2024/month=5`)."""
+    return "/".join(f"{col}={value}" for col, value in zip(partition_cols, key))
+
+
+def _new_file_name() -> str:
+    """
+    Tên tệp Parquet mới, tăng dần theo thời gian ghi.
+
+    Thứ tự từ điển của tên tệp trùng với thứ tự ghi, nhờ đó có thể biết tệp
+    nào chứa dữ liệu mới hơn trong cùng một partition.
+    """
+    return f"part-{pd.Timestamp.now().strftime('%Y%m%d%H%M%S%f')}-{uuid4().hex[:8]}"
+
+
+def _row_group_size(storage: StorageOptions) -> int:
+    """Số dòng mỗi row group: theo cấu hình của bảng hoặc mặc định toàn cục."""
+    return storage.row_group_size or settings.ETL_PARQUET_ROW_GROUP_SIZE
+
+
+def _sort_table(table: pa.Table, storage: StorageOptions) -> pa.Table:
+    """Sắp xếp dữ liệu theo các cột `sort_by` có mặt trong bảng."""
+    sort_keys = [
+        (col, "ascending") for col in storage.sort_by if col in table.column_names
+    ]
+    return table.sort_by(sort_keys) if sort_keys else table
+
+
+def _writer_options(storage: StorageOptions, schema: pa.Schema) -> Dict[str, Any]:
+    """
+    Chuyển `StorageOptions` thành tham số cho `pq.ParquetWriter`.
+
+    Thứ tự sắp xếp được ghi vào metadata của từng row group (`sorting_columns`)
+    để các trình đọc biết dữ liệu đã được sắp xếp.
+    """
+    sort_keys = [(col, "ascending") for col in storage.sort_by if col in schema.names]
+    return {
+        "compression": storage.compression,
+        "compression_level": storage.compression_level,
+        "use_dictionary": (
+            True if storage.dictionary_columns is None else storage.dictionary_columns
+        ),
+        "write_statistics": storage.write_statistics,
+        "write_page_index": storage.write_page_index,
+        "sorting_columns": (
+            pq.SortingColumn.from_ordering(schema, sort_keys) if sort_keys else None
+        ),
+    }
+
+
+class _PartitionWriter:
+    """
+    Bộ ghi cho một partition: gom các dòng vào bộ đệm và ghi thành row group lớn.
+
+    Giữ một `ParquetWriter` mở cho partition trong suốt lần chạy và chuyển
+    sang tệp mới khi tệp hiện tại đạt `max_rows_per_file`. Tệp đang ghi mang
+    hậu tố `.inprogress` và chỉ được đổi tên thành `.parquet` khi đóng, nên
+    DuckDB không bao giờ đọc phải một tệp ghi dở.
+    """
+
+    def __init__(self, directory: Path, storage: StorageOptions):
+        self.directory = directory
+        self.storage = storage
+        self.row_group_size = _row_group_size(storage)
+        self.max_rows_per_file = settings.ETL_PARQUET_MAX_ROWS_PER_FILE
+        self._buffer: List[pa.Table] = []
+        self._buffered_rows = 0
+        self._writer: Optional[pq.ParquetWriter] = None
+        self._file_path: Optional[Path] = None
+        self._file_rows = 0
+        self.bytes_written = 0
+        # Các tệp đã công bố nhưng chưa được `ParquetLoader` đếm hoặc gộp theo
+        # khóa chính.
+        self.published: List[Path] = []
+
+    def write(self, table: pa.Table):
+        """Thêm dữ liệu vào bộ đệm, ghi ra đĩa khi đủ một row group."""
+        self._buffer.append(table)
+        self._buffered_rows += table.num_rows
+        if self._buffered_rows >= self.row_group_size:
+            self.flush()
+
+    def flush(self):
+        """Ghi toàn bộ bộ đệm hiện tại ra tệp đang mở."""
+        if not self._buffer:
+            return
+        table = _sort_table(pa.concat_tables(self._buffer), self.storage)
+        self._buffer, self._buffered_rows = [], 0
+
+        if self._writer is None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._file_path = self.directory / f"{_new_file_name()}.parquet"
+            self._writer = pq.ParquetWriter(
+                str(self._file_path.with_suffix(".inprogress")),
+                table.schema,
+                **_writer_options(self.storage, table.schema),
+            )
+        self._writer.write_table(table, row_group_size=self.row_group_size)
+        self._file_rows += table.num_rows
+
+        if self._file_rows >= self.max_rows_per_file:
+            self._close_file()
+
+    def _close_file(self):
+        """Đóng tệp đang ghi và công bố nó bằng cách đổi tên."""
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._file_path.with_suffix(".inprogress").rename(self._file_path)
+        self.bytes_written += self._file_path.stat().st_size
+        self.published.append(self._file_path)
+        self._writer, self._file_path, self._file_rows = None, None, 0
+
+    def close(self):
+        """Ghi nốt bộ đệm và đóng tệp. Bộ ghi vẫn dùng tiếp được (sang tệp mới)."""
+        self.flush()
+        self._close_file()
+
+    def abort(self):
+        """Hủy bộ đệm và tệp đang ghi dở, giữ nguyên các tệp đã công bố."""
+        self._buffer, self._buffered_rows = [], 0
+        if self._writer is None:
+            return
+        self._writer.close()
+        self._file_path.with_suffix(".inprogress").unlink(missing_ok=True)
+        self._writer, self._file_path, self._file_rows = None, None, 0
 
 
 class ParquetLoader:
@@ -31,13 +173,29 @@ class ParquetLoader:
     Lớp này trừu tượng hóa logic phức tạp của việc ghi dữ liệu theo từng khối,
     tự động xử lý việc mở và đóng `ParquetWriter` một cách an toàn,
     đảm bảo tài nguyên được giải phóng đúng cách.
+
+    Với bảng incremental (và bảng có partition), mỗi partition có một bộ ghi
+    riêng với bộ đệm, nên mỗi lần chạy chỉ tạo ra một vài tệp lớn cho mỗi
+    partition thay vì một tệp nhỏ cho mỗi chunk. Nếu khối `with` kết thúc do
+    lỗi, dữ liệu chưa qua `checkpoint()` bị hủy để lần chạy lại không ghi
+    trùng.
+
+    Với bảng incremental có `primary_key`, các tệp ghi trong lần chạy của mỗi
+    partition được gộp vào dữ liệu đã có một lần ở `finalize()` (xem
+    `_merge_partition`): các dòng được trích xuất lại trong cửa sổ `lookback`
+    mà không thay đổi bị bỏ đi, nên sau `finalize()`, `new_rows` và
+    `written_partitions` chỉ tính dữ liệu thực sự mới hoặc đã thay đổi. Các
+    `checkpoint()` giữa chừng chỉ công bố tệp, không đọc lại partition.
     """
 
-    def __init__(self, config: TableConfig):
+    def __init__(self, config: TableConfig, dest_path: Optional[Path] = None):
         self.config = config
-        self.dest_path = BASE_DATA_PATH / self.config.dest_table
+        self.dest_path = dest_path or BASE_DATA_PATH / self.config.dest_table
         self.writer: Optional[pq.ParquetWriter] = None
-        self.has_written_data = False
+        self.partition_writers: Dict[Tuple, _PartitionWriter] = {}
+        self.new_rows = 0
+        self._changed_partitions: Set[Tuple] = set()
+        self._file_bytes = 0
 
     def __enter__(self):
         # Đảm bảo thư mục đích tồn tại khi bắt đầu
@@ -48,48 +206,446 @@ class ParquetLoader:
         # Đảm bảo writer được đóng lại an toàn khi kết thúc khối `with`
         if self.writer:
             self.writer.close()
+            if exc_type is None:
+                self._file_bytes = (self.dest_path / "data.parquet").stat().st_size
+        if exc_type is None:
+            self.finalize()
+        else:
+            for partition_writer in self.partition_writers.values():
+                partition_writer.abort()
         if exc_type is not None:
             logger.error(
                 f"Lỗi khi ghi Parquet cho '{self.config.dest_table}': {exc_val}"
             )
 
-    def write_chunk(self, df: pd.DataFrame):
-        """Ghi một chunk DataFrame vào staging area (Parquet)."""
-        if df.empty:
+    @property
+    def _merges(self) -> bool:
+        """Bảng incremental có `primary_key`: tệp mới được gộp theo khóa chính."""
+        return self.config.incremental and bool(self.config.primary_key)
+
+    def checkpoint(self):
+        """
+        Ghi và công bố toàn bộ dữ liệu đã nhận (đóng các tệp đang ghi).
+
+        Sau khi hàm trả về, mọi chunk đã truyền vào `write_chunk` đều nằm
+        trong các tệp `.parquet` hoàn chỉnh trên đĩa. Với bảng có
+        `primary_key`, các tệp này chỉ được gộp vào dữ liệu đã có ở
+        `finalize()`; cho tới lúc đó `written_partitions` tính mọi partition
+        có tệp mới.
+        """
+        for key, partition_writer in self.partition_writers.items():
+            partition_writer.close()
+            if not partition_writer.published or self._merges:
+                continue
+            rows = sum(
+                pq.ParquetFile(str(f)).metadata.num_rows
+                for f in partition_writer.published
+            )
+            partition_writer.published = []
+            self.new_rows += rows
+            if rows > 0:
+                self._changed_partitions.add(key)
+
+    def finalize(self):
+        """
+        Kết thúc lần ghi: `checkpoint()` rồi gộp mỗi partition một lần.
+
+        Với bảng có `primary_key`, mọi tệp ghi trong lần chạy của một partition
+        được gộp vào dữ liệu đã có trong một lượt, nên chi phí đọc lại
+        partition không tăng theo số lần checkpoint. Gọi lại nhiều lần không
+        có tác dụng gì thêm.
+        """
+        self.checkpoint()
+        if not self._merges:
             return
+        for key, partition_writer in self.partition_writers.items():
+            if not partition_writer.published:
+                continue
+            rows = self._merge_partition(key, partition_writer)
+            partition_writer.published = []
+            self.new_rows += rows
+            if rows > 0:
+                self._changed_partitions.add(key)
+
+    def _merge_partition(self, key: Tuple, partition_writer: _PartitionWriter) -> int:
+        """
+        Gộp các tệp ghi trong lần chạy của một partition vào dữ liệu đã có.
+
+        Các dòng vừa ghi được so sánh với bản ghi mới nhất của cùng khóa trong
+        các tệp đã có:
+        - Không có dòng mới hoặc thay đổi: các tệp vừa ghi bị xóa.
+        - Chỉ có khóa mới: các tệp vừa ghi chỉ giữ lại những dòng đó.
+        - Có khóa đã tồn tại bị thay đổi: toàn bộ partition được ghi lại (đã
+          khử trùng lặp) trong `data/.merge/` rồi thay thư mục cũ bằng hai lệnh
+          đổi tên, thay vì để lại nhiều phiên bản của cùng một khóa.
+
+        Returns:
+            Số dòng mới hoặc đã thay đổi.
+        """
+        directory = partition_writer.directory
+        new_files = partition_writer.published
+        existing = sorted(set(directory.glob("*.parquet")) - set(new_files))
+        if not existing:
+            return sum(pq.ParquetFile(str(f)).metadata.num_rows for f in new_files)
+        # Kết quả của DuckDB được ép lại đúng schema của các tệp đã ghi.
+        schema = pq.read_schema(str(new_files[0])).remove_metadata()
+
+        new_select = _select_parquet(self.config, _file_list(new_files), hive=False)
+        old_select = _select_parquet(self.config, _file_list(existing), hive=False)
+        join_keys = " AND ".join(
+            f"d.{col} IS NOT DISTINCT FROM o.{col}" for col in self.config.primary_key
+        )
+        # Kết nối DuckDB trong bộ nhớ, chỉ đọc Parquet của staging area.
+        conn = duckdb.connect()
         try:
-            arrow_table = pa.Table.from_pandas(df, preserve_index=False)
+            conn.execute(
+                f"CREATE TABLE delta AS SELECT * FROM ({new_select}) "
+                f"EXCEPT SELECT * FROM ({old_select});"
+            )
+            changed = conn.execute("SELECT count(*) FROM delta;").fetchone()[0]
+            updated = conn.execute(
+                f"SELECT count(*) FROM delta d JOIN ({old_select}) o ON {join_keys};"
+            ).fetchone()[0]
+            new_total = conn.execute(
+                f"SELECT count(*) FROM read_parquet({_file_list(new_files)});"
+            ).fetchone()[0]
+            if updated:
+                merged = conn.execute(
+                    _select_parquet(
+                        self.config, _file_list(existing + new_files), hive=False
+                    )
+                ).arrow().cast(schema)
+            elif 0 < changed < new_total:
+                delta = conn.execute("SELECT * FROM delta;").arrow().cast(schema)
+        finally:
+            conn.close()
 
-            if self.config.partition_cols:
-                # Ghi dưới dạng dataset nếu có partition
-                pq.write_to_dataset(
-                    arrow_table,
-                    root_path=str(self.dest_path),
-                    partition_cols=self.config.partition_cols,
-                    existing_data_behavior="overwrite_or_ignore",
+        relative = _partition_dir(self.config.partition_cols, key)
+        if updated:
+            work_path = MERGE_WORK_PATH / self.config.dest_table
+            new_path = work_path / relative
+            if new_path.exists():
+                shutil.rmtree(new_path)
+            _write_sorted(merged, new_path, self.config)
+            _swap_directory(
+                new_path, directory, MERGE_WORK_PATH / f"{self.config.dest_table}.old"
+            )
+            shutil.rmtree(work_path, ignore_errors=True)
+            logger.info(
+                f"Đã ghi lại partition '{self.config.dest_table}/{relative}' "
+                f"({updated:,} dòng bị thay đổi ở nguồn)."
+            )
+        elif changed < new_total:
+            if changed:
+                delta_writer = _PartitionWriter(directory, self.config.storage)
+                delta_writer.write(delta)
+                delta_writer.close()
+            for f in new_files:
+                f.unlink()
+        logger.debug(
+            f"Partition '{self.config.dest_table}/{relative}': {changed:,}/"
+            f"{new_total:,} dòng mới hoặc đã thay đổi."
+        )
+        return changed
+
+    @property
+    def has_written_data(self) -> bool:
+        """Lần chạy đã ghi dữ liệu mới (hoặc đã thay đổi) vào staging hay chưa."""
+        return self.new_rows > 0
+
+    @property
+    def bytes_written(self) -> int:
+        """Dung lượng (byte) các tệp Parquet đã được công bố trong lần chạy."""
+        return self._file_bytes + sum(
+            w.bytes_written for w in self.partition_writers.values()
+        )
+
+    @property
+    def written_partitions(self) -> List[Tuple]:
+        """
+        Các partition (theo `partition_cols`) có dữ liệu mới trong lần chạy.
+
+        Trước `finalize()`, các partition có tệp chưa được gộp theo khóa chính
+        cũng được tính (có thể chỉ chứa dòng trùng của cửa sổ `lookback`).
+        """
+        unmerged = {key for key, w in self.partition_writers.items() if w.published}
+        return sorted(self._changed_partitions | unmerged)
+
+    def _write_partitioned(self, arrow_table: pa.Table):
+        """Tách chunk theo partition và chuyển từng phần cho bộ ghi tương ứng."""
+        partition_cols = self.config.partition_cols
+        keys = arrow_table.group_by(partition_cols).aggregate([]).to_pylist()
+        data_cols = [c for c in arrow_table.column_names if c not in partition_cols]
+
+        for key in keys:
+            mask = None
+            for col in partition_cols:
+                condition = pc.equal(arrow_table[col], key[col])
+                mask = condition if mask is None else pc.and_(mask, condition)
+            part = arrow_table.filter(mask).select(data_cols)
+
+            partition_key = tuple(key[col] for col in partition_cols)
+            partition_writer = self.partition_writers.get(partition_key)
+            if partition_writer is None:
+                partition_writer = _PartitionWriter(
+                    self.dest_path / _partition_dir(partition_cols, partition_key),
+                    self.config.storage,
                 )
+                self.partition_writers[partition_key] = partition_writer
+            partition_writer.write(part)
+
+    def write_chunk(self, data: Union[pd.DataFrame, pa.Table]):
+        """Ghi một chunk (DataFrame hoặc Arrow Table) vào staging area (Parquet)."""
+        if len(data) == 0:
+            return
+        try:
+            arrow_table = to_arrow_table(data, self.config)
+
+            if self.config.partition_cols:
+                # Gom theo partition, ghi thành các row group lớn
+                self._write_partitioned(arrow_table)
+            elif self.config.incremental:
+                # Bảng incremental không có partition: các tệp mới được thêm
+                # vào thư mục gốc, không ghi đè dữ liệu của các lần chạy trước.
+                if () not in self.partition_writers:
+                    self.partition_writers[()] = _PartitionWriter(
+                        self.dest_path, self.config.storage
+                    )
+                self.partition_writers[()].write(arrow_table)
             else:
                 # Ghi vào một tệp Parquet duy nhất
                 if self.writer is None:
                     output_file = self.dest_path / "data.parquet"
-                    if not self.config.incremental and output_file.exists():
+                    if output_file.exists():
                         output_file.unlink()
                     self.writer = pq.ParquetWriter(
-                        str(output_file), arrow_table.schema
+                        str(output_file),
+                        arrow_table.schema,
+                        **_writer_options(self.config.storage, arrow_table.schema),
                     )
-                self.writer.write_table(arrow_table)
-
-            self.has_written_data = True
+                self.writer.write_table(
+                    _sort_table(arrow_table, self.config.storage),
+                    row_group_size=_row_group_size(self.config.storage),
+                )
+                self.new_rows += arrow_table.num_rows
         except pa.ArrowException as e:
             logger.error(f"Lỗi PyArrow khi ghi chunk cho '{self.config.dest_table}': {e}")
             raise
 
 
+def to_arrow_table(
+    data: Union[pd.DataFrame, pa.Table], config: TableConfig
+) -> pa.Table:
+    """
+    Chuyển một chunk đã biến đổi về Arrow Table theo schema chuẩn của bảng.
+
+    Metadata của pandas bị loại bỏ để tệp Parquet do engine `pandas` và
+    engine `arrow` ghi ra là giống hệt nhau (byte-identical).
+    """
+    schema = get_arrow_schema(config.dest_table)
+    if isinstance(data, pd.DataFrame):
+        if schema is not None and list(data.columns) == schema.names:
+            table = pa.Table.from_pandas(data, schema=schema, preserve_index=False)
+        else:
+            table = pa.Table.from_pandas(data, preserve_index=False)
+    else:
+        table = data
+        if schema is not None and table.schema.names == schema.names:
+            table = table.cast(schema)
+    return table.replace_schema_metadata(None)
+
+
+# Kiểu DuckDB tương ứng với kiểu Arrow của các cột partition.
+_DUCKDB_PARTITION_TYPES = {
+    pa.int16(): "SMALLINT",
+    pa.int32(): "INTEGER",
+    pa.int64(): "BIGINT",
+}
+
+
+def _hive_options(config: TableConfig) -> str:
+    """
+    Tham số `read_parquet` cho dữ liệu phân vùng kiểu Hive.
+
+    Giá trị các cột partition được đọc từ tên thư mục nên DuckDB mặc định suy
+    ra kiểu `BIGINT`; `hive_types` giữ đúng kiểu hẹp khai báo trong schema.
+    """
+    schema = get_arrow_schema(config.dest_table)
+    types = {
+        col: _DUCKDB_PARTITION_TYPES[schema.field(col).type]
+        for col in config.partition_cols
+        if schema is not None
+        and col in schema.names
+        and schema.field(col).type in _DUCKDB_PARTITION_TYPES
+    }
+    if not types:
+        return "hive_partitioning=true"
+    hive_types = ", ".join(f"'{col}': {kind}" for col, kind in types.items())
+    return f"hive_partitioning=true, hive_types={{{hive_types}}}"
+
+
+def _select_parquet(config: TableConfig, files: str, hive: bool = True) -> str:
+    """
+    Câu lệnh SELECT đọc các tệp Parquet của staging area.
+
+    Nếu bảng có `primary_key`, mỗi khóa chỉ giữ lại bản ghi trong tệp được ghi
+    sau cùng (tên tệp tăng dần theo thời gian ghi), nhờ đó dữ liệu được trích
+    xuất lại trong cửa sổ `lookback` thay thế bản cũ thay vì bị nhân đôi.
+
+    Args:
+        config: Cấu hình của bảng.
+        files: Biểu thức đường dẫn cho `read_parquet` (chuỗi glob hoặc danh sách).
+        hive: Đọc các cột partition từ tên thư mục. Tắt khi chỉ đọc các tệp
+            của một partition để ghi lại vào chính partition đó.
+    """
+    options = _hive_options(config) if hive else "hive_partitioning=false"
+    if not config.primary_key:
+        return f"SELECT * FROM read_parquet({files}, {options})"
+    keys = ", ".join(config.primary_key)
+    return (
+        f"SELECT * EXCLUDE (filename) "
+        f"FROM read_parquet({files}, {options}, filename=true) "
+        f"QUALIFY row_number() OVER ("
+        f"PARTITION BY {keys} ORDER BY regexp_extract(filename, '[^/]*$') DESC"
+        f") = 1"
+    )
+
+
+def _file_list(files: Iterable[Path]) -> str:
+    """Danh sách tệp dưới dạng biểu thức cho `read_parquet`."""
+    return "[" + ", ".join(f"'{f}'" for f in files) + "]"
+
+
+def _drop_duplicates(table: pa.Table, primary_key: List[str]) -> pa.Table:
+    """Giữ lại dòng xuất hiện sau cùng của mỗi khóa chính trong Arrow Table."""
+    row_numbers = pa.array(range(table.num_rows), type=pa.int64())
+    latest = (
+        table.select(primary_key)
+        .append_column("_row", row_numbers)
+        .group_by(primary_key)
+        .aggregate([("_row", "max")])["_row_max"]
+    )
+    return table.take(pc.sort_indices(latest))
+
+
+def _list_partitions(root: Path, partition_cols: List[str]) -> List[Tuple]:
+    """Các partition (giá trị nguyên của `partition_cols`) có tệp trong `root`."""
+    pattern = "/".join(["*=*"] * len(partition_cols))
+    keys = []
+    for path in root.glob(pattern):
+        if any(path.glob("*.parquet")):
+            parts = path.relative_to(root).parts
+            keys.append(tuple(int(part.split("=", 1)[1]) for part in parts))
+    return sorted(keys)
+
+
+def cold_partitions(config: TableConfig) -> List[Tuple]:
+    """
+    Các partition của bảng đang nằm ở tầng lạnh (rỗng nếu không phân tầng).
+
+    Các thư mục đã trở lại tầng nóng nhưng còn chờ xóa (vì snapshot cũ vẫn
+    đọc chúng) không được tính.
+    """
+    if config.hot_months is None:
+        return []
+    cold_root = (COLD_DATA_PATH / config.dest_table).resolve()
+    retired = snapshots.retired_paths()
+    return [
+        key
+        for key in _list_partitions(cold_root, config.partition_cols)
+        if cold_root / _partition_dir(config.partition_cols, key) not in retired
+    ]
+
+
+def tiered_view_name(config: TableConfig) -> str:
+    """Tên view gộp tầng nóng và tầng lạnh của bảng."""
+    return f"{config.dest_table}_all"
+
+
+def _cold_source(config: TableConfig, exclude: Iterable[Tuple] = ()) -> Optional[str]:
+    """
+    Biểu thức `read_parquet` đọc các partition lạnh, None nếu không có.
+
+    Đường dẫn được chuyển thành tuyệt đối vì view được dùng bởi cả tiến trình
+    API (có thể chạy ở thư mục làm việc khác).
+    """
+    excluded = set(exclude)
+    cold_root = (COLD_DATA_PATH / config.dest_table).resolve()
+    files = ", ".join(
+        f"'{cold_root / _partition_dir(config.partition_cols, key)}/*.parquet'"
+        for key in cold_partitions(config)
+        if key not in excluded
+    )
+    if not files:
+        return None
+    return f"read_parquet([{files}], {_hive_options(config)})"
+
+
+def create_tiered_view(
+    conn: DuckDBPyConnection, config: TableConfig, exclude: Iterable[Tuple] = ()
+):
+    """
+    Tạo (lại) view `<dest_table>_all` gồm bảng DuckDB và các partition lạnh.
+
+    Args:
+        conn: Kết nối DuckDB (ghi).
+        config: Cấu hình của bảng.
+        exclude: Các partition lạnh không đưa vào view (vì vừa được nạp lại
+            vào bảng DuckDB và sắp được trả lại khỏi tầng lạnh).
+    """
+    query = f"SELECT * FROM {config.dest_table}"
+    cold = _cold_source(config, exclude)
+    if cold is not None:
+        query += f" UNION ALL BY NAME SELECT * FROM {cold}"
+    conn.execute(f"CREATE OR REPLACE VIEW {tiered_view_name(config)} AS {query};")
+
+
+def _release_cold(config: TableConfig, partitions: Iterable[Tuple]):
+    """
+    Trả lại khỏi tầng lạnh các partition đã được nạp lại vào bảng DuckDB.
+
+    Thư mục chưa bị xóa ngay vì view `<bảng>_all` của các snapshot đã công bố
+    vẫn đọc nó; `snapshots.retire` xóa khi không còn snapshot nào như vậy.
+    """
+    paths = []
+    for key in partitions:
+        relative = _partition_dir(config.partition_cols, key)
+        paths.append(COLD_DATA_PATH / config.dest_table / relative)
+        logger.info(f"Partition '{config.dest_table}/{relative}' đã trở lại tầng nóng.")
+    snapshots.retire(paths)
+
+
+def _hot_files(config: TableConfig, cold: Iterable[Tuple]) -> Optional[str]:
+    """
+    Biểu thức đường dẫn cho `read_parquet` gồm các partition staging không lạnh.
+
+    Returns:
+        Danh sách glob, hoặc None nếu mọi partition đều đang ở tầng lạnh.
+    """
+    staging_dir = BASE_DATA_PATH / config.dest_table
+    excluded = set(cold)
+    if not excluded:
+        return f"'{staging_dir}/**/*.parquet'"
+    files = ", ".join(
+        f"'{staging_dir / _partition_dir(config.partition_cols, key)}/*.parquet'"
+        for key in _list_partitions(staging_dir, config.partition_cols)
+        if key not in excluded
+    )
+    return f"[{files}]" if files else None
+
+
 def prepare_destination(config: TableConfig):
     """
     Chuẩn bị thư mục staging: dọn dẹp thư mục cũ nếu là full-load.
+
+    Với bảng incremental, các tệp `.inprogress` còn sót lại từ một lần chạy bị
+    gián đoạn được xóa (dữ liệu của chúng chưa được checkpoint).
     """
     dest_path = BASE_DATA_PATH / config.dest_table
+    if config.incremental and dest_path.exists():
+        for stale_file in dest_path.rglob("*.inprogress"):
+            logger.warning(f"Xóa tệp ghi dở từ lần chạy trước: {stale_file}")
+            stale_file.unlink(missing_ok=True)
     if not config.incremental and dest_path.exists():
         logger.info(f"Full-load: Đang dọn dẹp staging cũ: {dest_path}")
         try:
@@ -101,19 +657,27 @@ def prepare_destination(config: TableConfig):
 
 
 def refresh_duckdb_table(
-    conn: DuckDBPyConnection, config: TableConfig, has_new_data: bool
+    conn: DuckDBPyConnection,
+    config: TableConfig,
+    has_new_data: bool,
+    changed_partitions: Iterable[Tuple] = (),
 ):
     """
     Tải dữ liệu từ Parquet vào DuckDB và thực hiện "atomic swap".
 
     Quy trình này đảm bảo an toàn và không gián đoạn cho người dùng cuối:
-    1. Tải dữ liệu từ Parquet vào một bảng tạm (_staging).
+    1. Tải dữ liệu từ Parquet vào một bảng tạm (_staging) và tính outlier
+       (xem `outliers.flag_outliers`).
     2. Bắt đầu một TRANSACTION.
     3. Đổi tên bảng chính hiện tại (nếu có) thành bảng cũ (_old).
     4. "Thăng cấp" bảng tạm thành bảng chính.
     5. COMMIT transaction. Bước này diễn ra gần như tức thời.
     6. Dọn dẹp bảng cũ và chạy ANALYZE để tối ưu hóa hiệu năng.
     7. Nếu có lỗi, ROLLBACK để quay về trạng thái ban đầu.
+
+    Với bảng phân tầng (`hot_months`), các partition lạnh không được đọc lại,
+    trừ những partition có trong `changed_partitions` (dữ liệu đến muộn): chúng
+    được nạp vào bảng DuckDB và trở lại tầng nóng.
     """
     if not has_new_data:
         logger.info(
@@ -126,14 +690,29 @@ def refresh_duckdb_table(
     backup_table = f"{dest_table}_old"
     staging_dir = str(BASE_DATA_PATH / dest_table)
 
+    cold = cold_partitions(config)
+    changed = set(changed_partitions)
+    released = [key for key in cold if key in changed]
+    still_cold = [key for key in cold if key not in changed]
+    files = _hot_files(config, still_cold)
+
     try:
         # 1. Tải Parquet vào bảng staging
         logger.info(f"Bắt đầu nạp Parquet vào staging table '{staging_table}'...")
-        conn.execute(
-            f"""
-            CREATE OR REPLACE TABLE {staging_table} AS
-            SELECT * FROM read_parquet('{staging_dir}/**', hive_partitioning=true);
-        """
+        if files is not None:
+            select = _select_parquet(config, files)
+        else:
+            # Mọi partition đều lạnh: chỉ lấy cấu trúc bảng từ staging.
+            everything = _select_parquet(config, f"'{staging_dir}/**/*.parquet'")
+            select = f"SELECT * FROM ({everything}) WHERE false"
+        conn.execute(f"CREATE OR REPLACE TABLE {staging_table} AS {select};")
+        # Tính outlier trên bảng staging để người dùng không thấy dòng chưa xử lý.
+        outliers.flag_outliers(
+            conn,
+            config,
+            staging_table,
+            previous=dest_table,
+            context=_cold_source(config, exclude=released),
         )
 
         # 2. Thực hiện hoán đổi nguyên tử (atomic swap) trong một transaction
@@ -150,11 +729,13 @@ def refresh_duckdb_table(
 
             -- "Thăng cấp" bảng staging mới thành bảng chính.
             ALTER TABLE {staging_table} RENAME TO {dest_table};
-
-            COMMIT;
         """
         )
+        if config.hot_months is not None:
+            create_tiered_view(conn, config, exclude=released)
+        conn.execute("COMMIT;")
         logger.info(f"Hoán đổi bảng '{dest_table}' thành công.")
+        _release_cold(config, released)
 
         # 3. Dọn dẹp và tối ưu hóa
         conn.execute(f"DROP TABLE IF EXISTS {backup_table};")
@@ -176,3 +757,357 @@ def refresh_duckdb_table(
         conn.execute("ROLLBACK;")
         logger.warning(f"Đã ROLLBACK transaction cho bảng '{dest_table}'.")
         raise
+
+
+def _swap_directory(new_path: Path, target_path: Path, backup_path: Path):
+    """
+    Thay thư mục `target_path` bằng `new_path` bằng hai lệnh đổi tên.
+
+    Thư mục cũ được chuyển sang `backup_path` rồi xóa. Nếu `new_path` không
+    tồn tại, `target_path` chỉ đơn giản bị xóa.
+    """
+    if backup_path.exists():
+        shutil.rmtree(backup_path)
+    backup_path.parent.mkdir(parents=True, exist_ok=True)
+    if target_path.exists():
+        target_path.rename(backup_path)
+    if new_path.exists():
+        target_path.parent.mkdir(parents=True, exist_ok=True)
+        new_path.rename(target_path)
+    shutil.rmtree(backup_path, ignore_errors=True)
+
+
+def replace_partition(
+    config: TableConfig, partition: Tuple, source_root: Path
+) -> int:
+    """
+    Thay một partition trong staging area bằng partition tương ứng (cùng giá
+    trị) trong `source_root`.
+
+    Args:
+        config: Cấu hình của bảng.
+        partition: Giá trị của `partition_cols` cho partition cần thay.
+        source_root: Thư mục gốc (cùng bố cục Hive) chứa dữ liệu mới, ví dụ
+            thư mục tạm của một cửa sổ backfill.
+
+    Returns:
+        Số dòng của partition mới (0 nếu không còn dữ liệu).
+    """
+    relative = _partition_dir(config.partition_cols, partition)
+    new_path = source_root / relative
+    target_path = BASE_DATA_PATH / config.dest_table / relative
+    backup_path = source_root.parent / f"{source_root.name}.old"
+
+    rows = sum(
+        pq.ParquetFile(str(f)).metadata.num_rows for f in new_path.glob("*.parquet")
+    )
+    _swap_directory(new_path, target_path, backup_path)
+    logger.info(
+        f"Đã thay partition '{config.dest_table}/{relative}' ({rows:,} dòng)."
+    )
+    return rows
+
+
+def _write_sorted(table: pa.Table, new_path: Path, config: TableConfig):
+    """
+    Ghi toàn bộ dữ liệu của một partition vào thư mục `new_path`.
+
+    Cả partition (không chỉ từng row group) được sắp xếp theo `storage.sort_by`
+    (mặc định: cột thời gian) để khoảng min/max của các row group không chồng
+    lấn nhau.
+    """
+    if config.storage.sort_by:
+        table = _sort_table(table, config.storage)
+    elif config.final_timestamp_col in table.column_names:
+        table = table.sort_by(config.final_timestamp_col)
+
+    writer = _PartitionWriter(new_path, config.storage)
+    for batch in table.to_batches(max_chunksize=writer.row_group_size):
+        writer.write(pa.Table.from_batches([batch], schema=table.schema))
+    writer.close()
+
+
+def compact_partitions(config: TableConfig) -> int:
+    """
+    Gộp các tệp Parquet nhỏ trong mỗi partition thành một vài tệp lớn.
+
+    Dữ liệu của mỗi partition được đọc lại, khử trùng lặp theo `primary_key`
+    (nếu có), sắp xếp theo `storage.sort_by`
+    (mặc định: cột thời gian) rồi ghi vào một thư mục tạm trong
+    `data/.compaction/`. Sau đó thư mục partition cũ được thay bằng thư mục mới
+    bằng hai lệnh đổi tên. Không được chạy đồng thời với `run-etl` cho cùng
+    một bảng.
+
+    Args:
+        config: Cấu hình của bảng cần gộp tệp.
+
+    Returns:
+        Số partition đã được gộp.
+    """
+    dest_path = BASE_DATA_PATH / config.dest_table
+    if not config.partition_cols or not dest_path.exists():
+        logger.info(f"Bảng '{config.dest_table}' không có partition để gộp.")
+        return 0
+
+    work_path = BASE_DATA_PATH / ".compaction" / config.dest_table
+    partition_pattern = "/".join(["*=*"] * len(config.partition_cols))
+    compacted = 0
+
+    for partition_path in sorted(dest_path.glob(partition_pattern)):
+        files = sorted(partition_path.glob("*.parquet"))
+        if len(files) <= 1:
+            continue
+
+        # Các tệp được đọc theo thứ tự ghi, nên khi khử trùng lặp theo khóa
+        # chính, dòng xuất hiện sau cùng là dòng mới nhất.
+        table = pa.concat_tables(
+            [pq.read_table(str(f)) for f in files], promote_options="permissive"
+        )
+        if config.primary_key:
+            table = _drop_duplicates(table, config.primary_key)
+
+        relative = partition_path.relative_to(dest_path)
+        new_path = work_path / relative
+        backup_path = work_path / f"{relative}.old"
+        if new_path.exists():
+            shutil.rmtree(new_path)
+        _write_sorted(table, new_path, config)
+
+        _swap_directory(new_path, partition_path, backup_path)
+
+        compacted += 1
+        logger.info(
+            f"Đã gộp {len(files)} tệp ({table.num_rows:,} dòng) của "
+            f"'{config.dest_table}/{relative}'."
+        )
+
+    shutil.rmtree(work_path, ignore_errors=True)
+    return compacted
+
+
+def _partition_filter(config: TableConfig, partitions: List[Tuple]) -> Tuple[str, List]:
+    """Điều kiện WHERE (và tham số) chọn đúng các partition đã cho."""
+    condition = " AND ".join(f"{col} = ?" for col in config.partition_cols)
+    where_clause = " OR ".join(f"({condition})" for _ in partitions)
+    return where_clause, [value for key in partitions for value in key]
+
+
+def refresh_duckdb_partitions(
+    conn: DuckDBPyConnection, config: TableConfig, partitions: List[Tuple]
+):
+    """
+    Nạp lại vào DuckDB chỉ những partition vừa có dữ liệu mới.
+
+    Dùng cho các lô nhỏ (micro-batch) của chế độ daemon và cho bảng có
+    `primary_key`: thay vì đọc lại toàn bộ staging area, dữ liệu của những
+    partition bị ảnh hưởng được đọc (đã khử trùng lặp) vào một bảng tạm trước,
+    rồi các dòng cũ được xóa và thay bằng bảng tạm đó trong cùng một
+    transaction ngắn. Thao tác này lặp lại được (idempotent).
+
+    Nếu bảng chưa tồn tại hoặc không có partition, quay về
+    `refresh_duckdb_table`. Partition đang ở tầng lạnh (dữ liệu đến muộn hoặc
+    backfill) được nạp vào bảng DuckDB và trở lại tầng nóng.
+
+    Args:
+        conn: Kết nối DuckDB.
+        config: Cấu hình của bảng.
+        partitions: Các partition cần nạp lại, theo thứ tự của `partition_cols`.
+    """
+    if not partitions:
+        logger.info(
+            f"Bỏ qua refresh DuckDB cho '{config.dest_table}' vì không có dữ liệu mới."
+        )
+        return
+
+    dest_table = config.dest_table
+    table_exists = conn.execute(
+        "SELECT count(*) FROM information_schema.tables WHERE table_name = ?",
+        [dest_table],
+    ).fetchone()[0]
+    if not config.partition_cols or not table_exists:
+        refresh_duckdb_table(conn, config, True, changed_partitions=partitions)
+        return
+
+    staging_dir = BASE_DATA_PATH / dest_table
+    # Partition không còn tệp nào (ví dụ sau backfill một tháng rỗng) chỉ bị xóa.
+    files = ", ".join(
+        f"'{path}/*.parquet'"
+        for path in (
+            staging_dir / _partition_dir(config.partition_cols, key)
+            for key in partitions
+        )
+        if any(path.glob("*.parquet"))
+    )
+    where_clause, params = _partition_filter(config, partitions)
+    released = [key for key in cold_partitions(config) if key in set(partitions)]
+    staging_table = f"{dest_table}_partitions"
+
+    in_transaction = False
+    try:
+        if files:
+            conn.execute(
+                f"CREATE OR REPLACE TEMP TABLE {staging_table} AS "
+                f"{_select_parquet(config, f'[{files}]')};"
+            )
+        conn.execute("BEGIN TRANSACTION;")
+        in_transaction = True
+        changed_since = None
+        if config.outliers is not None:
+            changed_since = conn.execute(
+                f"SELECT min({config.final_timestamp_col}) FROM {dest_table} "
+                f"WHERE {where_clause};",
+                params,
+            ).fetchone()[0]
+        conn.execute(f"DELETE FROM {dest_table} WHERE {where_clause};", params)
+        if files:
+            conn.execute(
+                f"INSERT INTO {dest_table} BY NAME SELECT * FROM {staging_table};"
+            )
+        outliers.flag_outliers(
+            conn,
+            config,
+            changed_since=changed_since,
+            context=_cold_source(config, exclude=partitions),
+        )
+        if config.hot_months is not None:
+            create_tiered_view(conn, config, exclude=released)
+        conn.execute("COMMIT;")
+        logger.info(
+            f"Đã nạp lại {len(partitions)} partition của bảng '{dest_table}'."
+        )
+        _release_cold(config, released)
+    except Exception as e:
+        logger.error(
+            f"Lỗi khi nạp lại partition của bảng DuckDB '{dest_table}': {e}",
+            exc_info=True,
+        )
+        if in_transaction:
+            conn.execute("ROLLBACK;")
+            logger.warning(f"Đã ROLLBACK transaction cho bảng '{dest_table}'.")
+        raise
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {staging_table};")
+
+
+def move_to_cold(
+    conn: DuckDBPyConnection, config: TableConfig, partitions: List[Tuple]
+) -> int:
+    """
+    Chuyển các partition từ bảng DuckDB sang tầng lạnh.
+
+    Dữ liệu của mỗi partition (đã khử trùng lặp và tính outlier) được ghi
+    thành Parquet đã sắp xếp trong `data/.tiering/`, rồi đổi tên vào
+    `data/cold/`. Sau đó các dòng bị xóa khỏi bảng và view `<bảng>_all` được
+    tạo lại trong cùng một transaction, nên người đọc view không thấy dữ liệu
+    bị thiếu hay trùng lặp. Nếu có lỗi, các thư mục lạnh vừa ghi được trả lại
+    (`snapshots.retire`).
+
+    Args:
+        conn: Kết nối DuckDB (ghi).
+        config: Cấu hình của bảng (cần `hot_months`).
+        partitions: Các partition cần chuyển.
+
+    Returns:
+        Số dòng đã chuyển.
+    """
+    if not partitions:
+        return 0
+    dest_table = config.dest_table
+    cold_root = COLD_DATA_PATH / dest_table
+    work_path = BASE_DATA_PATH / ".tiering" / dest_table
+    sort_cols = [
+        col for col in config.storage.sort_by if col not in config.partition_cols
+    ] or [config.final_timestamp_col]
+    condition = " AND ".join(f"{col} = ?" for col in config.partition_cols)
+
+    written: List[Tuple] = []
+    rows = 0
+    in_transaction = False
+    try:
+        for key in partitions:
+            table = conn.execute(
+                f"SELECT * EXCLUDE ({', '.join(config.partition_cols)}) "
+                f"FROM {dest_table} WHERE {condition} "
+                f"ORDER BY {', '.join(sort_cols)}",
+                list(key),
+            ).arrow()
+            if table.num_rows == 0:
+                continue
+            relative = _partition_dir(config.partition_cols, key)
+            new_path = work_path / relative
+            if new_path.exists():
+                shutil.rmtree(new_path)
+            writer = _PartitionWriter(new_path, config.storage)
+            for batch in table.to_batches(max_chunksize=writer.row_group_size):
+                writer.write(pa.Table.from_batches([batch], schema=table.schema))
+            writer.close()
+            backup_path = work_path / f"{relative}.old"
+            _swap_directory(new_path, cold_root / relative, backup_path)
+            snapshots.unretire(cold_root / relative)
+            written.append(key)
+            rows += table.num_rows
+
+        where_clause, params = _partition_filter(config, partitions)
+        conn.execute("BEGIN TRANSACTION;")
+        in_transaction = True
+        conn.execute(f"DELETE FROM {dest_table} WHERE {where_clause};", params)
+        create_tiered_view(conn, config)
+        conn.execute("COMMIT;")
+    except Exception:
+        if in_transaction:
+            conn.execute("ROLLBACK;")
+        snapshots.retire(
+            cold_root / _partition_dir(config.partition_cols, key) for key in written
+        )
+        raise
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+    logger.info(
+        f"Đã chuyển {len(written)} partition ({rows:,} dòng) của '{dest_table}' "
+        f"sang tầng lạnh."
+    )
+    return rows
+
+
+def move_to_hot(
+    conn: DuckDBPyConnection, config: TableConfig, partitions: List[Tuple]
+) -> int:
+    """
+    Nạp lại các partition lạnh vào bảng DuckDB rồi xóa chúng khỏi tầng lạnh.
+
+    Args:
+        conn: Kết nối DuckDB (ghi).
+        config: Cấu hình của bảng (cần `hot_months`).
+        partitions: Các partition lạnh cần chuyển.
+
+    Returns:
+        Số dòng đã chuyển.
+    """
+    cold = set(cold_partitions(config))
+    partitions = [key for key in partitions if key in cold]
+    if not partitions:
+        return 0
+    dest_table = config.dest_table
+    cold_root = (COLD_DATA_PATH / dest_table).resolve()
+    files = ", ".join(
+        f"'{cold_root / _partition_dir(config.partition_cols, key)}/*.parquet'"
+        for key in partitions
+    )
+    try:
+        conn.execute("BEGIN TRANSACTION;")
+        rows = conn.execute(
+            f"INSERT INTO {dest_table} BY NAME "
+            f"SELECT * FROM read_parquet([{files}], {_hive_options(config)});"
+        ).fetchone()[0]
+        create_tiered_view(conn, config, exclude=partitions)
+        conn.execute("COMMIT;")
+    except Exception:
+        conn.execute("ROLLBACK;")
+        raise
+    _release_cold(config, partitions)
+    logger.info(
+        f"Đã chuyển {len(partitions)} partition ({rows:,} dòng) của '{dest_table}' "
+        f"về tầng nóng."
+    )
+    return rows
@@ -0,0 +1,212 @@
+"""
+Module tra cứu chênh lệch thời gian (time offsets) của thiết bị theo thời gian.
+
+Mỗi cửa hàng trong `time_offsets.yaml` có thể có nhiều mức chênh lệch, mỗi
+mức áp dụng trong khoảng [effective_from, effective_to) tính theo đồng hồ của
+thiết bị (timestamp gốc ở nguồn). Khi đồng hồ của một bộ đếm được chỉnh lại,
+chỉ cần đóng khoảng cũ và thêm khoảng mới thay vì sửa số phút của toàn bộ
+lịch sử.
+
+Các khoảng của một cửa hàng được biên dịch thành một hàm bậc thang: mảng các
+mốc (breakpoint) đã sắp xếp và số phút của từng đoạn. Việc tra cứu cho cả
+chunk được vector hóa: các dòng được nhóm theo cửa hàng và `np.searchsorted`
+tìm đoạn chứa timestamp của từng dòng trên các mốc của cửa hàng đó.
+
+Module cũng so sánh hai phiên bản cấu hình để tìm các khoảng thời gian mà
+offset thay đổi (`changed_windows`), giúp lệnh `reapply-offsets` chỉ dựng lại
+các partition bị ảnh hưởng.
+"""
+
+import logging
+import shutil
+from dataclasses import dataclass
+from datetime import datetime
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+import yaml
+
+from ..core.config import TimeOffsetPeriod, parse_time_offsets, settings
+
+logger = logging.getLogger(__name__)
+
+# Mốc đầu tiên của mọi hàm bậc thang (nhỏ hơn mọi timestamp, bằng giá trị NaT).
+_MIN_NS = np.iinfo(np.int64).min
+
+# Bản sao cấu hình offset đã được dùng để dựng dữ liệu hiện tại.
+APPLIED_OFFSETS_FILE = settings.DATA_DIR / "time_offsets.applied.yaml"
+
+
+def _to_ns(value: Optional[datetime]) -> int:
+    """Chuyển mốc thời gian sang nano giây (None = không giới hạn phía trước)."""
+    return _MIN_NS if value is None else pd.Timestamp(value).value
+
+
+@dataclass(frozen=True)
+class StoreTimeline:
+    """
+    Hàm bậc thang số phút chênh lệch của một cửa hàng.
+
+    Đoạn thứ i bắt đầu tại `edges[i]` (nano giây, bao gồm) và kéo dài tới mốc
+    kế tiếp; `minutes[i]` là số phút chênh lệch của đoạn đó (0 nếu không có
+    khoảng hiệu lực nào).
+    """
+
+    edges: np.ndarray
+    minutes: np.ndarray
+
+    @classmethod
+    def from_periods(cls, periods: Iterable[TimeOffsetPeriod]) -> "StoreTimeline":
+        """Biên dịch các khoảng hiệu lực (đã sắp xếp, không chồng nhau)."""
+        edges, minutes = [_MIN_NS], [0]
+        for period in periods:
+            start = _to_ns(period.effective_from)
+            if start == edges[-1]:
+                minutes[-1] = period.minutes
+            else:
+                edges.append(start)
+                minutes.append(period.minutes)
+            if period.effective_to is not None:
+                edges.append(_to_ns(period.effective_to))
+                minutes.append(0)
+        return cls(np.array(edges, dtype=np.int64), np.array(minutes, dtype=np.int64))
+
+    def at(self, timestamps_ns: np.ndarray) -> np.ndarray:
+        """Số phút chênh lệch tại từng timestamp (nano giây)."""
+        segments = np.searchsorted(self.edges, timestamps_ns, side="right") - 1
+        return self.minutes[segments]
+
+
+class OffsetSchedule:
+    """Lịch chênh lệch thời gian của tất cả các cửa hàng trong một bảng nguồn."""
+
+    def __init__(self, periods_by_store: Dict[int, List[TimeOffsetPeriod]]):
+        self.timelines: Dict[int, StoreTimeline] = {
+            int(store_id): StoreTimeline.from_periods(periods)
+            for store_id, periods in sorted(periods_by_store.items())
+        }
+        self._store_ids = np.fromiter(self.timelines, dtype=np.int64)
+
+    def minutes(self, store_ids: np.ndarray, timestamps: np.ndarray) -> np.ndarray:
+        """
+        Tra cứu số phút chênh lệch cho từng dòng.
+
+        Args:
+            store_ids: Mã cửa hàng của từng dòng (int64).
+            timestamps: Timestamp gốc của từng dòng (`datetime64[ns]`, NaT được
+                chấp nhận).
+
+        Returns:
+            Mảng int64 số phút chênh lệch, 0 cho cửa hàng không có cấu hình.
+        """
+        result = np.zeros(len(store_ids), dtype=np.int64)
+        if not len(result) or not len(self._store_ids):
+            return result
+
+        timestamps_ns = timestamps.astype("datetime64[ns]").view(np.int64)
+        # Nhóm các dòng theo cửa hàng một lần, rồi tra cứu từng nhóm.
+        order = np.argsort(store_ids, kind="stable")
+        sorted_ids = store_ids[order]
+        starts = np.searchsorted(sorted_ids, self._store_ids, side="left")
+        ends = np.searchsorted(sorted_ids, self._store_ids, side="right")
+        for timeline, start, end in zip(self.timelines.values(), starts, ends):
+            if start == end:
+                continue
+            rows = order[start:end]
+            result[rows] = timeline.at(timestamps_ns[rows])
+        return result
+
+    def bounds(self) -> Tuple[int, int]:
+        """Số phút chênh lệch nhỏ nhất và lớn nhất (kể cả 0) trong lịch."""
+        values = [0, *(int(m) for t in self.timelines.values() for m in t.minutes)]
+        return min(values), max(values)
+
+
+@lru_cache(maxsize=None)
+def get_schedule(table_key: str) -> Optional[OffsetSchedule]:
+    """
+    Lịch chênh lệch của một bảng nguồn theo cấu hình hiện tại.
+
+    Args:
+        table_key: Tên bảng nguồn không có schema (ví dụ: `num_crowd`).
+
+    Returns:
+        `OffsetSchedule`, hoặc None nếu bảng không có cấu hình offset.
+    """
+    periods = settings.TIME_OFFSETS.get(table_key)
+    return OffsetSchedule(periods) if periods else None
+
+
+@dataclass(frozen=True)
+class OffsetChange:
+    """
+    Một khoảng thời gian gốc [start, end) mà offset của cửa hàng đã thay đổi.
+
+    `start`/`end` là None nếu không giới hạn. `min_minutes`/`max_minutes` là
+    số phút nhỏ nhất/lớn nhất (cũ và mới) trong khoảng, dùng để suy ra các
+    partition (theo thời gian đã điều chỉnh) bị ảnh hưởng.
+    """
+
+    store_id: int
+    start: Optional[pd.Timestamp]
+    end: Optional[pd.Timestamp]
+    min_minutes: int
+    max_minutes: int
+
+
+def changed_windows(
+    old: Optional[OffsetSchedule], new: Optional[OffsetSchedule]
+) -> List[OffsetChange]:
+    """
+    So sánh hai lịch chênh lệch và trả về các khoảng có offset khác nhau.
+
+    Các đoạn liền kề cùng thay đổi được gộp lại thành một khoảng.
+    """
+    empty = StoreTimeline.from_periods([])
+    old_timelines = old.timelines if old else {}
+    new_timelines = new.timelines if new else {}
+
+    changes = []
+    for store_id in sorted(set(old_timelines) | set(new_timelines)):
+        before = old_timelines.get(store_id, empty)
+        after = new_timelines.get(store_id, empty)
+        edges = np.union1d(before.edges, after.edges)
+        old_minutes, new_minutes = before.at(edges), after.at(edges)
+        differs = old_minutes != new_minutes
+
+        i = 0
+        while i < len(edges):
+            if not differs[i]:
+                i += 1
+                continue
+            j = i
+            while j + 1 < len(edges) and differs[j + 1]:
+                j += 1
+            minutes = np.concatenate([old_minutes[i : j + 1], new_minutes[i : j + 1]])
+            changes.append(
+                OffsetChange(
+                    store_id=store_id,
+                    start=None if edges[i] == _MIN_NS else pd.Timestamp(edges[i]),
+                    end=pd.Timestamp(edges[j + 1]) if j + 1 < len(edges) else None,
+                    min_minutes=int(minutes.min()),
+                    max_minutes=int(minutes.max()),
+                )
+            )
+            i = j + 1
+    return changes
+
+
+def load_offsets_file(path: Path) -> Dict[str, Dict[int, List[TimeOffsetPeriod]]]:
+    """Đọc và chuẩn hóa một tệp offset (cùng định dạng `time_offsets.yaml`)."""
+    with path.open("r", encoding="utf-8") as f:
+        return parse_time_offsets(yaml.safe_load(f) or {})
+
+
+def save_applied_offsets():
+    """Ghi nhận cấu hình offset hiện tại là cấu hình đã dùng để dựng dữ liệu."""
+    APPLIED_OFFSETS_FILE.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(settings.TIME_OFFSETS_PATH, APPLIED_OFFSETS_FILE)
+    logger.debug(f"Đã lưu cấu hình offset đã áp dụng vào '{APPLIED_OFFSETS_FILE}'.")
@@ -0,0 +1,262 @@
+"""
+Module phát hiện và hiệu chỉnh giá trị bất thường (outlier) ngay khi nạp dữ liệu.
+
+Thay vì áp một ngưỡng toàn cục trong VIEW ở mỗi truy vấn, mỗi dòng được so
+với baseline bền vững (median và MAD) của cùng cửa hàng và cùng giờ trong
+ngày trong một cửa sổ trượt các ngày trước đó (xem `OutlierOptions`). Kết
+quả được lưu thành các cột của bảng DuckDB: giá trị đã hiệu chỉnh (ví dụ
+`in_count`) và cờ `is_outlier`, nên truy vấn chỉ việc đọc các cột này.
+
+Thống kê trượt được DuckDB tính vector hóa bằng hàm cửa sổ. Việc tính toán
+là tăng dần: các dòng không đổi giữ lại kết quả của lần nạp trước, chỉ các
+dòng từ thời điểm sớm nhất có thay đổi trở về sau được tính lại (cùng các
+dòng trong cửa sổ phía trước làm ngữ cảnh, kể cả dòng đã chuyển sang tầng
+lạnh nếu bảng được phân tầng).
+"""
+
+import logging
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import pandas as pd
+from duckdb import DuckDBPyConnection
+
+from ..core.config import OutlierOptions, TableConfig, settings
+
+logger = logging.getLogger(__name__)
+
+OUTLIER_FLAG_COL = "is_outlier"
+
+# Hệ số để MAD tương đương độ lệch chuẩn với dữ liệu phân phối chuẩn.
+_MAD_SCALE = 1.4826
+
+_FLAGS_TABLE = "_outlier_flags"
+
+
+def _column_types(conn: DuckDBPyConnection, table: str) -> Dict[str, str]:
+    """Tên và kiểu các cột của một bảng DuckDB (rỗng nếu bảng không tồn tại)."""
+    rows = conn.execute(
+        "SELECT column_name, data_type FROM information_schema.columns "
+        "WHERE table_name = ? ORDER BY ordinal_position",
+        [table],
+    ).fetchall()
+    return dict(rows)
+
+
+def _derived_columns(options: OutlierOptions) -> List[str]:
+    """Các cột do module này ghi vào bảng."""
+    return [*options.columns.values(), OUTLIER_FLAG_COL]
+
+
+def _fallback_value(raw: str, col_type: str) -> str:
+    """Giá trị thay thế theo quy tắc toàn cục (khi chưa đủ lịch sử)."""
+    scale = settings.OUTLIER_SCALE_RATIO
+    if scale > 0:
+        return f"CAST(ROUND({raw} * {scale}, 0) AS {col_type})"
+    return f"CAST(1 AS {col_type})"
+
+
+def _carry_over(
+    conn: DuckDBPyConnection, config: TableConfig, table: str, previous: str
+):
+    """
+    Giữ lại kết quả của lần nạp trước cho các dòng không thay đổi.
+
+    Dòng được coi là không đổi nếu khớp `primary_key` và các cột gốc.
+    """
+    options = config.outliers
+    derived = _derived_columns(options)
+    matches = [
+        f"{table}.{col} IS NOT DISTINCT FROM p.{col}"
+        for col in [*config.primary_key, *options.columns]
+    ]
+    conn.execute(
+        f"UPDATE {table} SET {', '.join(f'{col} = p.{col}' for col in derived)} "
+        f"FROM {previous} AS p WHERE {' AND '.join(matches)}"
+    )
+
+
+def _recompute_from(
+    conn: DuckDBPyConnection,
+    config: TableConfig,
+    table: str,
+    col_types: Dict[str, str],
+    since: pd.Timestamp,
+    context: Optional[str] = None,
+) -> int:
+    """
+    Tính lại cờ và giá trị hiệu chỉnh cho các dòng có timestamp >= `since`.
+
+    Các dòng của `context` (nếu có) chỉ tham gia vào thống kê trượt.
+    """
+    options = config.outliers
+    ts_col = config.final_timestamp_col
+    partition_by = [*options.group_by]
+    if options.by_hour:
+        partition_by.append(f"hour({ts_col})")
+    partition_clause = (
+        f"PARTITION BY {', '.join(partition_by)} " if partition_by else ""
+    )
+
+    stats, checks, corrected = [], [], []
+    for raw, target in options.columns.items():
+        limit = (
+            f"{raw}_median + {options.threshold * _MAD_SCALE} "
+            f"* GREATEST({raw}_mad, {options.min_mad})"
+        )
+        outlier = (
+            f"CASE WHEN samples >= {options.min_samples} THEN {raw} > {limit} "
+            f"ELSE {raw} > {settings.OUTLIER_THRESHOLD} END"
+        )
+        replacement = (
+            f"CASE WHEN samples >= {options.min_samples} "
+            f"THEN CAST(ROUND({raw}_median, 0) AS {col_types[raw]}) "
+            f"ELSE {_fallback_value(raw, col_types[raw])} END"
+        )
+        stats += [
+            f"median({raw}) OVER w AS {raw}_median",
+            f"mad({raw}) OVER w AS {raw}_mad",
+        ]
+        checks.append(f"coalesce({outlier}, false)")
+        corrected.append(
+            f"CASE WHEN coalesce({outlier}, false) THEN {replacement} "
+            f"ELSE {raw} END AS {target}"
+        )
+
+    selected = ", ".join([ts_col, *options.group_by, *options.columns])
+    window_start = (since - pd.Timedelta(days=options.window_days)).to_pydatetime()
+    params = [window_start]
+    context_rows = ""
+    if context is not None:
+        context_rows = (
+            f"UNION ALL SELECT NULL, {selected} FROM {context} WHERE {ts_col} >= ?"
+        )
+        params.append(window_start)
+    conn.execute(
+        f"""
+        CREATE OR REPLACE TEMP TABLE {_FLAGS_TABLE} AS
+        WITH scoped AS (
+            SELECT rowid AS row_id, {selected}
+            FROM {table}
+            WHERE {ts_col} >= ?
+            {context_rows}
+        ),
+        stats AS (
+            SELECT *, count({ts_col}) OVER w AS samples, {', '.join(stats)}
+            FROM scoped
+            WINDOW w AS (
+                {partition_clause}ORDER BY {ts_col}
+                RANGE BETWEEN INTERVAL {options.window_days} DAYS PRECEDING
+                AND CURRENT ROW EXCLUDE CURRENT ROW
+            )
+        )
+        SELECT
+            row_id,
+            {', '.join(corrected)},
+            ({' OR '.join(checks)}) AS {OUTLIER_FLAG_COL}
+        FROM stats
+        WHERE {ts_col} >= ? AND row_id IS NOT NULL
+        """,
+        [*params, since.to_pydatetime()],
+    )
+    try:
+        assignments = ", ".join(f"{col} = f.{col}" for col in _derived_columns(options))
+        conn.execute(
+            f"UPDATE {table} SET {assignments} FROM {_FLAGS_TABLE} AS f "
+            f"WHERE {table}.rowid = f.row_id"
+        )
+        return conn.execute(f"SELECT count(*) FROM {_FLAGS_TABLE}").fetchone()[0]
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {_FLAGS_TABLE}")
+
+
+def flag_outliers(
+    conn: DuckDBPyConnection,
+    config: TableConfig,
+    table: Optional[str] = None,
+    previous: Optional[str] = None,
+    changed_since: Optional[datetime] = None,
+    context: Optional[str] = None,
+) -> int:
+    """
+    Cập nhật các cột hiệu chỉnh và cờ `is_outlier` của một bảng DuckDB.
+
+    Các dòng chưa có kết quả (mới nạp) được tính lại cùng mọi dòng phía sau
+    chúng, vì baseline của các dòng đó có thể đã thay đổi.
+
+    Args:
+        conn: Kết nối DuckDB (ghi).
+        config: Cấu hình của bảng (không làm gì nếu không có `outliers`).
+        table: Bảng cần cập nhật (mặc định: `dest_table`), ví dụ bảng staging
+            trước khi hoán đổi.
+        previous: Bảng của lần nạp trước để giữ lại kết quả của các dòng không
+            đổi (cần `primary_key`).
+        changed_since: Timestamp sớm nhất của các dòng đã bị xóa hoặc thay
+            thế, nếu biết (ví dụ khi nạp lại partition).
+        context: Nguồn dữ liệu chỉ dùng làm ngữ cảnh cho thống kê trượt (biểu
+            thức sau FROM, ví dụ `read_parquet` của tầng lạnh).
+
+    Returns:
+        Số dòng đã được tính lại.
+    """
+    options = config.outliers
+    if options is None:
+        return 0
+    table = table or config.dest_table
+    ts_col = config.final_timestamp_col
+
+    col_types = _column_types(conn, table)
+    if not col_types:
+        logger.debug(f"Bảng '{table}' chưa tồn tại, bỏ qua phát hiện outlier.")
+        return 0
+    required = [ts_col, *options.group_by, *options.columns]
+    missing = [col for col in required if col not in col_types]
+    if missing:
+        logger.warning(
+            f"Bỏ qua phát hiện outlier cho '{table}' do thiếu cột: "
+            f"{', '.join(missing)}."
+        )
+        return 0
+    for raw, target in options.columns.items():
+        conn.execute(
+            f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {target} {col_types[raw]}"
+        )
+    conn.execute(
+        f"ALTER TABLE {table} ADD COLUMN IF NOT EXISTS {OUTLIER_FLAG_COL} BOOLEAN"
+    )
+
+    derived = _derived_columns(options)
+    previous_types = _column_types(conn, previous) if previous else {}
+    can_carry_over = bool(config.primary_key) and all(
+        col in previous_types for col in derived
+    )
+    if can_carry_over:
+        _carry_over(conn, config, table, previous)
+
+    since = conn.execute(
+        f"SELECT min({ts_col}) FROM {table} WHERE {OUTLIER_FLAG_COL} IS NULL"
+    ).fetchone()[0]
+    if changed_since is not None:
+        since = min(since, changed_since) if since is not None else changed_since
+    if since is None:
+        logger.debug(f"Không có dòng nào của '{table}' cần tính lại outlier.")
+        return 0
+    since = pd.Timestamp(since)
+
+    if can_carry_over:
+        # Dòng bị xóa khỏi phần đã giữ lại cũng làm thay đổi baseline phía sau.
+        counts = [
+            conn.execute(
+                f"SELECT count(*) FROM {name} WHERE {ts_col} < ?",
+                [since.to_pydatetime()],
+            ).fetchone()[0]
+            for name in (table, previous)
+        ]
+        if counts[0] != counts[1]:
+            since = pd.Timestamp(
+                conn.execute(f"SELECT min({ts_col}) FROM {table}").fetchone()[0]
+            )
+
+    rows = _recompute_from(conn, config, table, col_types, since, context)
+    logger.info(f"Đã tính outlier cho {rows:,} dòng của '{table}' (từ {since}).")
+    return rows
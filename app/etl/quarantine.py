@@ -0,0 +1,141 @@
+"""
+Module quản lý khu vực cách ly (quarantine / Dead-Letter Queue) của ETL.
+
+Khi một chunk có dòng vi phạm ràng buộc xác thực, chỉ những dòng đó bị tách
+ra và ghi nguyên vẹn (toàn bộ các cột sau biến đổi, kèm lý do bị loại) vào
+`data/rejected/<dest_table>/`, còn các dòng hợp lệ tiếp tục được nạp. Sau khi
+sửa dữ liệu hoặc schema, lệnh `cli.py reprocess-rejected` đọc lại các tệp
+này và nạp những dòng đã hợp lệ mà không cần trích xuất lại từ nguồn.
+"""
+
+import logging
+from pathlib import Path
+from typing import Iterator, List, Tuple, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from ..core.config import TableConfig, settings
+
+logger = logging.getLogger(__name__)
+
+REASON_COLUMN = "_rejected_reason"
+REJECTED_AT_COLUMN = "_rejected_at"
+
+
+def get_quarantine_path(config: TableConfig) -> Path:
+    """Thư mục cách ly của một bảng đích."""
+    return settings.DATA_DIR / "rejected" / config.dest_table
+
+
+def _row_reasons(failure_cases: pd.DataFrame, labels: np.ndarray) -> List[str]:
+    """
+    Tổng hợp lý do bị loại cho từng dòng từ `failure_cases`.
+
+    Lỗi ở cấp độ dòng được gom theo nhãn dòng; lỗi ở cấp độ schema (không có
+    nhãn dòng) được gắn cho mọi dòng bị loại.
+    """
+    descriptions = (
+        failure_cases["column"].astype(str) + ":" + failure_cases["check"].astype(str)
+    )
+    has_label = failure_cases["index"].notna()
+    schema_reasons = "; ".join(descriptions[~has_label].unique())
+
+    row_reasons = (
+        descriptions[has_label]
+        .groupby(failure_cases.loc[has_label, "index"].to_numpy())
+        .agg(lambda items: "; ".join(dict.fromkeys(items)))
+    )
+    reasons = pd.Series(labels).map(row_reasons).fillna("")
+    if schema_reasons:
+        reasons = (reasons + "; " + schema_reasons).str.strip("; ")
+    return reasons.tolist()
+
+
+class QuarantineWriter:
+    """
+    Ghi các dòng bị loại của một lần chạy vào khu vực cách ly.
+
+    Một instance được dùng cho tất cả các chunk của một bảng trong một lần
+    chạy và đếm tổng số dòng bị cách ly (`rejected_rows`).
+    """
+
+    def __init__(self, config: TableConfig):
+        self.config = config
+        self.dest_path = get_quarantine_path(config)
+        self.rejected_rows = 0
+        self._file_seq = 0
+
+    def write(
+        self,
+        rows: Union[pd.DataFrame, pa.Table],
+        failure_cases: pd.DataFrame,
+        labels: np.ndarray,
+    ):
+        """
+        Ghi các dòng bị loại (đầy đủ các cột) kèm lý do vào tệp Parquet mới.
+
+        Args:
+            rows: Các dòng bị loại.
+            failure_cases: Báo cáo lỗi theo định dạng của Pandera.
+            labels: Nhãn (pandas) hoặc vị trí (Arrow) của các dòng trong chunk
+                gốc, dùng để ghép với cột `index` của `failure_cases`.
+        """
+        if len(rows) == 0:
+            return
+
+        table = (
+            pa.Table.from_pandas(rows, preserve_index=False)
+            if isinstance(rows, pd.DataFrame)
+            else rows
+        )
+        rejected_at = pd.Timestamp.now()
+        table = table.append_column(
+            REASON_COLUMN, pa.array(_row_reasons(failure_cases, labels), pa.string())
+        ).append_column(
+            REJECTED_AT_COLUMN,
+            pa.array([rejected_at] * table.num_rows, pa.timestamp("us")),
+        )
+
+        self._file_seq += 1
+        self.rejected_rows += table.num_rows
+        file_name = (
+            f"rejected_{rejected_at.strftime('%Y%m%d_%H%M%S_%f')}"
+            f"_{self._file_seq:04d}.parquet"
+        )
+
+        self.dest_path.mkdir(parents=True, exist_ok=True)
+        file_path = self.dest_path / file_name
+        try:
+            pq.write_table(table.replace_schema_metadata(None), str(file_path))
+            logger.warning(
+                f"Đã cách ly {table.num_rows:,} dòng lỗi của "
+                f"'{self.config.dest_table}' tại: {file_path}"
+            )
+        except (OSError, pa.ArrowException) as e:
+            logger.error(f"Không thể lưu file dữ liệu lỗi '{file_path}': {e}")
+
+
+def iter_quarantined(config: TableConfig) -> Iterator[Tuple[Path, pd.DataFrame]]:
+    """
+    Duyệt các tệp đang bị cách ly của một bảng.
+
+    Các tệp định dạng cũ (chỉ chứa `failure_cases`, không có dòng dữ liệu
+    đầy đủ) được bỏ qua.
+
+    Yields:
+        Tuple (đường dẫn tệp, DataFrame các dòng bị cách ly, đã bỏ các cột
+        thông tin cách ly).
+    """
+    quarantine_path = get_quarantine_path(config)
+    if not quarantine_path.exists():
+        return
+
+    for file_path in sorted(quarantine_path.glob("rejected_*.parquet")):
+        df = pd.read_parquet(file_path)
+        if REASON_COLUMN not in df.columns:
+            logger.warning(f"Bỏ qua '{file_path}': tệp không chứa dòng dữ liệu đầy đủ.")
+            continue
+        yield file_path, df.drop(columns=[REASON_COLUMN, REJECTED_AT_COLUMN])
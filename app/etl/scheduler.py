@@ -0,0 +1,233 @@
+"""
+Module lập lịch chạy các bảng ETL theo đồ thị phụ thuộc (DAG).
+
+Mỗi bảng chỉ bắt đầu khi tất cả các bảng nó phụ thuộc đã xử lý thành công:
+- Nếu bảng khai báo `depends_on` trong `tables.yaml`, chỉ các bảng đó được chờ.
+- Nếu không, bảng phụ thuộc vào mọi bảng có `processing_order` nhỏ hơn, tức
+  là các bảng chạy theo từng giai đoạn của `processing_order`.
+
+Trong số các bảng sẵn sàng, bảng lớn nhất (theo dung lượng staging area) được
+chạy trước để không kéo dài thời gian của cả lần chạy. Các bảng phụ thuộc vào
+một bảng thất bại sẽ bị bỏ qua. Sau khi chạy, đường găng (critical path) –
+chuỗi phụ thuộc dài nhất theo thời gian thực tế – được báo cáo.
+"""
+
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from ..core.config import TableConfig
+from .load import BASE_DATA_PATH
+
+logger = logging.getLogger(__name__)
+
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+SKIPPED = "skipped"
+
+
+@dataclass
+class TableRun:
+    """Kết quả xử lý một bảng trong một lần chạy."""
+
+    dest_table: str
+    status: str
+    duration: float = 0.0
+    error: Optional[BaseException] = None
+
+
+def _estimate_cost(config: TableConfig) -> int:
+    """Ước lượng khối lượng công việc của một bảng bằng dung lượng staging area."""
+    staging_path = BASE_DATA_PATH / config.dest_table
+    if not staging_path.exists():
+        return 0
+    return sum(f.stat().st_size for f in staging_path.rglob("*") if f.is_file())
+
+
+def build_dependencies(table_configs: Dict[str, TableConfig]) -> Dict[str, Set[str]]:
+    """
+    Xây dựng đồ thị phụ thuộc giữa các bảng (theo tên bảng đích).
+
+    Args:
+        table_configs: Cấu hình các bảng, theo khóa trong `tables.yaml`.
+
+    Returns:
+        Dictionary ánh xạ mỗi bảng đích tới tập các bảng đích nó phụ thuộc.
+
+    Raises:
+        ValueError: Nếu `depends_on` tham chiếu bảng không tồn tại hoặc đồ thị
+            có chu trình.
+    """
+    names = {key: config.dest_table for key, config in table_configs.items()}
+    names.update(
+        {config.dest_table: config.dest_table for config in table_configs.values()}
+    )
+
+    dependencies: Dict[str, Set[str]] = {}
+    for config in table_configs.values():
+        if config.depends_on:
+            unknown = [name for name in config.depends_on if name not in names]
+            if unknown:
+                raise ValueError(
+                    f"Bảng '{config.dest_table}': 'depends_on' tham chiếu bảng "
+                    f"không tồn tại: {', '.join(unknown)}"
+                )
+            dependencies[config.dest_table] = {
+                names[name] for name in config.depends_on
+            }
+        else:
+            dependencies[config.dest_table] = {
+                other.dest_table
+                for other in table_configs.values()
+                if other.processing_order < config.processing_order
+            }
+
+    _topological_order(dependencies)  # Kiểm tra chu trình
+    return dependencies
+
+
+def _topological_order(dependencies: Dict[str, Set[str]]) -> List[str]:
+    """Sắp xếp topo các bảng, báo lỗi nếu đồ thị có chu trình."""
+    order: List[str] = []
+    remaining = {name: set(deps) for name, deps in dependencies.items()}
+    while remaining:
+        ready = sorted(name for name, deps in remaining.items() if not deps)
+        if not ready:
+            raise ValueError(
+                f"Phát hiện phụ thuộc vòng giữa các bảng: {', '.join(sorted(remaining))}"
+            )
+        for name in ready:
+            order.append(name)
+            del remaining[name]
+        for deps in remaining.values():
+            deps.difference_update(ready)
+    return order
+
+
+class TableScheduler:
+    """
+    Chạy một hàm xử lý cho từng bảng theo đồ thị phụ thuộc.
+
+    Tối đa `max_workers` bảng chạy song song. Một bảng được đưa vào chạy ngay
+    khi các bảng nó phụ thuộc hoàn tất, không cần chờ cả giai đoạn.
+    """
+
+    def __init__(self, table_configs: Dict[str, TableConfig], max_workers: int):
+        self.configs = {config.dest_table: config for config in table_configs.values()}
+        self.dependencies = build_dependencies(table_configs)
+        self.max_workers = max_workers
+        self.costs = {
+            name: _estimate_cost(config) for name, config in self.configs.items()
+        }
+        self.results: Dict[str, TableRun] = {}
+
+    def stages(self) -> List[List[str]]:
+        """Nhóm các bảng theo độ sâu trong đồ thị phụ thuộc (để ghi log kế hoạch)."""
+        depth: Dict[str, int] = {}
+        for name in _topological_order(self.dependencies):
+            depth[name] = 1 + max(
+                (depth[d] for d in self.dependencies[name]), default=-1
+            )
+        stages: List[List[str]] = [
+            [] for _ in range(max(depth.values(), default=-1) + 1)
+        ]
+        for name in sorted(depth, key=lambda n: -self.costs[n]):
+            stages[depth[name]].append(name)
+        return stages
+
+    def _skip_blocked(self, pending: Set[str]):
+        """Bỏ qua các bảng phụ thuộc (trực tiếp hoặc gián tiếp) vào bảng lỗi."""
+        changed = True
+        while changed:
+            changed = False
+            for name in sorted(pending):
+                blocked = [
+                    dep
+                    for dep in self.dependencies[name]
+                    if dep in self.results and self.results[dep].status != SUCCEEDED
+                ]
+                if blocked:
+                    pending.discard(name)
+                    self.results[name] = TableRun(name, SKIPPED)
+                    logger.warning(
+                        f"⏭️ Bỏ qua '{name}' vì bảng phụ thuộc không thành công: "
+                        f"{', '.join(blocked)}."
+                    )
+                    changed = True
+
+    def run(self, task: Callable[[TableConfig], Any]) -> Dict[str, TableRun]:
+        """
+        Chạy `task` cho mọi bảng theo thứ tự phụ thuộc.
+
+        Args:
+            task: Hàm xử lý một bảng. Bảng được coi là thất bại nếu hàm ném
+                ra exception.
+
+        Returns:
+            Kết quả của từng bảng, theo tên bảng đích.
+        """
+        self.results = {}
+        pending = set(self.configs)
+        started: Dict[str, float] = {}
+
+        for index, stage in enumerate(self.stages(), start=1):
+            logger.info(f"Giai đoạn {index}: {', '.join(stage)}")
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            in_flight: Dict[Future, str] = {}
+            while pending or in_flight:
+                self._skip_blocked(pending)
+                ready = sorted(
+                    (
+                        name
+                        for name in pending
+                        if all(
+                            dep in self.results
+                            and self.results[dep].status == SUCCEEDED
+                            for dep in self.dependencies[name]
+                        )
+                    ),
+                    key=lambda n: (-self.costs[n], n),
+                )
+                for name in ready[: self.max_workers - len(in_flight)]:
+                    pending.discard(name)
+                    started[name] = time.perf_counter()
+                    in_flight[executor.submit(task, self.configs[name])] = name
+
+                if not in_flight:
+                    break
+
+                done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = in_flight.pop(future)
+                    duration = time.perf_counter() - started[name]
+                    error = future.exception()
+                    self.results[name] = TableRun(
+                        name, FAILED if error else SUCCEEDED, duration, error
+                    )
+
+        return self.results
+
+    def critical_path(self) -> Tuple[List[str], float]:
+        """
+        Tìm chuỗi phụ thuộc có tổng thời gian xử lý dài nhất.
+
+        Returns:
+            Tuple (danh sách bảng trên đường găng, tổng thời gian tính bằng giây).
+        """
+        best: Dict[str, Tuple[float, List[str]]] = {}
+        for name in _topological_order(self.dependencies):
+            run = self.results.get(name)
+            duration = run.duration if run else 0.0
+            prefix = max(
+                (best[dep] for dep in self.dependencies[name]),
+                key=lambda item: item[0],
+                default=(0.0, []),
+            )
+            best[name] = (prefix[0] + duration, prefix[1] + [name])
+        if not best:
+            return [], 0.0
+        total, path = max(best.values(), key=lambda item: item[0])
+        return path, total
@@ -5,17 +5,32 @@ Mỗi schema tương ứng với một bảng đích trong DuckDB và hoạt đ
 "hợp đồng dữ liệu" (data contract). Việc xác thực này đảm bảo dữ liệu được
 nạp vào kho luôn tuân thủ đúng định dạng, kiểu dữ liệu và các ràng buộc,
 giúp duy trì chất lượng và tính toàn vẹn của dữ liệu.
+
+Kiểu dữ liệu được chọn gọn nhất có thể: số đếm và mã cửa hàng dùng `int32`,
+cột partition dùng `int16`, chuỗi dùng `string[pyarrow]` (lưu trong bộ đệm
+Arrow thay vì từng đối tượng Python). Các kiểu này được giữ nguyên khi ghi
+Parquet và khi nạp vào DuckDB (`INTEGER`, `SMALLINT`, `VARCHAR`).
 """
 
+from functools import lru_cache
+from typing import Dict, Optional
+
+import pandas as pd
 import pandera.pandas as pa
-from pandera.typing import DateTime, Int, Series, String
+import pyarrow
+from pandera.typing import DateTime, Int16, Int32, Int64, Series
+
+# Tham số cho kiểu `pd.StringDtype`: chuỗi được lưu bằng Arrow.
+ARROW_STRING = {"storage": "pyarrow"}
 
 
 class DimStoresSchema(pa.DataFrameModel):
     """Schema xác thực cho bảng `dim_stores`."""
 
-    store_id: Series[Int] = pa.Field(unique=True, nullable=False)
-    store_name: Series[String] = pa.Field(nullable=False)
+    store_id: Series[Int32] = pa.Field(unique=True, nullable=False)
+    store_name: Series[pd.StringDtype] = pa.Field(
+        nullable=False, dtype_kwargs=ARROW_STRING
+    )
 
     class Config:
         strict = True  # Đảm bảo DataFrame không có cột nào thừa so với schema.
@@ -27,14 +42,16 @@ class FactTrafficSchema(pa.DataFrameModel):
 
     recorded_at: Series[DateTime] = pa.Field(nullable=False)
     # ge=0: đảm bảo giá trị lớn hơn hoặc bằng 0.
-    visitors_in: Series[Int] = pa.Field(ge=0, default=0)
-    visitors_out: Series[Int] = pa.Field(ge=0, default=0)
-    device_position: Series[String] = pa.Field(nullable=True)
-    store_id: Series[Int] = pa.Field(nullable=False)
+    visitors_in: Series[Int32] = pa.Field(ge=0, default=0)
+    visitors_out: Series[Int32] = pa.Field(ge=0, default=0)
+    device_position: Series[pd.StringDtype] = pa.Field(
+        nullable=True, dtype_kwargs=ARROW_STRING
+    )
+    store_id: Series[Int32] = pa.Field(nullable=False)
 
     # Các cột partition được thêm vào trong quá trình transform.
-    year: Series[Int]
-    month: Series[Int]
+    year: Series[Int16]
+    month: Series[Int16]
 
     class Config:
         strict = True
@@ -44,16 +61,18 @@ class FactTrafficSchema(pa.DataFrameModel):
 class FactErrorsSchema(pa.DataFrameModel):
     """Schema xác thực cho bảng `fact_errors`."""
 
-    log_id: Series[Int] = pa.Field(unique=True, nullable=False)
-    store_id: Series[Int] = pa.Field(nullable=False)
-    device_code: Series[Int] = pa.Field(nullable=True)
+    log_id: Series[Int64] = pa.Field(unique=True, nullable=False)
+    store_id: Series[Int32] = pa.Field(nullable=False)
+    device_code: Series[Int32] = pa.Field(nullable=True)
     logged_at: Series[DateTime] = pa.Field(nullable=False)
-    error_code: Series[Int] = pa.Field(nullable=True)
-    error_message: Series[String] = pa.Field(nullable=True)
+    error_code: Series[Int32] = pa.Field(nullable=True)
+    error_message: Series[pd.StringDtype] = pa.Field(
+        nullable=True, dtype_kwargs=ARROW_STRING
+    )
 
     # Các cột partition được thêm vào trong quá trình transform.
-    year: Series[Int]
-    month: Series[Int]
+    year: Series[Int16]
+    month: Series[Int16]
 
     class Config:
         strict = True
@@ -66,3 +85,61 @@ table_schemas = {
     "fact_traffic": FactTrafficSchema,
     "fact_errors": FactErrorsSchema,
 }
+
+
+# Ánh xạ từ kiểu dữ liệu Pandera (sau khi coerce) sang kiểu Arrow tương ứng.
+_ARROW_TYPES = {
+    "int64": pyarrow.int64(),
+    "int32": pyarrow.int32(),
+    "int16": pyarrow.int16(),
+    "datetime64[ns]": pyarrow.timestamp("ns"),
+    "str": pyarrow.string(),
+    "string[pyarrow]": pyarrow.string(),
+}
+
+
+@lru_cache(maxsize=None)
+def get_pandas_dtypes(table_name: str) -> Dict[str, str]:
+    """
+    Kiểu dữ liệu pandas (sau khi coerce) của từng cột trong schema của bảng.
+
+    Args:
+        table_name: Tên bảng đích (ví dụ: `fact_traffic`).
+
+    Returns:
+        Dictionary {tên cột: kiểu dữ liệu}, rỗng nếu bảng không có schema.
+        Kết quả được cache, không được sửa đổi.
+    """
+    schema = table_schemas.get(table_name)
+    if schema is None:
+        return {}
+    return {
+        name: str(column.dtype) for name, column in schema.to_schema().columns.items()
+    }
+
+
+@lru_cache(maxsize=None)
+def get_arrow_schema(table_name: str) -> Optional[pyarrow.Schema]:
+    """
+    Dựng schema Arrow "chuẩn" cho một bảng đích từ schema Pandera của nó.
+
+    Cả hai transform engine (pandas và arrow) đều ép dữ liệu về schema này
+    trước khi ghi Parquet, nhờ đó tệp đầu ra giống hệt nhau dù đi qua
+    engine nào.
+
+    Args:
+        table_name: Tên bảng đích (ví dụ: `fact_traffic`).
+
+    Returns:
+        `pyarrow.Schema` theo đúng thứ tự cột của schema Pandera, hoặc None
+        nếu bảng không có schema.
+    """
+    schema = table_schemas.get(table_name)
+    if schema is None:
+        return None
+
+    fields = [
+        pyarrow.field(name, _ARROW_TYPES[str(column.dtype)])
+        for name, column in schema.to_schema().columns.items()
+    ]
+    return pyarrow.schema(fields)
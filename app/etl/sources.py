@@ -0,0 +1,262 @@
+"""
+Module định nghĩa các nguồn dữ liệu (source adapter) cho bước Extract.
+
+Pipeline không làm việc trực tiếp với SQL Server mà thông qua một `Source`
+với cùng ngữ nghĩa trích xuất theo chunk và incremental (theo cặp
+`timestamp_col`, `key_col`). Nguồn được chọn bằng biến `ETL_SOURCE`:
+- `sqlserver` (mặc định): MS SQL Server qua `mssql+pyodbc`.
+- `sqlite`: tệp SQLite tại `ETL_SOURCE_PATH`.
+- `duckdb`: tệp DuckDB tại `ETL_SOURCE_PATH` (khác tệp `analytics.duckdb`).
+- `parquet`: thư mục `ETL_SOURCE_PATH` chứa `<bảng>.parquet` hoặc thư mục
+  `<bảng>/` gồm nhiều tệp Parquet.
+
+Với các nguồn cục bộ, tiền tố schema (`dbo.`) của `source_table` được bỏ đi,
+nhờ đó có thể chạy toàn bộ pipeline với dữ liệu tổng hợp hoặc bản sao dữ liệu
+production mà không cần SQL Server.
+"""
+
+import logging
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Iterator, List, Optional
+
+import duckdb
+import pandas as pd
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import Engine
+
+from ..core.config import TableConfig, settings
+from . import extract
+from .extract import ChunkSizer
+from .state import Watermark
+
+logger = logging.getLogger(__name__)
+
+# Số dòng của một vector DuckDB (đơn vị của `fetch_df_chunk`).
+_DUCKDB_VECTOR_SIZE = 2048
+
+
+def _local_table_name(config: TableConfig) -> str:
+    """Tên bảng ở nguồn cục bộ: bỏ tiền tố schema (ví dụ `dbo.`)."""
+    return config.source_table.split(".")[-1]
+
+
+class Source(ABC):
+    """
+    Giao diện chung của các nguồn dữ liệu.
+
+    Các phương thức trích xuất trả về iterator của DataFrame thô (tên cột gốc
+    ở nguồn) và có thể được gọi đồng thời từ nhiều luồng.
+    """
+
+    name: str = "source"
+
+    @abstractmethod
+    def check(self):
+        """Kiểm tra kết nối tới nguồn, ném exception nếu không dùng được."""
+
+    @abstractmethod
+    def extract(
+        self, config: TableConfig, watermark: Optional[Watermark]
+    ) -> Iterator[pd.DataFrame]:
+        """
+        Trích xuất toàn bộ bảng (full-load) hoặc phần dữ liệu sau high-water mark.
+
+        Dữ liệu incremental được trả về theo thứ tự (timestamp_col, key_col).
+        """
+
+    @abstractmethod
+    def extract_range(
+        self, config: TableConfig, start: pd.Timestamp, end: pd.Timestamp
+    ) -> Iterator[pd.DataFrame]:
+        """Trích xuất các dòng có `timestamp_col` trong khoảng [start, end)."""
+
+    @abstractmethod
+    def close(self):
+        """Giải phóng kết nối tới nguồn."""
+
+
+class SqlServerSource(Source):
+    """Nguồn MS SQL Server (hoặc bất kỳ SQLAlchemy engine nào)."""
+
+    name = "sqlserver"
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    def _config(self, config: TableConfig) -> TableConfig:
+        """Cấu hình bảng dùng cho câu lệnh SQL ở nguồn này."""
+        return config
+
+    def check(self):
+        with self.engine.connect() as conn:
+            conn.execute(text("SELECT 1"))  # Ping để kiểm tra
+
+    def extract(
+        self, config: TableConfig, watermark: Optional[Watermark]
+    ) -> Iterator[pd.DataFrame]:
+        return extract.from_sql_server(self.engine, self._config(config), watermark)
+
+    def extract_range(
+        self, config: TableConfig, start: pd.Timestamp, end: pd.Timestamp
+    ) -> Iterator[pd.DataFrame]:
+        return extract.from_sql_server_range(
+            self.engine, self._config(config), start, end
+        )
+
+    def close(self):
+        self.engine.dispose()
+
+
+class SqliteSource(SqlServerSource):
+    """
+    Nguồn SQLite, dùng cùng các câu lệnh SQL với SQL Server.
+
+    SQLite chấp nhận định danh dạng `[cột]` và tham số `:tên`, chỉ cần bỏ tiền
+    tố schema của tên bảng và thay `TOP ... WITH TIES` bằng `LIMIT`
+    (`extract._page_query` tự chọn theo dialect).
+    """
+
+    name = "sqlite"
+
+    def __init__(self, path: Path):
+        if not path.exists():
+            raise FileNotFoundError(f"Không tìm thấy tệp SQLite nguồn: {path}")
+        super().__init__(create_engine(f"sqlite:///{path.resolve()}"))
+
+    def _config(self, config: TableConfig) -> TableConfig:
+        return config.model_copy(update={"source_table": _local_table_name(config)})
+
+
+class DuckDBSource(Source):
+    """
+    Nguồn DuckDB: mỗi bảng nguồn là một bảng (hoặc view) cùng tên, không schema.
+
+    Dữ liệu incremental được đọc bằng một truy vấn sắp xếp duy nhất (DuckDB
+    chạy cục bộ nên không cần phân trang) và lấy ra theo từng chunk có kích
+    thước do `ChunkSizer` tính.
+    """
+
+    name = "duckdb"
+
+    def __init__(self, path: Optional[Path] = None):
+        if path is not None and not path.exists():
+            raise FileNotFoundError(f"Không tìm thấy tệp DuckDB nguồn: {path}")
+        database = str(path.resolve()) if path is not None else ":memory:"
+        self.conn = duckdb.connect(database=database, read_only=path is not None)
+
+    def check(self):
+        self.conn.cursor().execute("SELECT 1").fetchall()
+
+    def _query(
+        self, config: TableConfig, where: str = "", params: Optional[List[Any]] = None
+    ) -> Iterator[pd.DataFrame]:
+        """Thực thi một truy vấn trên bảng nguồn và trả về từng chunk."""
+        columns = extract.source_columns(config)
+        selection = ", ".join(f'"{col}"' for col in columns) if columns else "*"
+        query = f'SELECT {selection} FROM "{_local_table_name(config)}" {where}'
+        logger.debug(f"Executing SQL: {query} with params: {params}")
+
+        # Mỗi lần trích xuất dùng một cursor riêng để an toàn giữa các luồng.
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, params or [])
+            sizer = ChunkSizer(config)
+            while True:
+                chunk = cursor.fetch_df_chunk(max(1, sizer.size // _DUCKDB_VECTOR_SIZE))
+                if chunk.empty:
+                    return
+                chunk = extract.apply_dtypes(chunk, config)
+                sizer.observe(chunk)
+                yield chunk
+        finally:
+            cursor.close()
+
+    def extract(
+        self, config: TableConfig, watermark: Optional[Watermark]
+    ) -> Iterator[pd.DataFrame]:
+        if not (config.incremental and config.timestamp_col):
+            logger.info(f"Trích xuất full-load từ '{config.source_table}'.")
+            return self._query(config)
+
+        watermark = extract.start_watermark(config, watermark)
+        logger.info(
+            f"Trích xuất incremental từ '{config.source_table}' "
+            f"với high-water-mark > ({watermark.timestamp}, {watermark.key})."
+        )
+        ts_col, key_col = config.timestamp_col, config.key_col
+        last_ts = pd.Timestamp(watermark.timestamp).to_pydatetime()
+        condition, params = f'"{ts_col}" > ?', [last_ts]
+        if key_col and watermark.key is not None:
+            condition = f'({condition} OR ("{ts_col}" = ? AND "{key_col}" > ?))'
+            params += [last_ts, watermark.key]
+        order_by = f'"{ts_col}"' + (f', "{key_col}"' if key_col else "")
+        return self._query(config, f"WHERE {condition} ORDER BY {order_by}", params)
+
+    def extract_range(
+        self, config: TableConfig, start: pd.Timestamp, end: pd.Timestamp
+    ) -> Iterator[pd.DataFrame]:
+        ts_col = config.timestamp_col
+        return self._query(
+            config,
+            f'WHERE "{ts_col}" >= ? AND "{ts_col}" < ?',
+            [start.to_pydatetime(), end.to_pydatetime()],
+        )
+
+    def close(self):
+        self.conn.close()
+
+
+class ParquetSource(DuckDBSource):
+    """
+    Nguồn là các tệp Parquet, đọc qua một DuckDB in-memory.
+
+    Bảng `dbo.num_crowd` được đọc từ `<thư mục>/num_crowd.parquet` hoặc mọi
+    tệp `*.parquet` trong `<thư mục>/num_crowd/`.
+    """
+
+    name = "parquet"
+
+    def __init__(self, directory: Path):
+        if not directory.is_dir():
+            raise FileNotFoundError(
+                f"Không tìm thấy thư mục Parquet nguồn: {directory}"
+            )
+        super().__init__()
+        self.directory = directory
+        for config in settings.TABLE_CONFIG.values():
+            table = _local_table_name(config)
+            single_file = directory / f"{table}.parquet"
+            if single_file.exists():
+                files = str(single_file.resolve())
+            elif (directory / table).is_dir():
+                files = str((directory / table).resolve() / "**" / "*.parquet")
+            else:
+                logger.warning(f"Không tìm thấy dữ liệu Parquet cho bảng '{table}'.")
+                continue
+            self.conn.execute(
+                f"CREATE VIEW \"{table}\" AS SELECT * FROM read_parquet('{files}')"
+            )
+
+
+def create_source() -> Source:
+    """
+    Khởi tạo nguồn dữ liệu theo cấu hình `ETL_SOURCE` và `ETL_SOURCE_PATH`.
+
+    Raises:
+        ValueError: Nếu nguồn cục bộ được chọn nhưng thiếu `ETL_SOURCE_PATH`.
+    """
+    kind = settings.ETL_SOURCE
+    if kind == "sqlserver":
+        return SqlServerSource(
+            create_engine(settings.db.sqlalchemy_db_uri, pool_pre_ping=True)
+        )
+
+    path = settings.ETL_SOURCE_PATH
+    if path is None:
+        raise ValueError(f"ETL_SOURCE={kind} cần cấu hình ETL_SOURCE_PATH.")
+    if kind == "sqlite":
+        return SqliteSource(path)
+    if kind == "duckdb":
+        return DuckDBSource(path)
+    return ParquetSource(path)
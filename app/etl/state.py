@@ -1,18 +1,17 @@
 """
 Module quản lý trạng thái của pipeline ETL.
 
-Chức năng chính là đọc và ghi "high-water mark" (thường là timestamp lớn
-nhất đã xử lý) cho mỗi bảng vào một tệp JSON. Điều này cho phép pipeline
+Chức năng chính là đọc và ghi "high-water mark" (cặp timestamp và khóa phụ
+của dòng cuối cùng đã xử lý) cho mỗi bảng vào một tệp JSON. Điều này cho phép pipeline
 "ghi nhớ" đã xử lý đến đâu, để trong lần chạy tiếp theo, nó chỉ cần lấy
 các bản ghi mới hơn.
 """
 
 import json
 import logging
+import os
 from pathlib import Path
-from typing import Dict
-
-import pandas as pd
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
 
 from ..core.config import settings
 
@@ -20,7 +19,7 @@ logger = logging.getLogger(__name__)
 STATE_FILE = Path(settings.STATE_FILE)
 
 
-def load_etl_state() -> Dict[str, str]:
+def load_etl_state() -> Dict[str, Any]:
     """
     Tải trạng thái ETL (high-water marks) từ tệp JSON.
 
@@ -43,55 +42,127 @@ def load_etl_state() -> Dict[str, str]:
         return {}
 
 
-def save_etl_state(state: Dict[str, str]):
+def save_etl_state(state: Dict[str, Any]):
     """
     Lưu trạng thái ETL hiện tại vào tệp JSON.
 
+    Trạng thái được ghi ra tệp tạm rồi thay thế tệp cũ bằng một lệnh đổi tên
+    (như `snapshots._write_pointer`), nên tiến trình bị dừng giữa chừng không
+    để lại tệp trạng thái bị cắt cụt.
+
     Args:
         state: Dictionary chứa trạng thái cần lưu.
     """
     try:
         STATE_FILE.parent.mkdir(parents=True, exist_ok=True)
-        with STATE_FILE.open("w", encoding="utf-8") as f:
+        temp_file = STATE_FILE.with_suffix(".tmp")
+        with temp_file.open("w", encoding="utf-8") as f:
             json.dump(state, f, indent=4, ensure_ascii=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_file, STATE_FILE)
         logger.debug(f"Trạng thái ETL đã được lưu vào: {STATE_FILE}")
     except IOError as e:
         logger.error(f"Lỗi nghiêm trọng khi ghi tệp trạng thái '{STATE_FILE}': {e}")
 
 
-def get_last_timestamp(state: Dict[str, str], table_name: str) -> str:
+class Watermark(NamedTuple):
+    """
+    High-water mark dạng khóa ghép của một bảng.
+
+    Attributes:
+        timestamp: Giá trị gốc (chưa điều chỉnh time offset) của cột
+            timestamp ở dòng cuối cùng đã xử lý.
+        key: Giá trị của cột khóa phụ (`key_col`) ở dòng đó, hoặc None nếu
+            bảng không cấu hình khóa phụ.
+    """
+
+    timestamp: str
+    key: Optional[Any] = None
+
+
+def _entry(state: Dict[str, Any], table_name: str) -> Dict[str, Any]:
+    """Bản ghi trạng thái của một bảng dưới dạng dictionary (chuyển từ định dạng cũ)."""
+    value = state.get(table_name)
+    if value is None:
+        return {}
+    if isinstance(value, str):
+        return Watermark(value)._asdict()
+    return value
+
+
+def get_watermark(state: Dict[str, Any], table_name: str) -> Watermark:
     """
     Lấy high-water mark của một bảng từ state.
 
+    Hỗ trợ cả định dạng cũ (chỉ lưu chuỗi timestamp).
+
     Args:
         state: Dictionary trạng thái ETL.
-        table_name: Tên của bảng đích cần lấy timestamp.
+        table_name: Tên của bảng đích cần lấy high-water mark.
 
     Returns:
-        Chuỗi timestamp của lần chạy thành công cuối cùng, hoặc giá trị
+        High-water mark của lần chạy thành công cuối cùng, hoặc giá trị
         mặc định nếu bảng chưa có trong state.
     """
-    return state.get(table_name, settings.ETL_DEFAULT_TIMESTAMP)
+    entry = _entry(state, table_name)
+    if "timestamp" not in entry:
+        return Watermark(settings.ETL_DEFAULT_TIMESTAMP)
+    return Watermark(entry["timestamp"], entry.get("key"))
 
 
-def update_timestamp(
-    state: Dict[str, str], table_name: str, new_timestamp: pd.Timestamp
-):
+def update_watermark(state: Dict[str, Any], table_name: str, watermark: Watermark):
     """
     Cập nhật high-water mark cho một bảng trong dictionary state.
 
     Args:
         state: Dictionary trạng thái ETL (sẽ được cập nhật tại chỗ).
         table_name: Tên của bảng đích cần cập nhật.
-        new_timestamp: Giá trị pandas.Timestamp mới.
+        watermark: High-water mark mới.
+    """
+    entry = _entry(state, table_name)
+    entry.update(watermark._asdict())
+    state[table_name] = entry
+    logger.debug(
+        f"Cập nhật high-water-mark cho '{table_name}': "
+        f"({watermark.timestamp}, {watermark.key})"
+    )
+
+
+def get_pending_partitions(state: Dict[str, Any], table_name: str) -> List[Tuple]:
+    """
+    Lấy các partition đã được checkpoint nhưng chưa nạp vào DuckDB.
+
+    Các partition này thuộc về một lần chạy bị gián đoạn; lần chạy tiếp theo
+    phải nạp lại chúng cùng với dữ liệu mới.
+
+    Args:
+        state: Dictionary trạng thái ETL.
+        table_name: Tên của bảng đích.
+
+    Returns:
+        Danh sách partition (theo thứ tự của `partition_cols`), rỗng nếu
+        không có dữ liệu nào đang chờ.
+    """
+    entry = _entry(state, table_name)
+    return [tuple(partition) for partition in entry.get("pending_partitions", [])]
+
+
+def set_pending_partitions(
+    state: Dict[str, Any], table_name: str, partitions: List[Tuple]
+):
+    """
+    Ghi nhận các partition đang chờ nạp vào DuckDB (danh sách rỗng để xóa).
+
+    Args:
+        state: Dictionary trạng thái ETL (sẽ được cập nhật tại chỗ).
+        table_name: Tên của bảng đích.
+        partitions: Các partition đã được checkpoint.
     """
-    if pd.notna(new_timestamp):
-        # Chuyển đổi timestamp thành chuỗi ISO 8601, định dạng chuẩn và rõ ràng.
-        # Ví dụ: '2023-10-27 15:30:00'
-        timestamp_str = new_timestamp.isoformat(sep=" ", timespec="seconds")
-        state[table_name] = timestamp_str
-        logger.debug(f"Cập nhật high-water-mark cho '{table_name}': {timestamp_str}")
+    entry = _entry(state, table_name)
+    if partitions:
+        entry["pending_partitions"] = [list(p) for p in sorted(set(partitions))]
     else:
-        logger.warning(
-            f"Bỏ qua cập nhật high-water-mark cho '{table_name}' vì giá trị mới không hợp lệ."
-        )
+        entry.pop("pending_partitions", None)
+    if entry:
+        state[table_name] = entry
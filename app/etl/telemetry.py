@@ -0,0 +1,261 @@
+"""
+Module thu thập số liệu (telemetry) của các lần chạy ETL.
+
+Mỗi bảng trong một lần chạy có một `TableMetrics` ghi nhận số dòng và thời
+gian của từng giai đoạn (extract, transform, write, load), dung lượng Parquet
+đã ghi, bộ nhớ đỉnh (peak RSS), số lần thử lại và high-water mark trước/sau.
+Kết thúc lần chạy, số liệu được lưu vào bảng `etl_runs` trong DuckDB (để theo
+dõi xu hướng thông lượng qua API) và vào một báo cáo JSON trong
+`ETL_REPORT_DIR`.
+"""
+
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TypeVar
+from uuid import uuid4
+
+import pandas as pd
+from duckdb import DuckDBPyConnection
+
+from ..core.config import settings
+from ..utils import profiling
+
+try:
+    import resource
+except ImportError:  # Windows không có module `resource`.
+    resource = None
+
+logger = logging.getLogger(__name__)
+
+ETL_RUNS_TABLE = "etl_runs"
+STAGES = ("extract", "transform", "write", "load")
+
+_ETL_RUNS_DDL = f"""
+CREATE TABLE IF NOT EXISTS {ETL_RUNS_TABLE} (
+    run_id VARCHAR,
+    command VARCHAR,
+    dest_table VARCHAR,
+    status VARCHAR,
+    started_at TIMESTAMP,
+    finished_at TIMESTAMP,
+    rows_extracted BIGINT,
+    rows_transformed BIGINT,
+    rows_rejected BIGINT,
+    rows_loaded BIGINT,
+    bytes_written BIGINT,
+    extract_seconds DOUBLE,
+    transform_seconds DOUBLE,
+    write_seconds DOUBLE,
+    load_seconds DOUBLE,
+    total_seconds DOUBLE,
+    rows_per_second DOUBLE,
+    peak_rss_mb DOUBLE,
+    retries INTEGER,
+    watermark_before VARCHAR,
+    watermark_after VARCHAR,
+    error VARCHAR
+)
+"""
+
+T = TypeVar("T")
+
+
+def _peak_rss_mb() -> Optional[float]:
+    """Bộ nhớ đỉnh (MB) của tiến trình từ lúc khởi động, None nếu không đo được."""
+    if resource is None:
+        return None
+    # Trên Linux `ru_maxrss` tính bằng KB.
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+@dataclass
+class TableMetrics:
+    """Số liệu xử lý một bảng trong một lần chạy."""
+
+    dest_table: str
+    run_id: str = ""
+    command: str = ""
+    status: str = "running"
+    started_at: datetime = field(default_factory=datetime.now)
+    finished_at: Optional[datetime] = None
+    rows_extracted: int = 0
+    rows_transformed: int = 0
+    rows_rejected: int = 0
+    rows_loaded: int = 0
+    bytes_written: int = 0
+    extract_seconds: float = 0.0
+    transform_seconds: float = 0.0
+    write_seconds: float = 0.0
+    load_seconds: float = 0.0
+    peak_rss_mb: Optional[float] = None
+    retries: int = 0
+    watermark_before: Optional[str] = None
+    watermark_after: Optional[str] = None
+    error: Optional[str] = None
+    _attempts: int = field(default=0, repr=False)
+    _peak_bytes: Dict[str, int] = field(default_factory=dict, repr=False)
+
+    def begin_attempt(self):
+        """
+        Đánh dấu bắt đầu một lần thử xử lý bảng.
+
+        Từ lần thử thứ hai, số liệu của lần thử trước được xóa (vì bảng được
+        xử lý lại từ checkpoint) và `retries` tăng thêm một.
+        """
+        if self._attempts > 0:
+            self.retries += 1
+            for name in STAGES:
+                setattr(self, f"{name}_seconds", 0.0)
+            self.rows_extracted = self.rows_transformed = 0
+            self.rows_rejected = self.rows_loaded = self.bytes_written = 0
+            self._peak_bytes.clear()
+        self._attempts += 1
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """
+        Cộng dồn thời gian của khối `with` vào giai đoạn `name`.
+
+        Nếu `tracemalloc` đang bật, bộ nhớ Python cao nhất trong khối cũng được
+        ghi nhận (xem `stage_peak_mb`) và đưa vào báo cáo memory profiling.
+        """
+        start = time.perf_counter()
+        block = None
+        try:
+            with profiling.profile(f"{self.dest_table}.{name}") as block:
+                yield
+        finally:
+            elapsed = time.perf_counter() - start
+            setattr(self, f"{name}_seconds", getattr(self, f"{name}_seconds") + elapsed)
+            if block is not None and tracemalloc.is_tracing():
+                self._peak_bytes[name] = max(self._peak_bytes.get(name, 0), block.peak)
+
+    def stage_peak_mb(self, name: str) -> Optional[float]:
+        """Bộ nhớ Python cao nhất (MB) của giai đoạn, None nếu không được đo."""
+        peak = self._peak_bytes.get(name)
+        return peak / (1024 * 1024) if peak is not None else None
+
+    def timed(self, iterable: Iterable[T], name: str) -> Iterator[T]:
+        """Bọc một iterator (lazy), cộng thời gian lấy từng phần tử vào `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def finish(self, status: str, error: Optional[BaseException] = None):
+        """Ghi nhận kết quả cuối cùng của bảng."""
+        self.status = status
+        self.finished_at = datetime.now()
+        self.peak_rss_mb = _peak_rss_mb()
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+
+    @property
+    def total_seconds(self) -> float:
+        """Thời gian xử lý bảng (kể cả các lần thử lại)."""
+        end = self.finished_at or datetime.now()
+        return (end - self.started_at).total_seconds()
+
+    @property
+    def rows_per_second(self) -> float:
+        """Thông lượng: số dòng đã nạp trên mỗi giây xử lý."""
+        seconds = self.total_seconds
+        return self.rows_loaded / seconds if seconds > 0 else 0.0
+
+    def to_record(self) -> Dict[str, Any]:
+        """Chuyển thành một dòng của bảng `etl_runs`."""
+        record = {k: v for k, v in asdict(self).items() if not k.startswith("_")}
+        record["total_seconds"] = self.total_seconds
+        record["rows_per_second"] = self.rows_per_second
+        return record
+
+
+class RunTelemetry:
+    """
+    Số liệu của một lần chạy ETL, gồm một `TableMetrics` cho mỗi bảng.
+
+    An toàn khi các bảng được xử lý song song trong nhiều luồng.
+    """
+
+    def __init__(self, command: str):
+        self.command = command
+        self.started_at = datetime.now()
+        self.run_id = f"{self.started_at:%Y%m%d%H%M%S}-{uuid4().hex[:8]}"
+        self.tables: Dict[str, TableMetrics] = {}
+        self._lock = Lock()
+
+    def table(self, dest_table: str) -> TableMetrics:
+        """Lấy (hoặc tạo mới) số liệu của một bảng."""
+        with self._lock:
+            if dest_table not in self.tables:
+                self.tables[dest_table] = TableMetrics(
+                    dest_table, run_id=self.run_id, command=self.command
+                )
+            return self.tables[dest_table]
+
+    def records(self) -> List[Dict[str, Any]]:
+        """Các dòng của bảng `etl_runs` cho lần chạy này."""
+        with self._lock:
+            return [metrics.to_record() for metrics in self.tables.values()]
+
+    def write_report(self, directory: Optional[Path] = None) -> Path:
+        """
+        Ghi báo cáo JSON của lần chạy.
+
+        Args:
+            directory: Thư mục chứa báo cáo (mặc định: `ETL_REPORT_DIR`).
+
+        Returns:
+            Đường dẫn tới tệp báo cáo.
+        """
+        directory = directory or settings.ETL_REPORT_DIR
+        directory.mkdir(parents=True, exist_ok=True)
+        report_path = directory / f"etl_run_{self.run_id}.json"
+        report = {
+            "run_id": self.run_id,
+            "command": self.command,
+            "started_at": self.started_at,
+            "finished_at": datetime.now(),
+            "tables": self.records(),
+        }
+        with report_path.open("w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+        return report_path
+
+
+def save_run(conn: DuckDBPyConnection, run: RunTelemetry) -> int:
+    """
+    Lưu số liệu của một lần chạy vào bảng `etl_runs` trong DuckDB.
+
+    Args:
+        conn: Kết nối DuckDB (ghi).
+        run: Số liệu của lần chạy.
+
+    Returns:
+        Số dòng đã lưu.
+    """
+    records = run.records()
+    if not records:
+        return 0
+    batch = pd.DataFrame.from_records(records)
+    conn.execute(_ETL_RUNS_DDL)
+    conn.register("etl_runs_batch", batch)
+    try:
+        conn.execute(
+            f"INSERT INTO {ETL_RUNS_TABLE} BY NAME SELECT * FROM etl_runs_batch"
+        )
+    finally:
+        conn.unregister("etl_runs_batch")
+    logger.debug(f"Đã lưu {len(records)} dòng số liệu của lần chạy '{run.run_id}'.")
+    return len(records)
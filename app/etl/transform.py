@@ -10,12 +10,17 @@ Nhận vào một DataFrame thô và áp dụng một chuỗi các thao tác bi
 """
 
 import logging
+import numpy as np
 import pandas as pd
-import pandera.errors as pa_errors
+from pandas.api.types import is_object_dtype, is_string_dtype
 from typing import Optional
 
-from .schemas import table_schemas
-from ..core.config import settings, TableConfig
+from . import offsets
+from .quarantine import QuarantineWriter
+from .schemas import get_pandas_dtypes, table_schemas
+from .validation import FastValidator, split_with_pandera
+from ..core.config import TableConfig
+from ..utils.profiling import profiled
 
 logger = logging.getLogger(__name__)
 
@@ -23,14 +28,20 @@ logger = logging.getLogger(__name__)
 # --- Các hàm biến đổi riêng lẻ (Private Helper Functions) ---
 
 
+@profiled()
 def _apply_time_offsets(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
-    """Áp dụng điều chỉnh chênh lệch thời gian cho cột timestamp dựa trên cấu hình."""
+    """
+    Áp dụng điều chỉnh chênh lệch thời gian cho cột timestamp dựa trên cấu hình.
+
+    Số phút chênh lệch phụ thuộc vào cửa hàng và thời điểm ghi nhận (xem
+    `offsets.OffsetSchedule`), được tra cứu vector hóa cho cả chunk.
+    """
     if not config.timestamp_col:
         return df
 
     table_name_key = config.source_table.split(".")[-1]
-    offsets_config = settings.TIME_OFFSETS.get(table_name_key)
-    if not offsets_config:
+    schedule = offsets.get_schedule(table_name_key)
+    if schedule is None:
         return df
 
     # Các cột cần thiết cho việc điều chỉnh
@@ -42,16 +53,19 @@ def _apply_time_offsets(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         )
         return df
 
-    # Vector hóa việc điều chỉnh để tăng hiệu suất
-    offsets = df[store_id_col].map(offsets_config).fillna(0)
-    df[ts_col] = pd.to_datetime(df[ts_col], errors="coerce") - pd.to_timedelta(
-        offsets, unit="m"
+    timestamps = pd.to_datetime(df[ts_col], errors="coerce")
+    store_ids = pd.to_numeric(df[store_id_col], errors="coerce").fillna(-1)
+    minutes = schedule.minutes(
+        store_ids.to_numpy(dtype=np.int64),
+        timestamps.to_numpy(dtype="datetime64[ns]"),
     )
+    df[ts_col] = timestamps - minutes.astype("timedelta64[m]")
 
     logger.debug(f"Đã áp dụng điều chỉnh chênh lệch thời gian cho '{table_name_key}'.")
     return df
 
 
+@profiled()
 def _rename_and_clean(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
     """Đổi tên cột theo `rename_map` và áp dụng các quy tắc làm sạch."""
     if config.rename_map:
@@ -62,11 +76,13 @@ def _rename_and_clean(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         col_to_clean = config.rename_map.get(rule.column, rule.column)
 
         if rule.action == "strip" and col_to_clean in df.columns:
-            if pd.api.types.is_object_dtype(df[col_to_clean]):
-                df[col_to_clean] = df[col_to_clean].str.strip()
+            values = df[col_to_clean]
+            if is_object_dtype(values) or is_string_dtype(values):
+                df[col_to_clean] = values.str.strip()
     return df
 
 
+@profiled()
 def _handle_data_types(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
     """Chuẩn hóa kiểu dữ liệu cho các cột quan trọng."""
     # Xử lý các cột số (in/out)
@@ -74,11 +90,21 @@ def _handle_data_types(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         config.rename_map.get("in_num"),
         config.rename_map.get("out_num"),
     ]
+    dtypes = get_pandas_dtypes(config.dest_table)
     for col in filter(None, numeric_cols):
         if col in df.columns:
-            # Chuyển đổi, điền giá trị rỗng bằng 0, đảm bảo không âm
-            df[col] = pd.to_numeric(df[col], errors="coerce").fillna(0).astype(int)
-            df[col] = df[col].apply(lambda x: max(0, x))
+            # Chuyển đổi, điền giá trị rỗng bằng 0, đảm bảo không âm và ép về
+            # kiểu số nguyên hẹp của schema (ví dụ `int32`). Nếu có giá trị
+            # tràn số hoặc có phần lẻ, cột được giữ nguyên để bộ xác thực loại
+            # và cách ly các dòng đó thay vì tràn số hay cắt bớt âm thầm.
+            values = pd.to_numeric(df[col], errors="coerce").fillna(0).clip(lower=0)
+            dtype = dtypes.get(col, "int64")
+            bounds = np.iinfo(dtype)
+            if values.between(bounds.min, bounds.max).all() and (
+                values == np.trunc(values)
+            ).all():
+                values = values.astype(dtype)
+            df[col] = values
 
     # Xử lý cột timestamp và tạo partition
     ts_col = config.final_timestamp_col
@@ -94,8 +120,20 @@ def _handle_data_types(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
     return df
 
 
-def _select_and_validate(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
-    """Chọn các cột cuối cùng và xác thực DataFrame với schema Pandera."""
+@profiled()
+def _select_and_validate(
+    df: pd.DataFrame,
+    config: TableConfig,
+    validator: Optional[FastValidator] = None,
+    quarantine: Optional[QuarantineWriter] = None,
+) -> pd.DataFrame:
+    """
+    Chọn các cột cuối cùng, xác thực và cách ly các dòng không hợp lệ.
+
+    Dùng bộ xác thực compiled nếu được cung cấp, ngược lại dùng schema Pandera.
+    Chỉ các dòng lỗi bị tách ra (kèm đầy đủ các cột) vào khu vực cách ly, các
+    dòng hợp lệ được trả về để tiếp tục nạp.
+    """
     schema = table_schemas.get(config.dest_table)
     if not schema:
         logger.warning(
@@ -103,38 +141,57 @@ def _select_and_validate(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         )
         return df
 
+    if not df.index.is_unique:
+        df = df.reset_index(drop=True)
+
     # Chọn các cột có trong schema để tránh lỗi validation với cột thừa
     schema_cols = list(schema.to_schema().columns.keys())
     final_cols = [col for col in schema_cols if col in df.columns]
     df_subset = df[final_cols]
 
-    try:
-        # `validate` trả về DataFrame đã được ép kiểu (coerced) đúng chuẩn
-        return schema.validate(df_subset, lazy=True)
-    except pa_errors.SchemaErrors as err:
+    if validator is not None:
+        valid_df, failure_cases = validator.split(df_subset)
+    else:
+        # Pandera trả về các dòng hợp lệ đã được ép kiểu (coerced) đúng chuẩn
+        valid_df, failure_cases = split_with_pandera(schema, df_subset)
+
+    if failure_cases is not None:
+        rejected_df = df[~df.index.isin(valid_df.index)]
         logger.error(
-            f"Xác thực dữ liệu cho '{config.dest_table}' thất bại! "
-            f"Xem chi tiết các dòng lỗi bên dưới:\n{err.failure_cases.to_string()}"
+            f"Xác thực dữ liệu cho '{config.dest_table}' thất bại ở "
+            f"{len(rejected_df):,}/{len(df):,} dòng! "
+            f"Xem chi tiết các dòng lỗi bên dưới:\n{failure_cases.head(50).to_string()}"
         )
-        # Lưu dữ liệu lỗi để phân tích (Dead-Letter Queue)
-        rejected_path = settings.DATA_DIR / "rejected" / config.dest_table
-        rejected_path.mkdir(parents=True, exist_ok=True)
-        timestamp_str = pd.Timestamp.now().strftime("%Y%m%d_%H%M%S")
-        file_path = rejected_path / f"rejected_{timestamp_str}.parquet"
-        
-        try:
-            err.failure_cases.to_parquet(file_path)
-            logger.warning(f"Dữ liệu lỗi đã được lưu tại: {file_path}")
-        except Exception as e:
-            logger.error(f"Không thể lưu file dữ liệu lỗi: {e}")
+        quarantine = quarantine or QuarantineWriter(config)
+        quarantine.write(rejected_df, failure_cases, rejected_df.index.to_numpy())
 
-        raise
+    return valid_df
+
+
+def revalidate(
+    df: pd.DataFrame,
+    config: TableConfig,
+    validator: Optional[FastValidator] = None,
+    quarantine: Optional[QuarantineWriter] = None,
+) -> pd.DataFrame:
+    """
+    Chỉ chạy lại bước xác thực cho các dòng đã được biến đổi trước đó.
+
+    Dùng khi xử lý lại dữ liệu trong khu vực cách ly: các dòng này đã qua
+    các bước biến đổi (time offsets, đổi tên...) nên không được áp dụng lại.
+    """
+    return _select_and_validate(df, config, validator, quarantine)
 
 
 # --- Hàm điều phối chính (Public Orchestrator Function) ---
 
 
-def run_transformations(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
+def run_transformations(
+    df: pd.DataFrame,
+    config: TableConfig,
+    validator: Optional[FastValidator] = None,
+    quarantine: Optional[QuarantineWriter] = None,
+) -> pd.DataFrame:
     """
     Điều phối toàn bộ quy trình biến đổi dữ liệu trên một DataFrame.
 
@@ -145,9 +202,16 @@ def run_transformations(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
     Args:
         df: DataFrame đầu vào từ bước Extract.
         config: Cấu hình cho bảng đang được xử lý.
+        validator: Bộ xác thực compiled của lần chạy hiện tại (nếu có).
+        quarantine: Nơi ghi các dòng không hợp lệ của lần chạy hiện tại.
 
     Returns:
-        DataFrame đã được biến đổi, làm sạch và xác thực.
+        DataFrame đã được biến đổi, làm sạch và xác thực. Các dòng không hợp
+        lệ đã được tách vào khu vực cách ly.
+
+    Raises:
+        Exception: Lỗi không mong muốn được log rồi ném lại, để chunk không bị
+            bỏ qua âm thầm trong khi high-water mark vẫn tiến lên.
     """
     if df.empty:
         return df
@@ -156,46 +220,13 @@ def run_transformations(df: pd.DataFrame, config: TableConfig) -> pd.DataFrame:
         # Chuỗi các bước biến đổi dữ liệu
         transformed_df = df.pipe(_apply_time_offsets, config).pipe(
             _rename_and_clean, config
-        ).pipe(_handle_data_types, config).pipe(_select_and_validate, config)
-        return transformed_df
-    except pa_errors.SchemaErrors:
-        # Nếu validation thất bại, trả về một DataFrame rỗng để pipeline
-        # không nạp dữ liệu lỗi vào database.
-        logger.error(
-            f"Quy trình transform cho '{config.dest_table}' đã dừng do lỗi validation."
+        ).pipe(_handle_data_types, config).pipe(
+            _select_and_validate, config, validator, quarantine
         )
-        return pd.DataFrame()
+        return transformed_df
     except Exception as e:
         logger.error(
             f"Lỗi không mong muốn trong quá trình transform '{config.dest_table}': {e}",
             exc_info=True,
         )
-        return pd.DataFrame()
-
-
-def get_max_timestamp(
-    df: pd.DataFrame, config: TableConfig
-) -> Optional[pd.Timestamp]:
-    """
-    Lấy giá trị timestamp lớn nhất từ một chunk đã biến đổi thành công.
-
-    Giá trị này sẽ được dùng để cập nhật "high-water mark" cho lần ETL tiếp theo.
-
-    Args:
-        df: DataFrame đã được biến đổi.
-        config: Cấu hình của bảng.
-
-    Returns:
-        Timestamp lớn nhất, hoặc None nếu không áp dụng (ví dụ: full-load).
-    """
-    if not config.incremental or df.empty:
-        return None
-
-    ts_col = config.final_timestamp_col
-    if ts_col and ts_col in df.columns:
-        # Đảm bảo cột là kiểu datetime trước khi lấy max
-        if pd.api.types.is_datetime64_any_dtype(df[ts_col]):
-            max_ts = df[ts_col].max()
-            return max_ts if pd.notna(max_ts) else None
-
-    return None
+        raise
@@ -0,0 +1,275 @@
+"""
+Module cung cấp engine biến đổi thay thế dựa trên Apache Arrow.
+
+Engine này nhận cùng một `TableConfig` như engine pandas trong `transform.py`
+(rename_map, cleaning_rules, partition_cols, time offsets) nhưng thao tác trực
+tiếp trên `pyarrow.Table` bằng các kernel của `pyarrow.compute`:
+- Điều chỉnh time offsets bằng phép tra cứu dictionary và phép trừ timestamp.
+- Làm sạch chuỗi bằng `utf8_trim_whitespace`.
+- Chặn giá trị âm bằng `max_element_wise` thay vì `apply` theo từng dòng.
+- Xác thực bằng bộ xác thực compiled (`validation.FastValidator`).
+
+Không có vòng lặp Python theo từng dòng và không tạo bản sao pandas trung gian.
+Kết quả được ép về schema Arrow chuẩn (`schemas.get_arrow_schema`), nên tệp
+Parquet ghi ra giống hệt engine pandas. Chọn engine theo từng bảng bằng khóa
+`transform_engine: arrow` trong `tables.yaml`.
+"""
+
+import logging
+from typing import Optional, Union
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ..core.config import TableConfig
+from ..utils.profiling import profiled
+from . import offsets
+from .quarantine import QuarantineWriter
+from .schemas import get_arrow_schema
+from .validation import FastValidator, compile_schema
+
+logger = logging.getLogger(__name__)
+
+_NANOSECONDS_PER_MINUTE = 60 * 1_000_000_000
+
+# Các dạng thời gian dạng chuỗi được chấp nhận (ISO 8601, không có múi giờ).
+_ISO_TIMESTAMP_PATTERN = r"^\d{4}-\d{2}-\d{2}([ T]\d{2}:\d{2}(:\d{2}(\.\d{1,9})?)?)?$"
+
+
+# --- Các hàm biến đổi riêng lẻ (Private Helper Functions) ---
+
+
+def _set_column(table: pa.Table, name: str, values: pa.ChunkedArray) -> pa.Table:
+    """Thay thế (hoặc thêm mới) một cột trong Arrow Table."""
+    index = table.schema.get_field_index(name)
+    if index == -1:
+        return table.append_column(name, values)
+    return table.set_column(index, name, values)
+
+
+def _target_type(config: TableConfig, name: str) -> pa.DataType:
+    """Kiểu Arrow của một cột trong schema chuẩn của bảng (mặc định `int64`)."""
+    schema = get_arrow_schema(config.dest_table)
+    if schema is None or name not in schema.names:
+        return pa.int64()
+    return schema.field(name).type
+
+
+def _to_timestamp(values: pa.ChunkedArray) -> pa.ChunkedArray:
+    """
+    Chuyển một cột về kiểu `timestamp[ns]`, giá trị không hợp lệ thành null.
+
+    Chuỗi được ép kiểu theo ISO 8601 giống `pd.to_datetime`: chấp nhận phần
+    giây lẻ, dấu phân cách `T` và giá trị chỉ có ngày. Chỉ khi cột có giá trị
+    không hợp lệ mới phải lọc bằng biểu thức chính quy; nếu vẫn còn ngày không
+    tồn tại (như `2024-02-30`), cột được chuyển bằng `pd.to_datetime` vì
+    `pc.strptime` tự "cộng dồn" những ngày này sang tháng sau.
+    """
+    if not (pa.types.is_string(values.type) or pa.types.is_large_string(values.type)):
+        return values.cast(pa.timestamp("ns"))
+
+    values = pc.utf8_trim_whitespace(values)
+    try:
+        return values.cast(pa.timestamp("ns"))
+    except pa.ArrowInvalid:
+        pass
+
+    valid = pc.match_substring_regex(values, _ISO_TIMESTAMP_PATTERN)
+    values = pc.if_else(valid, values, pa.scalar(None, values.type))
+    try:
+        return values.cast(pa.timestamp("ns"))
+    except pa.ArrowInvalid:
+        parsed = pd.to_datetime(values.to_pandas(), errors="coerce", format="ISO8601")
+        return pa.chunked_array([pa.array(parsed, type=pa.timestamp("ns"))])
+
+
+def _to_numeric(values: pa.ChunkedArray, target: pa.DataType) -> pa.ChunkedArray:
+    """
+    Ép kiểu an toàn một cột số về `target`.
+
+    Nếu có giá trị không biểu diễn được bằng `target` (tràn số, phần lẻ), cột
+    được chuyển thành `float64` như `pd.to_numeric(errors="coerce")`, chuỗi
+    không phải số thành null. Các giá trị đó được giữ nguyên để bộ xác thực
+    loại và cách ly dòng chứa chúng, thay vì bị tràn số hay cắt bớt âm thầm.
+    """
+    try:
+        return values.cast(target)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        numeric = pd.to_numeric(values.to_pandas(), errors="coerce")
+        return pa.chunked_array(
+            [pa.array(numeric, type=pa.float64(), from_pandas=True)]
+        )
+
+
+@profiled()
+def _apply_time_offsets(table: pa.Table, config: TableConfig) -> pa.Table:
+    """Điều chỉnh chênh lệch thời gian theo cửa hàng và thời điểm ghi nhận."""
+    if not config.timestamp_col:
+        return table
+
+    table_name_key = config.source_table.split(".")[-1]
+    schedule = offsets.get_schedule(table_name_key)
+    if schedule is None:
+        return table
+
+    store_id_col = "storeid"
+    ts_col = config.timestamp_col
+    if store_id_col not in table.column_names or ts_col not in table.column_names:
+        logger.warning(
+            f"Bỏ qua điều chỉnh time offset cho '{table_name_key}' do thiếu cột."
+        )
+        return table
+
+    timestamps = _to_timestamp(table[ts_col])
+    # Mã cửa hàng không phải số nguyên không được điều chỉnh (-1); dòng đó sẽ
+    # bị bộ xác thực loại ở cột `store_id`.
+    store_ids = _to_numeric(table[store_id_col], pa.int64())
+    if pa.types.is_floating(store_ids.type):
+        integral = pc.and_(
+            pc.equal(store_ids, pc.trunc(store_ids)),
+            pc.less(pc.abs(store_ids), 2.0**63),
+        )
+        store_ids = pc.if_else(integral, store_ids, pa.scalar(None, store_ids.type))
+    store_ids = pc.fill_null(store_ids, -1).to_numpy().astype(np.int64)
+    # Tra cứu bằng `searchsorted` trên các mốc của từng cửa hàng (numpy), rồi
+    # trừ thời lượng tương ứng bằng kernel Arrow.
+    minutes = schedule.minutes(store_ids, timestamps.to_numpy(zero_copy_only=False))
+    durations = pa.array(minutes * _NANOSECONDS_PER_MINUTE, type=pa.duration("ns"))
+
+    adjusted = pc.subtract(timestamps, durations)
+    logger.debug(f"Đã áp dụng điều chỉnh chênh lệch thời gian cho '{table_name_key}'.")
+    return _set_column(table, ts_col, adjusted)
+
+
+@profiled()
+def _rename_and_clean(table: pa.Table, config: TableConfig) -> pa.Table:
+    """Đổi tên cột theo `rename_map` và áp dụng các quy tắc làm sạch."""
+    if config.rename_map:
+        table = table.rename_columns(
+            [config.rename_map.get(name, name) for name in table.column_names]
+        )
+
+    for rule in config.cleaning_rules:
+        col_to_clean = config.rename_map.get(rule.column, rule.column)
+        if rule.action == "strip" and col_to_clean in table.column_names:
+            values = table[col_to_clean]
+            if pa.types.is_string(values.type) or pa.types.is_large_string(values.type):
+                table = _set_column(
+                    table, col_to_clean, pc.utf8_trim_whitespace(values)
+                )
+    return table
+
+
+@profiled()
+def _handle_data_types(table: pa.Table, config: TableConfig) -> pa.Table:
+    """Chuẩn hóa kiểu dữ liệu và tạo cột partition bằng kernel Arrow."""
+    numeric_cols = [
+        config.rename_map.get("in_num"),
+        config.rename_map.get("out_num"),
+    ]
+    for col in filter(None, numeric_cols):
+        if col in table.column_names:
+            # Ép kiểu, điền null bằng 0 và chặn giá trị âm trong một lượt.
+            values = _to_numeric(table[col], _target_type(config, col))
+            values = pc.fill_null(values, 0)
+            table = _set_column(
+                table, col, pc.max_element_wise(values, pa.scalar(0, values.type))
+            )
+
+    ts_col = config.final_timestamp_col
+    if ts_col and ts_col in table.column_names:
+        table = _set_column(table, ts_col, _to_timestamp(table[ts_col]))
+        table = table.filter(pc.is_valid(table[ts_col]))
+
+        if table.num_rows > 0:
+            if "year" in config.partition_cols:
+                year = pc.year(table[ts_col]).cast(_target_type(config, "year"))
+                table = _set_column(table, "year", year)
+            if "month" in config.partition_cols:
+                month = pc.month(table[ts_col]).cast(_target_type(config, "month"))
+                table = _set_column(table, "month", month)
+    return table
+
+
+@profiled()
+def _select_and_validate(
+    table: pa.Table,
+    config: TableConfig,
+    validator: Optional[FastValidator],
+    quarantine: Optional[QuarantineWriter],
+) -> pa.Table:
+    """Chọn các cột cuối cùng, ép kiểu, xác thực và cách ly các dòng lỗi."""
+    if validator is None:
+        logger.warning(
+            f"Không tìm thấy schema cho '{config.dest_table}'. Bỏ qua xác thực."
+        )
+        return table
+
+    valid, rejected, failure_cases = validator.split_arrow(table)
+    if failure_cases is not None:
+        logger.error(
+            f"Xác thực dữ liệu cho '{config.dest_table}' thất bại ở "
+            f"{int(rejected.sum()):,}/{table.num_rows:,} dòng! "
+            f"Xem chi tiết các dòng lỗi bên dưới:\n{failure_cases.head(50).to_string()}"
+        )
+        quarantine = quarantine or QuarantineWriter(config)
+        quarantine.write(
+            table.filter(pa.array(rejected)), failure_cases, np.flatnonzero(rejected)
+        )
+    return valid
+
+
+# --- Hàm điều phối chính (Public Orchestrator Function) ---
+
+
+def run_transformations(
+    data: Union[pd.DataFrame, pa.Table],
+    config: TableConfig,
+    validator: Optional[FastValidator] = None,
+    quarantine: Optional[QuarantineWriter] = None,
+) -> pa.Table:
+    """
+    Điều phối toàn bộ quy trình biến đổi trên một Arrow Table.
+
+    Thứ tự các bước giống hệt `transform.run_transformations`. Nếu đầu vào là
+    DataFrame (từ bước Extract), nó chỉ được chuyển sang Arrow đúng một lần.
+
+    Args:
+        data: Chunk dữ liệu thô từ bước Extract.
+        config: Cấu hình cho bảng đang được xử lý.
+        validator: Bộ xác thực compiled của lần chạy hiện tại. Nếu không
+            truyền vào, một bộ xác thực riêng cho chunk này sẽ được tạo.
+        quarantine: Nơi ghi các dòng không hợp lệ của lần chạy hiện tại.
+
+    Returns:
+        Arrow Table đã được biến đổi, làm sạch và xác thực. Các dòng không hợp
+        lệ đã được tách vào khu vực cách ly.
+
+    Raises:
+        Exception: Lỗi không mong muốn được log rồi ném lại, để chunk không bị
+            bỏ qua âm thầm trong khi high-water mark vẫn tiến lên.
+    """
+    table = (
+        pa.Table.from_pandas(data, preserve_index=False)
+        if isinstance(data, pd.DataFrame)
+        else data
+    )
+    if table.num_rows == 0:
+        return table
+
+    if validator is None and compile_schema(config.dest_table) is not None:
+        validator = FastValidator(config)
+
+    try:
+        table = _apply_time_offsets(table, config)
+        table = _rename_and_clean(table, config)
+        table = _handle_data_types(table, config)
+        return _select_and_validate(table, config, validator, quarantine)
+    except Exception as e:
+        logger.error(
+            f"Lỗi không mong muốn trong quá trình transform '{config.dest_table}': {e}",
+            exc_info=True,
+        )
+        raise
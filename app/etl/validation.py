@@ -0,0 +1,473 @@
+"""
+Module cung cấp bộ xác thực "biên dịch sẵn" (compiled) thay cho Pandera.
+
+Thay vì chạy toàn bộ cơ chế của Pandera trên mỗi chunk, các ràng buộc của
+`DimStoresSchema`, `FactTrafficSchema` và `FactErrorsSchema` được biên dịch
+một lần thành danh sách `ColumnRule` đơn giản (kiểu dữ liệu, null, khoảng giá
+trị, tính duy nhất), sau đó được kiểm tra bằng các phép tính vector hóa trong
+một lượt duy nhất trên DataFrame (engine pandas) hoặc Arrow Table (engine
+arrow).
+
+Điểm khác biệt so với Pandera:
+- Tính duy nhất (`unique=True`) được kiểm tra xuyên suốt các chunk của một
+  lần chạy nhờ tập khóa đã gặp (một `set`, nên chi phí mỗi chunk chỉ tỉ lệ
+  với kích thước chunk), thay vì chỉ trong phạm vi một chunk.
+- Khi phát hiện lỗi, có thể chạy lại Pandera đầy đủ (fallback) để có báo cáo
+  chi tiết như trước.
+- Các dòng lỗi được tách riêng (`split`) thay vì loại bỏ cả chunk, để đưa vào
+  khu vực cách ly (`quarantine.py`).
+- Có thể chỉ kiểm tra null/khoảng giá trị trên một mẫu ngẫu nhiên các dòng
+  cho các nguồn dữ liệu tin cậy (`validation_sample_rate`).
+"""
+
+import logging
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+import pandera.errors as pa_errors
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from ..core.config import TableConfig
+from .schemas import get_arrow_schema, table_schemas
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class ColumnRule:
+    """Ràng buộc đã được biên dịch cho một cột của schema."""
+
+    name: str
+    dtype: str
+    nullable: bool
+    unique: bool
+    min_value: Optional[float] = None
+
+
+@lru_cache(maxsize=None)
+def compile_schema(table_name: str) -> Optional[Tuple[ColumnRule, ...]]:
+    """
+    Biên dịch schema Pandera của một bảng thành danh sách `ColumnRule`.
+
+    Args:
+        table_name: Tên bảng đích.
+
+    Returns:
+        Tuple các `ColumnRule` theo thứ tự cột của schema, hoặc None nếu bảng
+        không có schema.
+    """
+    schema = table_schemas.get(table_name)
+    if schema is None:
+        return None
+
+    rules = []
+    for name, column in schema.to_schema().columns.items():
+        min_value = None
+        for check in column.checks:
+            if check.name == "greater_than_or_equal_to":
+                min_value = check.statistics["min_value"]
+            else:
+                raise ValueError(
+                    f"Check '{check.name}' của cột '{table_name}.{name}' "
+                    f"chưa được hỗ trợ bởi bộ xác thực compiled."
+                )
+        rules.append(
+            ColumnRule(
+                name=name,
+                dtype=str(column.dtype),
+                nullable=column.nullable,
+                unique=column.unique,
+                min_value=min_value,
+            )
+        )
+    return tuple(rules)
+
+
+def _schema_failure(columns: list, check: str, cases: list) -> pd.DataFrame:
+    """Tạo `failure_cases` cho lỗi ở cấp độ schema (không gắn với dòng nào)."""
+    return pd.DataFrame(
+        {
+            "schema_context": "DataFrameSchema",
+            "column": columns,
+            "check": check,
+            "failure_case": cases,
+            "index": None,
+        }
+    )
+
+
+_INTEGER_DTYPES = ("int64", "int32", "int16")
+
+
+def _nullable(dtype: str) -> str:
+    """Kiểu số nguyên nullable của pandas tương ứng (`int32` -> `Int32`)."""
+    return dtype.capitalize()
+
+
+def _coerce_series(series: pd.Series, dtype: str) -> Tuple[pd.Series, np.ndarray]:
+    """
+    Ép kiểu một cột theo kiểu của schema.
+
+    Returns:
+        Tuple (cột đã ép kiểu, mask các dòng không thể ép kiểu).
+    """
+    not_coercible = np.zeros(len(series), dtype=bool)
+
+    if dtype in _INTEGER_DTYPES:
+        bounds = np.iinfo(dtype)
+        if pd.api.types.is_integer_dtype(series) and not series.hasnans:
+            if series.empty or bounds.min <= series.min() <= series.max() <= bounds.max:
+                return series.astype(dtype, copy=False), not_coercible
+        # Giá trị vượt quá phạm vi của kiểu hẹp hoặc có phần lẻ được coi là
+        # không ép kiểu được (thay vì bị tràn số hay cắt bớt).
+        numeric = pd.to_numeric(series, errors="coerce")
+        numeric = numeric.where((numeric >= bounds.min) & (numeric <= bounds.max))
+        if pd.api.types.is_float_dtype(numeric):
+            numeric = numeric.where(numeric == np.trunc(numeric))
+        not_coercible = (series.notna() & numeric.isna()).to_numpy()
+        # Dùng kiểu nullable (`Int64`, `Int32`...) khi còn giá trị rỗng để không
+        # mất dòng; việc ghi Parquet sẽ chuyển chúng thành null của Arrow.
+        target = _nullable(dtype) if numeric.hasnans else dtype
+        return numeric.astype(target), not_coercible
+
+    if dtype == "datetime64[ns]":
+        if pd.api.types.is_datetime64_dtype(series):
+            return series.astype("datetime64[ns]", copy=False), not_coercible
+        converted = pd.to_datetime(series, errors="coerce")
+        not_coercible = (series.notna() & converted.isna()).to_numpy()
+        return converted, not_coercible
+
+    if dtype == "str":
+        if pd.api.types.is_object_dtype(series) or pd.api.types.is_string_dtype(series):
+            return series, not_coercible
+        return series.astype(str).where(series.notna(), None), not_coercible
+
+    if dtype == "string[pyarrow]":
+        # Giá trị không phải chuỗi được chuyển thành chuỗi, giá trị rỗng thành NA.
+        return series.astype(dtype, copy=False), not_coercible
+
+    raise ValueError(f"Kiểu dữ liệu '{dtype}' chưa được hỗ trợ.")
+
+
+def _coerce_arrow(
+    column: pa.ChunkedArray, dtype: str, target: pa.DataType
+) -> Tuple[pa.ChunkedArray, np.ndarray]:
+    """
+    Ép kiểu an toàn một cột Arrow theo kiểu của schema.
+
+    Nếu phép ép kiểu an toàn thất bại (tràn số, phần lẻ, chuỗi không phải số),
+    cột được ép theo đúng quy tắc của `_coerce_series`: các giá trị không ép
+    kiểu được thành null và được đánh dấu trong mask.
+
+    Returns:
+        Tuple (cột đã ép kiểu, mask các dòng không thể ép kiểu).
+    """
+    try:
+        return column.cast(target), np.zeros(len(column), dtype=bool)
+    except (pa.ArrowInvalid, pa.ArrowNotImplementedError):
+        pass
+    series, not_coercible = _coerce_series(column.to_pandas(), dtype)
+    values = pa.array(series, type=target, from_pandas=True)
+    return pa.chunked_array([values]), not_coercible
+
+
+class FastValidator:
+    """
+    Bộ xác thực compiled cho một lần chạy ETL của một bảng.
+
+    Một instance được tạo cho mỗi lần xử lý bảng và được dùng lại cho tất cả
+    các chunk, nhờ đó giữ được tập khóa đã gặp để kiểm tra tính duy nhất
+    xuyên chunk.
+    """
+
+    def __init__(
+        self,
+        config: TableConfig,
+        sample_rate: Optional[float] = None,
+        fallback: Optional[bool] = None,
+    ):
+        self.config = config
+        self.rules = compile_schema(config.dest_table)
+        self.sample_rate = (
+            config.validation_sample_rate if sample_rate is None else sample_rate
+        )
+        self.fallback = config.validation_fallback if fallback is None else fallback
+        self._seen: Dict[str, Set] = {}
+        self._rng = np.random.default_rng()
+
+    # --- Các hàm hỗ trợ nội bộ ---
+
+    def _sample_mask(self, n_rows: int) -> Optional[np.ndarray]:
+        """Mask các dòng được chọn để kiểm tra null/khoảng giá trị."""
+        if self.sample_rate >= 1.0:
+            return None
+        return self._rng.random(n_rows) < self.sample_rate
+
+    def _duplicated(self, name: str, values: np.ndarray) -> np.ndarray:
+        """Mask các dòng trùng lặp trong chunk hoặc với các chunk trước đó."""
+        duplicated = pd.Series(values).duplicated(keep=False).to_numpy()
+        seen = self._seen.get(name)
+        if seen:
+            duplicated |= np.fromiter(
+                map(seen.__contains__, values.tolist()), dtype=bool, count=len(values)
+            )
+        return duplicated
+
+    def _remember(self, name: str, values: np.ndarray):
+        """Thêm các khóa đã được chấp nhận vào tập khóa đã gặp."""
+        self._seen.setdefault(name, set()).update(values.tolist())
+
+    @staticmethod
+    def _failure_cases(
+        failures: List[Tuple[str, str, np.ndarray]],
+        values: Dict[str, np.ndarray],
+        index: np.ndarray,
+    ) -> pd.DataFrame:
+        """Tổng hợp các dòng lỗi theo định dạng `failure_cases` của Pandera."""
+        frames = []
+        for name, check, mask in failures:
+            positions = np.flatnonzero(mask)
+            frames.append(
+                pd.DataFrame(
+                    {
+                        "schema_context": "Column",
+                        "column": name,
+                        "check": check,
+                        "failure_case": values[name][positions],
+                        "index": index[positions],
+                    }
+                )
+            )
+        return pd.concat(frames, ignore_index=True)
+
+    def _diagnose(
+        self, failure_cases: pd.DataFrame, data: pd.DataFrame
+    ) -> pd.DataFrame:
+        """Bổ sung báo cáo chi tiết của Pandera (fallback) cho các lỗi đã phát hiện."""
+        if not self.fallback:
+            return failure_cases
+
+        logger.info(
+            f"Bộ xác thực compiled phát hiện {len(failure_cases)} lỗi trong "
+            f"'{self.config.dest_table}'. Chạy lại Pandera để lấy báo cáo chi tiết."
+        )
+        # Pandera có thể không thấy một số lỗi (ví dụ: trùng khóa giữa các
+        # chunk), nên báo cáo của nó được gộp thêm chứ không thay thế.
+        _, pandera_cases = split_with_pandera(
+            table_schemas[self.config.dest_table], data
+        )
+        if pandera_cases is None:
+            return failure_cases
+        return pd.concat([failure_cases, pandera_cases], ignore_index=True)
+
+    # --- API công khai ---
+
+    def split(self, df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+        """
+        Ép kiểu và xác thực một DataFrame trong một lượt, tách riêng các dòng lỗi.
+
+        Args:
+            df: DataFrame đã chứa đúng các cột của schema.
+
+        Returns:
+            Tuple (các dòng hợp lệ đã được ép kiểu, `failure_cases` hoặc None
+            nếu không có lỗi). Cột `index` của `failure_cases` chứa nhãn dòng
+            lỗi của `df`; giá trị rỗng nghĩa là lỗi ở cấp độ schema và toàn bộ
+            chunk bị loại.
+        """
+        missing = [rule.name for rule in self.rules if rule.name not in df.columns]
+        if missing:
+            failure_cases = _schema_failure(missing, "column_in_dataframe", missing)
+            return df.iloc[0:0], self._diagnose(failure_cases, df)
+
+        sample = self._sample_mask(len(df))
+        coerced, failures, values = {}, [], {}
+        rejected = np.zeros(len(df), dtype=bool)
+        for rule in self.rules:
+            series, not_coercible = _coerce_series(df[rule.name], rule.dtype)
+            coerced[rule.name] = series
+            if not_coercible.any():
+                failures.append((rule.name, f"dtype('{rule.dtype}')", not_coercible))
+
+            checks = []
+            if not rule.nullable:
+                checks.append(("not_nullable", series.isna().to_numpy()))
+            if rule.min_value is not None:
+                below_min = (series < rule.min_value).fillna(False)
+                checks.append(
+                    ("greater_than_or_equal_to", below_min.to_numpy(dtype=bool))
+                )
+            for check, mask in checks:
+                if sample is not None:
+                    mask = mask & sample
+                if mask.any():
+                    failures.append((rule.name, check, mask))
+
+            if rule.unique:
+                values[rule.name] = series.to_numpy()
+                duplicated = self._duplicated(rule.name, values[rule.name])
+                if duplicated.any():
+                    failures.append((rule.name, "field_uniqueness", duplicated))
+
+        failure_cases = None
+        if failures:
+            for name, _, mask in failures:
+                rejected |= mask
+                if name not in values:
+                    values[name] = coerced[name].to_numpy()
+            failure_cases = self._diagnose(
+                self._failure_cases(failures, values, df.index.to_numpy()), df
+            )
+
+        keep = ~rejected
+        valid = {}
+        for rule in self.rules:
+            column = coerced[rule.name][keep] if rejected.any() else coerced[rule.name]
+            # Các dòng null bị loại có thể để lại kiểu nullable, trả về kiểu thường.
+            if column.dtype.name == _nullable(rule.dtype) and not column.hasnans:
+                column = column.astype(rule.dtype)
+            valid[rule.name] = column
+            if rule.unique:
+                self._remember(rule.name, column.to_numpy())
+        return pd.DataFrame(valid), failure_cases
+
+    def split_arrow(
+        self, table: pa.Table
+    ) -> Tuple[pa.Table, np.ndarray, Optional[pd.DataFrame]]:
+        """
+        Ép kiểu và xác thực một Arrow Table bằng kernel `pyarrow.compute`.
+
+        Args:
+            table: Arrow Table đã qua các bước biến đổi.
+
+        Returns:
+            Tuple (các dòng hợp lệ theo schema Arrow chuẩn, mask các dòng bị
+            loại của `table`, `failure_cases` hoặc None nếu không có lỗi).
+        """
+        arrow_schema = get_arrow_schema(self.config.dest_table)
+        all_rejected = np.ones(table.num_rows, dtype=bool)
+        missing = [
+            name for name in arrow_schema.names if name not in table.column_names
+        ]
+        if missing:
+            failure_cases = _schema_failure(missing, "column_in_dataframe", missing)
+            return (
+                arrow_schema.empty_table(),
+                all_rejected,
+                self._diagnose(failure_cases, table.to_pandas()),
+            )
+
+        columns, not_coercible = [], {}
+        try:
+            for rule in self.rules:
+                column, mask = _coerce_arrow(
+                    table[rule.name], rule.dtype, arrow_schema.field(rule.name).type
+                )
+                columns.append(column)
+                if mask.any():
+                    not_coercible[rule.name] = mask
+            coerced = pa.Table.from_arrays(columns, schema=arrow_schema)
+        except (pa.ArrowInvalid, pa.ArrowNotImplementedError) as e:
+            failure_cases = _schema_failure([None], "dtype", [str(e)])
+            return (
+                arrow_schema.empty_table(),
+                all_rejected,
+                self._diagnose(failure_cases, table.to_pandas()),
+            )
+
+        sample = self._sample_mask(coerced.num_rows)
+        failures, values = [], {}
+        for rule in self.rules:
+            column = coerced[rule.name]
+            if rule.name in not_coercible:
+                failures.append(
+                    (rule.name, f"dtype('{rule.dtype}')", not_coercible[rule.name])
+                )
+            checks = []
+            if not rule.nullable:
+                checks.append(("not_nullable", pc.is_null(column)))
+            if rule.min_value is not None:
+                checks.append(
+                    ("greater_than_or_equal_to", pc.less(column, rule.min_value))
+                )
+            for check, mask in checks:
+                mask = pc.fill_null(mask, False).to_numpy(zero_copy_only=False)
+                if sample is not None:
+                    mask = mask & sample
+                if mask.any():
+                    failures.append((rule.name, check, mask))
+
+            if rule.unique:
+                values[rule.name] = column.to_numpy(zero_copy_only=False)
+                duplicated = self._duplicated(rule.name, values[rule.name])
+                if duplicated.any():
+                    failures.append((rule.name, "field_uniqueness", duplicated))
+
+        rejected = np.zeros(coerced.num_rows, dtype=bool)
+        failure_cases = None
+        if failures:
+            for name, _, mask in failures:
+                rejected |= mask
+                if name not in values:
+                    values[name] = coerced[name].to_numpy(zero_copy_only=False)
+            failure_cases = self._diagnose(
+                self._failure_cases(failures, values, np.arange(coerced.num_rows)),
+                coerced.to_pandas(),
+            )
+            coerced = coerced.filter(pa.array(~rejected))
+
+        for rule in self.rules:
+            if rule.unique:
+                self._remember(rule.name, values[rule.name][~rejected])
+        return coerced, rejected, failure_cases
+
+
+def split_with_pandera(
+    schema, df: pd.DataFrame
+) -> Tuple[pd.DataFrame, Optional[pd.DataFrame]]:
+    """
+    Xác thực bằng Pandera và tách riêng các dòng lỗi.
+
+    Các dòng có trong `failure_cases` bị loại bỏ, phần còn lại được xác thực
+    lại một lần nữa. Nếu vẫn thất bại (lỗi ở cấp độ schema, ví dụ thiếu cột),
+    toàn bộ chunk bị loại.
+
+    Args:
+        schema: Schema Pandera (DataFrameModel) của bảng.
+        df: DataFrame cần xác thực.
+
+    Returns:
+        Tuple (các dòng hợp lệ đã được ép kiểu, `failure_cases` hoặc None).
+    """
+    try:
+        return schema.validate(df, lazy=True), None
+    except pa_errors.SchemaErrors as err:
+        failure_cases = err.failure_cases
+
+    failed_labels = failure_cases["index"].dropna().unique()
+    remaining = df.drop(index=failed_labels)
+    try:
+        return schema.validate(remaining, lazy=True), failure_cases
+    except pa_errors.SchemaErrors as err:
+        return df.iloc[0:0], pd.concat(
+            [failure_cases, err.failure_cases], ignore_index=True
+        )
+
+
+def create_validator(config: TableConfig) -> Optional[FastValidator]:
+    """
+    Tạo bộ xác thực compiled cho một lần chạy, theo cấu hình của bảng.
+
+    Returns:
+        `FastValidator` nếu bảng có schema và được cấu hình
+        `validation: compiled` (hoặc dùng engine `arrow`), ngược lại là None.
+    """
+    if compile_schema(config.dest_table) is None:
+        return None
+    if config.validation == "compiled" or config.transform_engine == "arrow":
+        return FastValidator(config)
+    return None
@@ -6,16 +6,32 @@ Tệp này chịu trách nhiệm:
 - Cấu hình Middleware (ví dụ: CORS để cho phép frontend giao tiếp).
 - Tích hợp các routers từ các module khác vào ứng dụng chính.
 - Phục vụ các tệp tĩnh (CSS, JS) và template HTML cho giao diện.
+- Bật memory profiling khi `PROFILE_MEMORY=true` (xem `app/utils/profiling.py`).
+- Làm nóng mỗi worker ở nền sau khi khởi động và báo trạng thái sẵn sàng qua
+  `/health`.
 """
  
-from fastapi import FastAPI, Request
+import logging
+import os
+from threading import Event, Thread
+
+from fastapi import FastAPI, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import HTMLResponse
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
 
+from .core import snapshots
 from .core.config import settings
+from .dependencies import check_database, snapshot_connections
 from .routers import router as api_router
+from .services import DashboardService
+from .utils import profiling
+
+logger = logging.getLogger(__name__)
+
+# Được bật khi worker đã làm nóng xong (xem `warm_up`).
+worker_ready = Event()
 
 # --- 1. Khởi tạo ứng dụng FastAPI ---
 # Lấy các thông tin cơ bản từ tệp cấu hình để khởi tạo.
@@ -25,6 +41,52 @@ api_app = FastAPI(
     version="2.1.0",
 )
 
+# Memory profiling (tùy chọn): bật từ lúc khởi động, ghi báo cáo khi tắt server.
+if settings.PROFILE_MEMORY:
+    profiling.enable()
+
+    @api_app.on_event("shutdown")
+    def write_memory_profile():
+        """Ghi báo cáo memory profiling của tiến trình server."""
+        profiling.write_report("serve")
+
+
+def _warm_up():
+    """
+    Làm nóng worker: mở kết nối tới snapshot DuckDB hiện tại, chạy các truy
+    vấn nhỏ mà mọi trang đều dùng và biên dịch sẵn template dashboard.
+
+    Lỗi khi làm nóng (ví dụ chưa có dữ liệu) không làm dừng worker: `/health`
+    sẽ báo chưa sẵn sàng cho tới khi truy vấn được DuckDB.
+    """
+    try:
+        stores = DashboardService.get_all_stores()
+        DashboardService.get_latest_record_time()
+        templates.get_template("dashboard.html")
+        logger.info(f"Worker {os.getpid()} sẵn sàng ({len(stores)} cửa hàng).")
+    except Exception as e:
+        logger.warning(f"Worker {os.getpid()} làm nóng thất bại: {e}")
+    worker_ready.set()
+
+
+@api_app.on_event("startup")
+def start_warm_up():
+    """
+    Làm nóng worker ở một luồng nền.
+
+    Sự kiện startup kết thúc ngay nên server mở port và nhận request mà không
+    chờ DuckDB. Việc làm nóng diễn ra trong từng worker, sau khi fork, vì kết
+    nối DuckDB không thể dùng chung giữa các tiến trình.
+    """
+    Thread(target=_warm_up, name="warm-up", daemon=True).start()
+
+
+@api_app.on_event("shutdown")
+def close_snapshot_connections():
+    """Đóng kết nối tới snapshot DuckDB đang dùng."""
+    snapshot_connections.close()
+
+
 # --- 2. Cấu hình Middleware ---
 # Cấu hình CORS (Cross-Origin Resource Sharing) để cho phép trình duyệt
 # ở các domain khác (ví dụ: http://localhost:3000) có thể gọi đến API này.
@@ -71,11 +133,21 @@ async def show_dashboard(request: Request):
 
 
 @api_app.get("/health", tags=["Health Check"])
-def health_check():
+def health_check(response: Response):
     """
     Endpoint để kiểm tra "sức khỏe" (health status) của ứng dụng.
 
     Thường được sử dụng bởi các hệ thống monitoring để kiểm tra xem
-    dịch vụ có đang hoạt động hay không.
+    dịch vụ có đang hoạt động hay không. Trả về 503 khi worker xử lý request
+    chưa sẵn sàng (chưa làm nóng xong hoặc không truy vấn được DuckDB), để
+    load balancer tạm ngừng gửi request tới.
     """
-    return {"status": "ok"}
+    ready = worker_ready.is_set() and check_database()
+    if not ready:
+        response.status_code = 503
+    snapshot = snapshots.current_snapshot() if settings.DUCKDB_SNAPSHOTS else None
+    return {
+        "status": "ok" if ready else "unavailable",
+        "worker": os.getpid(),
+        "snapshot_version": snapshot.version if snapshot else None,
+    }
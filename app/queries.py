@@ -0,0 +1,303 @@
+"""
+Module đăng ký các truy vấn của dashboard dưới dạng prepared statement.
+
+Mỗi truy vấn được định nghĩa một lần với câu lệnh SQL cố định và các tham số
+có tên (`$tên`), kể cả những phần trước đây được chèn vào chuỗi SQL theo
+từng request như đơn vị `date_trunc`, định dạng thời gian hay giờ bắt đầu
+"ngày làm việc". Nhờ đó:
+- Trên mỗi cursor trong pool (`app/dependencies.py`), câu lệnh chỉ được
+  `PREPARE` (parse và bind) một lần rồi được `EXECUTE` lại ở các request sau.
+- Nội dung SQL không đổi giữa các `period` hay cửa hàng.
+
+Thời gian `PREPARE` và `EXECUTE` của từng truy vấn được ghi nhận riêng (xem
+`stats`) để theo dõi phần chi phí parse/plan so với thời gian thực thi.
+
+DuckDB không nhận tham số bind cho câu lệnh `EXECUTE`, nên giá trị tham số
+được chuyển thành literal SQL đã được escape (`_literal`); chỉ các kiểu cơ
+bản được chấp nhận.
+"""
+
+import logging
+import time
+from dataclasses import asdict, dataclass
+from datetime import date, datetime
+from threading import Lock
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+
+from .dependencies import PooledConnection, arrow_to_df, get_pooled_connection
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class PreparedQuery:
+    """Một truy vấn đã đăng ký: tên và câu lệnh SQL với các tham số `$tên`."""
+
+    name: str
+    sql: str
+
+    @property
+    def statement(self) -> str:
+        """Tên prepared statement trong DuckDB."""
+        return f"q_{self.name}"
+
+
+@dataclass
+class QueryStats:
+    """Số lần và tổng thời gian chuẩn bị/thực thi của một truy vấn."""
+
+    prepares: int = 0
+    prepare_seconds: float = 0.0
+    executions: int = 0
+    execute_seconds: float = 0.0
+
+
+_registry: Dict[str, PreparedQuery] = {}
+_stats: Dict[str, QueryStats] = {}
+_stats_lock = Lock()
+
+
+def register(name: str, sql: str) -> PreparedQuery:
+    """
+    Đăng ký một truy vấn.
+
+    Raises:
+        ValueError: Nếu tên đã được đăng ký.
+    """
+    if name in _registry:
+        raise ValueError(f"Truy vấn '{name}' đã được đăng ký.")
+    query = _registry[name] = PreparedQuery(name, sql)
+    _stats[name] = QueryStats()
+    return query
+
+
+def _literal(value: Any) -> str:
+    """
+    Chuyển giá trị tham số thành literal SQL.
+
+    Raises:
+        TypeError: Nếu kiểu giá trị không được hỗ trợ.
+    """
+    if value is None:
+        return "NULL"
+    if isinstance(value, bool):
+        return "TRUE" if value else "FALSE"
+    if isinstance(value, int):
+        return str(value)
+    if isinstance(value, datetime):
+        return f"TIMESTAMP '{value.isoformat(sep=' ')}'"
+    if isinstance(value, date):
+        return f"DATE '{value.isoformat()}'"
+    if isinstance(value, str):
+        return "'" + value.replace("'", "''") + "'"
+    raise TypeError(f"Không hỗ trợ tham số kiểu {type(value).__name__}.")
+
+
+def _record(name: str, prepared: bool, seconds: float):
+    """Cộng dồn thời gian chuẩn bị hoặc thực thi của một truy vấn."""
+    with _stats_lock:
+        stats = _stats[name]
+        if prepared:
+            stats.prepares += 1
+            stats.prepare_seconds += seconds
+        else:
+            stats.executions += 1
+            stats.execute_seconds += seconds
+
+
+def execute(
+    pooled: PooledConnection, query: PreparedQuery, params: Dict[str, Any]
+) -> pa.Table:
+    """
+    Thực thi một truy vấn đã đăng ký trên cursor `pooled`.
+
+    Câu lệnh được `PREPARE` nếu cursor này chưa chuẩn bị nó.
+
+    Args:
+        pooled: Cursor DuckDB (từ `get_pooled_connection`).
+        query: Truy vấn đã đăng ký.
+        params: Giá trị của các tham số `$tên` trong câu lệnh.
+
+    Returns:
+        Kết quả dưới dạng bảng Arrow.
+    """
+    if query.statement not in pooled.prepared:
+        started = time.perf_counter()
+        pooled.conn.execute(f"PREPARE {query.statement} AS {query.sql}")
+        elapsed = time.perf_counter() - started
+        pooled.prepared.add(query.statement)
+        _record(query.name, True, elapsed)
+        logger.debug(f"Đã chuẩn bị truy vấn '{query.name}' ({elapsed * 1000:.1f} ms).")
+
+    statement = f"EXECUTE {query.statement}"
+    if params:
+        args = ", ".join(f"{key} := {_literal(v)}" for key, v in params.items())
+        statement += f"({args})"
+    started = time.perf_counter()
+    table = pooled.conn.execute(statement).arrow()
+    _record(query.name, False, time.perf_counter() - started)
+    return table
+
+
+def query_to_df(
+    query: PreparedQuery, params: Optional[Dict[str, Any]] = None
+) -> pd.DataFrame:
+    """
+    Thực thi một truy vấn đã đăng ký và trả về kết quả dưới dạng DataFrame.
+
+    Giống `query_db_to_df`, lỗi được log rồi ném lại cho tầng trên (không trả
+    về DataFrame rỗng để kết quả lỗi không bị cache).
+    """
+    try:
+        with get_pooled_connection() as pooled:
+            return arrow_to_df(execute(pooled, query, params or {}))
+    except Exception as e:
+        logger.error(f"Truy vấn '{query.name}' thất bại: {e}")
+        raise
+
+
+def stats() -> List[Dict[str, Any]]:
+    """Thống kê chuẩn bị/thực thi của các truy vấn trong tiến trình hiện tại."""
+    with _stats_lock:
+        return [{"name": name, **asdict(s)} for name, s in _stats.items()]
+
+
+# --- Các truy vấn của dashboard ---
+# Điều kiện chung: khoảng thời gian của "ngày làm việc" và cửa hàng (`all` =
+# tất cả). Điều kiện trên các cột partition `year`, `month` không làm thay đổi
+# kết quả nhưng giúp DuckDB bỏ qua các partition Parquet của tầng lạnh (và các
+# row group) nằm ngoài khoảng thời gian.
+_FILTERS = """
+    record_time >= $start_time AND record_time < $end_time
+    AND year BETWEEN $first_year AND $last_year
+    AND month BETWEEN $first_month AND $last_month
+    AND ($store = 'all' OR store_name = $store)
+"""
+
+METRICS = register(
+    "metrics",
+    f"""
+    WITH filtered_data AS (
+        SELECT * FROM v_traffic_normalized WHERE {_FILTERS}
+    ),
+    period_summary AS (
+        SELECT
+            date_trunc($time_unit, adjusted_time) as period,
+            SUM(in_count) as total_in_per_period
+        FROM filtered_data
+        GROUP BY period
+    )
+    SELECT
+        (SELECT SUM(in_count) FROM filtered_data) as total_in,
+        (SELECT AVG(total_in_per_period) FROM period_summary) as average_in,
+        (
+            SELECT strftime(period + INTERVAL 1 HOUR * $day_start_hour, $time_format)
+            FROM period_summary ORDER BY total_in_per_period DESC LIMIT 1
+        ) as peak_time,
+        (SELECT SUM(in_count) - SUM(out_count) FROM filtered_data) as current_occupancy,
+        (
+            SELECT store_name FROM filtered_data
+            GROUP BY store_name ORDER BY SUM(in_count) DESC LIMIT 1
+        ) as busiest_store
+    """,
+)
+
+TOTAL_IN = register(
+    "total_in",
+    f"SELECT SUM(in_count) as total FROM v_traffic_normalized WHERE {_FILTERS}",
+)
+
+TREND = register(
+    "trend",
+    f"""
+    SELECT
+        date_trunc($time_unit, adjusted_time) + INTERVAL 1 HOUR * $day_start_hour as x,
+        SUM(in_count) as y
+    FROM v_traffic_normalized
+    WHERE {_FILTERS}
+    GROUP BY x ORDER BY x
+    """,
+)
+
+STORE_COMPARISON = register(
+    "store_comparison",
+    f"""
+    SELECT store_name as x, SUM(in_count) as y
+    FROM v_traffic_normalized
+    WHERE {_FILTERS}
+    GROUP BY x ORDER BY y DESC
+    """,
+)
+
+TABLE_DETAILS = register(
+    "table_details",
+    f"""
+    WITH filtered_data AS (
+        SELECT * FROM v_traffic_normalized WHERE {_FILTERS}
+    ),
+    aggregated AS (
+        SELECT
+            date_trunc($time_unit, adjusted_time) as period_start,
+            SUM(in_count) as total_in
+        FROM filtered_data GROUP BY period_start
+    ),
+    with_lag AS (
+        -- Sử dụng hàm cửa sổ LAG để lấy giá trị của kỳ trước đó
+        SELECT *, LAG(total_in, 1, 0) OVER (ORDER BY period_start) as previous_in
+        FROM aggregated
+    )
+    SELECT
+        strftime(period_start + INTERVAL 1 HOUR * $day_start_hour, $time_format)
+            as period,
+        total_in,
+        CASE
+            WHEN previous_in = 0 THEN 0.0
+            ELSE ROUND(((total_in - previous_in) * 100.0) / previous_in, 1)
+        END as pct_change
+    FROM with_lag
+    ORDER BY period_start DESC
+    LIMIT 31
+    """,
+)
+
+STORES = register(
+    "stores", "SELECT DISTINCT store_name FROM dim_stores ORDER BY store_name"
+)
+
+LATEST_RECORD_TIME = register(
+    "latest_record_time", "SELECT MAX(recorded_at) as latest_time FROM fact_traffic"
+)
+
+ERROR_LOGS = register(
+    "error_logs",
+    """
+    SELECT
+        a.log_id as id,
+        b.store_name,
+        a.logged_at as log_time,
+        a.error_code,
+        a.error_message
+    FROM fact_errors AS a
+    LEFT JOIN dim_stores AS b ON a.store_id = b.store_id
+    ORDER BY a.logged_at DESC
+    LIMIT $max_rows
+    """,
+)
+
+ETL_RUNS = register(
+    "etl_runs",
+    """
+    SELECT *
+    FROM etl_runs
+    WHERE run_id IN (
+        SELECT run_id FROM etl_runs
+        GROUP BY run_id
+        ORDER BY MAX(started_at) DESC
+        LIMIT $runs
+    )
+    ORDER BY started_at DESC, dest_table
+    """,
+)
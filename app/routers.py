@@ -13,7 +13,7 @@ from typing import Annotated, List
 from fastapi import (APIRouter, Depends, Header, HTTPException, Query, Response,
                      status)
 
-from . import schemas
+from . import queries, schemas
 from .core.caching import clear_service_cache
 from .core.config import settings
 from .services import DashboardService
@@ -109,3 +109,48 @@ def clear_cache(x_internal_token: Annotated[str, Header()]):
         )
     clear_service_cache()
     return Response(status_code=status.HTTP_204_NO_CONTENT)
+
+
+@router.get(
+    "/admin/etl-runs",
+    tags=["Admin"],
+    summary="Số liệu các lần chạy ETL gần nhất",
+    response_model=List[schemas.EtlRun],
+)
+def get_etl_runs(
+    x_internal_token: Annotated[str, Header()],
+    runs: int = Query(10, ge=1, le=500, description="Số lần chạy gần nhất cần lấy"),
+):
+    """
+    Trả về số liệu theo từng bảng của các lần chạy ETL gần nhất.
+
+    Gồm số dòng, thời gian từng giai đoạn, thông lượng và bộ nhớ đỉnh, dùng để
+    theo dõi xu hướng và cảnh báo khi một giai đoạn chậm đi. Yêu cầu token
+    trong header `X-Internal-Token`.
+    """
+    if x_internal_token != settings.INTERNAL_API_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Token không hợp lệ."
+        )
+    return DashboardService.get_etl_runs(runs)
+
+
+@router.get(
+    "/admin/query-stats",
+    tags=["Admin"],
+    summary="Thời gian chuẩn bị và thực thi các truy vấn",
+    response_model=List[schemas.QueryStat],
+)
+def get_query_stats(x_internal_token: Annotated[str, Header()]):
+    """
+    Trả về số lần và tổng thời gian `PREPARE` (parse/plan) và `EXECUTE` của
+    từng truy vấn trong `app/queries.py`.
+
+    Số liệu thuộc về tiến trình worker trả lời request này. Yêu cầu token
+    trong header `X-Internal-Token`.
+    """
+    if x_internal_token != settings.INTERNAL_API_TOKEN:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN, detail="Token không hợp lệ."
+        )
+    return queries.stats()
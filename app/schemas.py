@@ -72,6 +72,46 @@ class ErrorLog(BaseModel):
     error_message: str
 
 
+class EtlRun(BaseModel):
+    """
+    Số liệu xử lý một bảng trong một lần chạy ETL (một dòng của `etl_runs`).
+    """
+    run_id: str
+    command: str
+    dest_table: str
+    status: str
+    started_at: datetime
+    finished_at: Optional[datetime] = None
+    rows_extracted: int
+    rows_transformed: int
+    rows_rejected: int
+    rows_loaded: int
+    bytes_written: int
+    extract_seconds: float
+    transform_seconds: float
+    write_seconds: float
+    load_seconds: float
+    total_seconds: float
+    rows_per_second: float
+    peak_rss_mb: Optional[float] = None
+    retries: int
+    watermark_before: Optional[str] = None
+    watermark_after: Optional[str] = None
+    error: Optional[str] = None
+
+
+class QueryStat(BaseModel):
+    """
+    Số lần và tổng thời gian chuẩn bị (parse/plan) và thực thi của một truy vấn
+    đã đăng ký, trong tiến trình worker trả lời request.
+    """
+    name: str
+    prepares: int
+    prepare_seconds: float
+    executions: int
+    execute_seconds: float
+
+
 class DashboardData(BaseModel):
     """
     Model tổng hợp, định nghĩa cấu trúc response cuối cùng cho API dashboard.
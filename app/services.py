@@ -2,10 +2,13 @@
 Module chứa lớp Service chịu trách nhiệm xử lý logic nghiệp vụ.
 
 Lớp `DashboardService` đóng gói tất cả các phương thức cần thiết để truy vấn,
-tính toán và định dạng dữ liệu cho dashboard từ kho dữ liệu DuckDB. Toàn bộ
-logic truy vấn phức tạp như xử lý outlier hay điều chỉnh "ngày làm việc" đã
-được chuyển vào VIEW `v_traffic_normalized` trong DuckDB, giúp cho service
-này trở nên tinh gọn và chỉ tập trung vào việc tổng hợp dữ liệu.
+tính toán và định dạng dữ liệu cho dashboard từ kho dữ liệu DuckDB. Outlier
+đã được hiệu chỉnh khi nạp dữ liệu (`app/etl/outliers.py`) và việc điều chỉnh
+"ngày làm việc" nằm trong VIEW `v_traffic_normalized` của DuckDB, giúp cho
+service này trở nên tinh gọn và chỉ tập trung vào việc tổng hợp dữ liệu.
+
+Câu lệnh SQL được định nghĩa một lần trong `app/queries.py`; service chỉ tính
+giá trị các tham số cho từng request.
 """
 
 import asyncio
@@ -16,12 +19,17 @@ from typing import Any, Dict, List, Optional, Tuple
 import pandas as pd
 from dateutil.relativedelta import relativedelta
 
+from . import queries
 from .core.caching import async_cache
 from .core.config import settings
-from .dependencies import query_db_to_df
+from .queries import query_to_df
+from .utils.profiling import profiled
 
 logger = logging.getLogger(__name__)
 
+# Đơn vị gom nhóm thời gian (`date_trunc`) theo khoảng thời gian xem.
+TIME_UNITS = {"year": "month", "month": "day", "week": "day", "day": "hour"}
+
 
 class DashboardService:
     """
@@ -62,27 +70,41 @@ class DashboardService:
             end_dt.strftime("%Y-%m-%d %H:%M:%S"),
         )
 
-    def _get_base_filters(self) -> Tuple[str, list]:
+    def _get_filter_params(self, start_date: date, end_date: date) -> Dict[str, Any]:
         """
-        Tạo mệnh đề WHERE và các tham số tương ứng cho các truy vấn.
+        Tạo tham số cho điều kiện lọc chung của các truy vấn (`queries._FILTERS`).
 
-        Hàm helper này giúp tái sử dụng logic lọc dữ liệu theo khoảng thời gian
-        và cửa hàng, tránh lặp lại code.
+        Gồm khoảng thời gian của "ngày làm việc", khoảng `year`/`month` tương
+        ứng (để bỏ qua các partition nằm ngoài khoảng) và cửa hàng.
         """
-        start_str, end_str = self._get_date_range_params(
-            self.start_date, self.end_date
-        )
-        params = [start_str, end_str]
-
-        filter_clauses = "WHERE record_time >= ? AND record_time < ?"
+        start_str, end_str = self._get_date_range_params(start_date, end_date)
+        first = datetime.fromisoformat(start_str)
+        last = datetime.fromisoformat(end_str) - timedelta(microseconds=1)
+        same_year = first.year == last.year
+
+        return {
+            "start_time": start_str,
+            "end_time": end_str,
+            "first_year": first.year,
+            "last_year": last.year,
+            "first_month": first.month if same_year else 1,
+            "last_month": last.month if same_year else 12,
+            "store": self.store,
+        }
 
-        if self.store != "all":
-            filter_clauses += " AND store_name = ?"
-            params.append(self.store)
+    def _get_base_params(self) -> Dict[str, Any]:
+        """
+        Tạo tham số chung cho các truy vấn theo bộ lọc của service.
 
-        return filter_clauses, params
+        Gồm điều kiện lọc theo khoảng thời gian, cửa hàng và giờ bắt đầu của
+        "ngày làm việc".
+        """
+        params = self._get_filter_params(self.start_date, self.end_date)
+        params["day_start_hour"] = settings.WORKING_HOUR_START
+        return params
 
     @async_cache
+    @profiled()
     async def get_metrics(self) -> Dict[str, Any]:
         """
         Tính toán các chỉ số chính (KPIs) cho dashboard.
@@ -91,47 +113,18 @@ class DashboardService:
         hiện tại, cửa hàng đông nhất và tỷ lệ tăng trưởng so với kỳ trước.
         Sử dụng `asyncio.gather` để chạy các truy vấn song song.
         """
-        filter_clauses, params = self._get_base_filters()
-
-        time_unit_map = {
-            "year": "month",
-            "month": "day",
-            "week": "day",
-            "day": "hour",
-        }
         peak_time_format_map = {
             "day": "%H:%M",
             "week": "%d/%m",
             "month": "%d/%m",
             "year": "Tháng %m",
         }
-        time_unit = time_unit_map.get(self.period, "day")
-        peak_time_format = peak_time_format_map.get(self.period, "%d/%m")
+        params = self._get_base_params()
+        params["time_unit"] = TIME_UNITS.get(self.period, "day")
+        params["time_format"] = peak_time_format_map.get(self.period, "%d/%m")
 
         # Truy vấn chính để lấy hầu hết các metrics trong một lần.
-        query = f"""
-        WITH filtered_data AS (
-            SELECT * FROM v_traffic_normalized
-            {filter_clauses}
-        ),
-        period_summary AS (
-            SELECT
-                date_trunc('{time_unit}', adjusted_time) as period,
-                SUM(in_count) as total_in_per_period
-            FROM filtered_data
-            GROUP BY period
-        )
-        SELECT
-            (SELECT SUM(in_count) FROM filtered_data) as total_in,
-            (SELECT AVG(total_in_per_period) FROM period_summary) as average_in,
-            (
-                SELECT strftime(period + INTERVAL '{settings.WORKING_HOUR_START} hours', '{peak_time_format}')
-                FROM period_summary ORDER BY total_in_per_period DESC LIMIT 1
-            ) as peak_time,
-            (SELECT SUM(in_count) - SUM(out_count) FROM filtered_data) as current_occupancy,
-            (SELECT store_name FROM filtered_data GROUP BY store_name ORDER BY SUM(in_count) DESC LIMIT 1) as busiest_store
-        """
-        df_task = asyncio.to_thread(query_db_to_df, query, params=params)
+        df_task = asyncio.to_thread(query_to_df, queries.METRICS, params)
         prev_total_task = self._get_previous_period_total_in()
 
         df, prev_total = await asyncio.gather(df_task, prev_total_task)
@@ -176,43 +169,26 @@ class DashboardService:
 
         prev_start_date = self.start_date - relativedelta(**delta)
         prev_end_date = self.end_date - relativedelta(**delta)
-        
-        start_str, end_str = self._get_date_range_params(
-            prev_start_date, prev_end_date
-        )
-        params = [start_str, end_str]
-        filter_clauses = "WHERE record_time >= ? AND record_time < ?"
-        if self.store != "all":
-            filter_clauses += " AND store_name = ?"
-            params.append(self.store)
 
-        query = f"SELECT SUM(in_count) as total FROM v_traffic_normalized {filter_clauses}"
-        df = await asyncio.to_thread(query_db_to_df, query, params=params)
+        params = self._get_filter_params(prev_start_date, prev_end_date)
+        df = await asyncio.to_thread(query_to_df, queries.TOTAL_IN, params)
 
         return 0 if df.empty or pd.isna(df["total"].iloc[0]) else int(df["total"].iloc[0])
 
     @staticmethod
     def get_all_stores() -> List[str]:
         """Lấy danh sách duy nhất tất cả các cửa hàng (static method)."""
-        df = query_db_to_df("SELECT DISTINCT store_name FROM dim_stores ORDER BY store_name")
+        df = query_to_df(queries.STORES)
         return [] if df.empty else df["store_name"].tolist()
 
     @async_cache
+    @profiled()
     async def get_trend_chart_data(self) -> List[Dict[str, Any]]:
         """Lấy dữ liệu chuỗi thời gian cho biểu đồ xu hướng."""
-        filter_clauses, params = self._get_base_filters()
-        time_unit = {"year": "month", "month": "day", "week": "day", "day": "hour"}.get(self.period, "day")
-
-        query = f"""
-        SELECT
-            (date_trunc('{time_unit}', adjusted_time) + INTERVAL '{settings.WORKING_HOUR_START} hours') as x,
-            SUM(in_count) as y
-        FROM v_traffic_normalized
-        {filter_clauses}
-        GROUP BY x ORDER BY x
-        """
-        df = await asyncio.to_thread(query_db_to_df, query, params=params)
-        
+        time_unit = TIME_UNITS.get(self.period, "day")
+        params = {**self._get_base_params(), "time_unit": time_unit}
+        df = await asyncio.to_thread(query_to_df, queries.TREND, params)
+
         # Định dạng lại trục X cho dễ đọc trên biểu đồ
         if time_unit == "month":
             df["x"] = pd.to_datetime(df["x"]).dt.strftime("%Y-%m")
@@ -224,52 +200,25 @@ class DashboardService:
         return df.to_dict(orient="records")
 
     @async_cache
+    @profiled()
     async def get_store_comparison_chart_data(self) -> List[Dict[str, Any]]:
         """Lấy dữ liệu phân bổ lượt khách theo từng cửa hàng."""
-        filter_clauses, params = self._get_base_filters()
-        query = f"""
-            SELECT store_name as x, SUM(in_count) as y
-            FROM v_traffic_normalized
-            {filter_clauses}
-            GROUP BY x ORDER BY y DESC
-        """
-        df = await asyncio.to_thread(query_db_to_df, query, params=params)
+        params = self._get_filter_params(self.start_date, self.end_date)
+        df = await asyncio.to_thread(query_to_df, queries.STORE_COMPARISON, params)
         return df.to_dict(orient="records")
 
     @async_cache
+    @profiled()
     async def get_table_details(self) -> Dict[str, Any]:
         """Lấy dữ liệu chi tiết cho bảng, giới hạn 31 dòng gần nhất."""
-        filter_clauses, params = self._get_base_filters()
-        time_unit = {"year": "month", "month": "day", "week": "day", "day": "hour"}.get(self.period, "day")
+        time_unit = TIME_UNITS.get(self.period, "day")
         date_format = {"hour": "%Y-%m-%d %H:00", "day": "%Y-%m-%d", "month": "%Y-%m"}.get(time_unit, "%Y-%m-%d")
-
-        query = f"""
-        WITH filtered_data AS (
-            SELECT * FROM v_traffic_normalized {filter_clauses}
-        ),
-        aggregated AS (
-            SELECT
-                date_trunc('{time_unit}', adjusted_time) as period_start,
-                SUM(in_count) as total_in
-            FROM filtered_data GROUP BY period_start
-        ),
-        with_lag AS (
-            -- Sử dụng hàm cửa sổ LAG để lấy giá trị của kỳ trước đó
-            SELECT *, LAG(total_in, 1, 0) OVER (ORDER BY period_start) as previous_in
-            FROM aggregated
-        )
-        SELECT
-            strftime(period_start + INTERVAL '{settings.WORKING_HOUR_START} hours', '{date_format}') as period,
-            total_in,
-            CASE
-                WHEN previous_in = 0 THEN 0.0
-                ELSE ROUND(((total_in - previous_in) * 100.0) / previous_in, 1)
-            END as pct_change
-        FROM with_lag
-        ORDER BY period_start DESC
-        LIMIT 31
-        """
-        df = await asyncio.to_thread(query_db_to_df, query, params=params)
+        params = {
+            **self._get_base_params(),
+            "time_unit": time_unit,
+            "time_format": date_format,
+        }
+        df = await asyncio.to_thread(query_to_df, queries.TABLE_DETAILS, params)
 
         if df.empty:
             return {"data": [], "summary": {"total_sum": 0, "average_in": 0}}
@@ -285,7 +234,7 @@ class DashboardService:
     @staticmethod
     def get_latest_record_time() -> Optional[datetime]:
         """Lấy thời gian của bản ghi gần nhất trong toàn bộ dữ liệu."""
-        df = query_db_to_df("SELECT MAX(recorded_at) as latest_time FROM fact_traffic")
+        df = query_to_df(queries.LATEST_RECORD_TIME)
         if df.empty or pd.isna(df["latest_time"].iloc[0]):
             return None
         return df["latest_time"].iloc[0]
@@ -293,17 +242,12 @@ class DashboardService:
     @staticmethod
     def get_error_logs(limit: int = 100) -> List[Dict[str, Any]]:
         """Lấy các log lỗi gần nhất từ bảng `fact_errors`."""
-        query = """
-        SELECT
-            a.log_id as id,
-            b.store_name,
-            a.logged_at as log_time,
-            a.error_code,
-            a.error_message
-        FROM fact_errors AS a
-        LEFT JOIN dim_stores AS b ON a.store_id = b.store_id
-        ORDER BY a.logged_at DESC
-        LIMIT ?
-        """
-        df = query_db_to_df(query, params=[limit])
+        df = query_to_df(queries.ERROR_LOGS, {"max_rows": limit})
         return df.to_dict(orient="records")
+
+    @staticmethod
+    def get_etl_runs(runs: int = 10) -> List[Dict[str, Any]]:
+        """Lấy số liệu của `runs` lần chạy ETL gần nhất từ bảng `etl_runs`."""
+        df = query_to_df(queries.ETL_RUNS, {"runs": runs})
+        # Chuyển NaN/NaT thành None để khớp với các trường Optional của schema.
+        return df.astype(object).where(df.notna(), None).to_dict(orient="records")
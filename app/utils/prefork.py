@@ -0,0 +1,212 @@
+"""
+Module chạy API với nhiều tiến trình worker (pre-fork) cho môi trường production.
+
+Tiến trình cha (master):
+1. Import ứng dụng một lần trước khi fork (preload): settings, các tệp YAML,
+   pandas/pyarrow/DuckDB và template được nạp sẵn, các worker dùng chung các
+   trang bộ nhớ này (copy-on-write) và khởi động gần như tức thì.
+2. Mở socket lắng nghe một lần rồi fork N worker cùng nhận kết nối trên
+   socket đó; mỗi worker là một Uvicorn server với event loop riêng, nên
+   phần tính toán pandas/DuckDB của các request chạy song song trên nhiều
+   nhân CPU.
+3. Giám sát các worker: worker thoát (ví dụ sau `max_requests` request, để
+   thu hồi bộ nhớ) được thay bằng worker mới. SIGTERM/SIGINT được chuyển cho
+   các worker để chúng hoàn tất các request đang xử lý rồi thoát; SIGHUP thay
+   lần lượt toàn bộ worker mà không đóng socket (graceful reload).
+
+Kết nối DuckDB không an toàn khi fork nên không được mở ở tiến trình cha: mỗi
+worker tự mở snapshot và làm nóng trong sự kiện startup, trước khi nhận
+request (xem `app/main.py`).
+"""
+
+import logging
+import os
+import random
+import signal
+import socket
+import time
+from typing import Dict, List, Optional
+
+import uvicorn
+from uvicorn.importer import import_from_string
+
+logger = logging.getLogger(__name__)
+
+# Worker thoát với mã lỗi sớm hơn mốc này được coi là lỗi khởi động.
+_MIN_WORKER_LIFETIME = 5.0
+_POLL_INTERVAL = 0.5
+
+
+class PreforkServer:
+    """
+    Tiến trình master quản lý các worker Uvicorn dùng chung một socket.
+
+    Args:
+        app: Đường dẫn import của ứng dụng ASGI (ví dụ `app.main:api_app`).
+        host: Host lắng nghe.
+        port: Port lắng nghe.
+        workers: Số tiến trình worker.
+        max_requests: Số request tối đa của một worker trước khi được thay
+            mới (0 = không giới hạn).
+        max_requests_jitter: Độ lệch ngẫu nhiên cộng thêm vào `max_requests`
+            để các worker không khởi động lại cùng một lúc.
+        graceful_timeout: Thời gian (giây) chờ worker hoàn tất request khi
+            dừng, quá thời gian này worker bị buộc dừng.
+    """
+
+    def __init__(
+        self,
+        app: str,
+        host: str,
+        port: int,
+        workers: int,
+        max_requests: int = 0,
+        max_requests_jitter: int = 0,
+        graceful_timeout: int = 30,
+    ):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.num_workers = max(1, workers)
+        self.max_requests = max_requests
+        self.max_requests_jitter = max_requests_jitter
+        self.graceful_timeout = graceful_timeout
+        self.workers: Dict[int, float] = {}
+        self._asgi_app = None
+        self._socket: Optional[socket.socket] = None
+        self._stopping = False
+        self._reload = False
+        self._failures = 0
+
+    def _config(self) -> uvicorn.Config:
+        """Cấu hình Uvicorn cho một worker."""
+        limit = None
+        if self.max_requests > 0:
+            limit = self.max_requests + random.randint(0, self.max_requests_jitter)
+        return uvicorn.Config(
+            self._asgi_app,
+            host=self.host,
+            port=self.port,
+            limit_max_requests=limit,
+            timeout_graceful_shutdown=self.graceful_timeout,
+        )
+
+    def _spawn(self) -> int:
+        """Fork một worker mới, trả về pid của nó."""
+        pid = os.fork()
+        if pid == 0:
+            exit_code = 0
+            try:
+                # Bỏ các handler kế thừa từ master: Uvicorn tự cài handler cho
+                # SIGINT/SIGTERM khi chạy, còn SIGHUP chỉ dành cho master.
+                for sig in (signal.SIGHUP, signal.SIGINT, signal.SIGTERM):
+                    signal.signal(sig, signal.SIG_IGN)
+                random.seed()
+                server = uvicorn.Server(self._config())
+                server.run(sockets=[self._socket])
+                if not server.started:
+                    exit_code = 3
+            except BaseException:
+                logger.exception(f"Worker {os.getpid()} dừng do lỗi.")
+                exit_code = 1
+            finally:
+                os._exit(exit_code)
+
+        self.workers[pid] = time.monotonic()
+        logger.info(f"Đã khởi động worker {pid}.")
+        return pid
+
+    def _signal_workers(self, sig: int, pids: Optional[List[int]] = None):
+        """Gửi tín hiệu tới các worker (mặc định: tất cả)."""
+        for pid in list(self.workers) if pids is None else pids:
+            try:
+                os.kill(pid, sig)
+            except ProcessLookupError:
+                self.workers.pop(pid, None)
+
+    def _handle_stop(self, signum, _frame):
+        """Handler SIGTERM/SIGINT của master: dừng toàn bộ một cách an toàn."""
+        if not self._stopping:
+            logger.info(f"Nhận tín hiệu {signal.Signals(signum).name}, đang dừng...")
+        self._stopping = True
+
+    def _handle_reload(self, _signum, _frame):
+        """Handler SIGHUP của master: thay lần lượt toàn bộ worker."""
+        self._reload = True
+
+    def _reap(self) -> List[int]:
+        """Thu hồi các worker đã thoát, trả về danh sách pid."""
+        exited = []
+        while self.workers:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                break
+            if pid == 0:
+                break
+            started = self.workers.pop(pid, None)
+            if started is None:
+                continue
+            exited.append(pid)
+            code = os.waitstatus_to_exitcode(status)
+            if code != 0 and time.monotonic() - started < _MIN_WORKER_LIFETIME:
+                self._failures += 1
+                logger.error(f"Worker {pid} lỗi khi khởi động (mã {code}).")
+            else:
+                self._failures = 0
+                logger.info(f"Worker {pid} đã thoát (mã {code}).")
+        return exited
+
+    def _rolling_restart(self):
+        """Khởi động worker mới trước, rồi mới dừng worker cũ tương ứng."""
+        logger.info("Đang thay mới toàn bộ worker (SIGHUP)...")
+        for pid in list(self.workers):
+            self._spawn()
+            self._signal_workers(signal.SIGTERM, [pid])
+
+    def _shutdown(self):
+        """Dừng các worker: chờ chúng hoàn tất, quá hạn thì buộc dừng."""
+        self._signal_workers(signal.SIGTERM)
+        deadline = time.monotonic() + self.graceful_timeout + 5
+        while self.workers and time.monotonic() < deadline:
+            self._reap()
+            time.sleep(0.1)
+        if self.workers:
+            logger.warning(f"Buộc dừng {len(self.workers)} worker quá hạn.")
+            self._signal_workers(signal.SIGKILL)
+            for pid in list(self.workers):
+                os.waitpid(pid, 0)
+            self.workers.clear()
+
+    def run(self):
+        """Nạp ứng dụng, mở socket, chạy các worker cho tới khi nhận tín hiệu dừng."""
+        self._asgi_app = import_from_string(self.app)
+        self._socket = self._config().bind_socket()
+        logger.info(
+            f"Master {os.getpid()}: đã nạp '{self.app}', khởi động "
+            f"{self.num_workers} worker tại http://{self.host}:{self.port}"
+        )
+
+        signal.signal(signal.SIGTERM, self._handle_stop)
+        signal.signal(signal.SIGINT, self._handle_stop)
+        signal.signal(signal.SIGHUP, self._handle_reload)
+        try:
+            for _ in range(self.num_workers):
+                self._spawn()
+            while not self._stopping:
+                time.sleep(_POLL_INTERVAL)
+                self._reap()
+                if self._reload:
+                    self._reload = False
+                    self._rolling_restart()
+                missing = self.num_workers - len(self.workers)
+                if missing > 0 and not self._stopping:
+                    if self._failures >= self.num_workers:
+                        # Tránh fork liên tục khi ứng dụng không khởi động được.
+                        time.sleep(min(30, self._failures))
+                    for _ in range(missing):
+                        self._spawn()
+        finally:
+            self._shutdown()
+            self._socket.close()
+            logger.info("Master đã dừng.")
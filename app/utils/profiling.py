@@ -0,0 +1,259 @@
+"""
+Module đo bộ nhớ (memory profiling) cho ETL và API, chỉ bật khi cần.
+
+Khi được bật (`PROFILE_MEMORY=true` hoặc `--profile` của `run-etl`/`serve`),
+`tracemalloc` được khởi động và mỗi khối được đánh dấu bằng `profile()` hoặc
+`@profiled` ghi nhận:
+- thời gian, RSS của tiến trình khi kết thúc khối,
+- bộ nhớ Python cao nhất trong khối và phần bộ nhớ còn giữ lại sau khối.
+
+Số liệu được gộp theo nhãn (ví dụ `fact_traffic.transform`,
+`transform._handle_data_types`, `DashboardService.get_metrics`). Tại thời
+điểm bộ nhớ Python còn giữ lại cao nhất, một snapshot được chụp để liệt kê các
+dòng mã cấp phát nhiều nhất. `write_report()` ghi báo cáo JSON vào
+`PROFILE_DIR`.
+
+Khi tắt, các hook chỉ tốn một phép kiểm tra cờ. Lưu ý `tracemalloc` theo dõi
+toàn tiến trình: khi nhiều bảng/request chạy song song, số liệu của các khối
+chồng lấn nhau chỉ mang tính tương đối. Bộ nhớ do Arrow cấp phát ngoài heap
+Python chỉ thể hiện qua RSS.
+"""
+
+import asyncio
+import functools
+import json
+import logging
+import os
+import time
+import tracemalloc
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from threading import Lock
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+from ..core.config import settings
+
+logger = logging.getLogger(__name__)
+
+_MB = 1024 * 1024
+_TOP_ALLOCATIONS = 25
+
+_enabled = False
+_lock = Lock()
+_stats: Dict[str, "_LabelStats"] = {}
+_top_snapshot: Optional[tracemalloc.Snapshot] = None
+_top_snapshot_label: Optional[str] = None
+_top_snapshot_bytes = 0
+
+# Chuỗi các khối đang mở của luồng/task hiện tại (dùng contextvars để các
+# coroutine chạy xen kẽ không làm lẫn thứ tự lồng nhau).
+_open_blocks: ContextVar[Tuple["Block", ...]] = ContextVar("open_blocks", default=())
+
+
+@dataclass
+class Block:
+    """Một khối đang được đo; `peak` là bộ nhớ Python cao nhất (byte)."""
+
+    label: str
+    peak: int = 0
+
+
+@dataclass
+class _LabelStats:
+    """Số liệu gộp của một nhãn."""
+
+    calls: int = 0
+    seconds: float = 0.0
+    max_peak: int = 0
+    max_retained: int = 0
+    max_rss: Optional[int] = None
+
+
+def _current_rss() -> Optional[int]:
+    """RSS hiện tại của tiến trình (byte), đọc từ `/proc` trên Linux."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        return None
+
+
+def enable():
+    """Bật đo bộ nhớ cho tiến trình hiện tại."""
+    global _enabled
+    if _enabled:
+        return
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(10)
+    _enabled = True
+    logger.info("🔬 Đã bật memory profiling (tracemalloc).")
+
+
+def is_enabled() -> bool:
+    """Memory profiling có đang bật hay không."""
+    return _enabled
+
+
+def _record(label: str, seconds: float, peak: int, retained: int):
+    """Gộp số liệu của một khối vừa kết thúc và chụp snapshot nếu cần."""
+    global _top_snapshot, _top_snapshot_label, _top_snapshot_bytes
+    current = tracemalloc.get_traced_memory()[0]
+    rss = _current_rss()
+    with _lock:
+        stats = _stats.setdefault(label, _LabelStats())
+        stats.calls += 1
+        stats.seconds += seconds
+        stats.max_peak = max(stats.max_peak, peak)
+        stats.max_retained = max(stats.max_retained, retained)
+        if rss is not None:
+            stats.max_rss = max(stats.max_rss or 0, rss)
+        take_snapshot = current > _top_snapshot_bytes
+        if take_snapshot:
+            _top_snapshot_bytes = current
+    if take_snapshot:
+        snapshot = tracemalloc.take_snapshot()
+        with _lock:
+            _top_snapshot, _top_snapshot_label = snapshot, label
+
+
+@contextmanager
+def profile(label: str) -> Iterator[Block]:
+    """
+    Đo bộ nhớ của khối `with`.
+
+    Luôn trả về một `Block`; `block.peak` chỉ có ý nghĩa khi `tracemalloc`
+    đang chạy. Số liệu chỉ được đưa vào báo cáo khi profiling được bật. Các
+    khối có thể lồng nhau: khối ngoài vẫn nhận được đỉnh bộ nhớ của khối trong.
+    """
+    block = Block(label)
+    if not tracemalloc.is_tracing():
+        yield block
+        return
+
+    parents = _open_blocks.get()
+    current, peak_so_far = tracemalloc.get_traced_memory()
+    if parents:
+        # `reset_peak` xóa đỉnh hiện tại, nên chuyển nó cho khối cha trước.
+        parents[-1].peak = max(parents[-1].peak, peak_so_far)
+    tracemalloc.reset_peak()
+    token = _open_blocks.set(parents + (block,))
+    started = time.perf_counter()
+    try:
+        yield block
+    finally:
+        elapsed = time.perf_counter() - started
+        _open_blocks.reset(token)
+        after, peak = tracemalloc.get_traced_memory()
+        block.peak = max(block.peak, peak)
+        if parents:
+            parents[-1].peak = max(parents[-1].peak, block.peak)
+        if _enabled:
+            _record(label, elapsed, block.peak, max(0, after - current))
+
+
+def profiled(label: Optional[str] = None) -> Callable:
+    """
+    Decorator đo bộ nhớ của một hàm (đồng bộ hoặc `async`) khi profiling bật.
+
+    Args:
+        label: Nhãn trong báo cáo (mặc định: `<module>.<tên hàm>`).
+    """
+
+    def decorator(func: Callable) -> Callable:
+        name = label or f"{func.__module__.split('.')[-1]}.{func.__qualname__}"
+
+        if asyncio.iscoroutinefunction(func):
+
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                if not _enabled:
+                    return await func(*args, **kwargs)
+                with profile(name):
+                    return await func(*args, **kwargs)
+
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with profile(name):
+                return func(*args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def report() -> Dict[str, Any]:
+    """Báo cáo hiện tại: số liệu theo nhãn và các dòng mã cấp phát nhiều nhất."""
+    with _lock:
+        stats = dict(_stats)
+        snapshot, snapshot_label = _top_snapshot, _top_snapshot_label
+    current, peak = tracemalloc.get_traced_memory() if _enabled else (0, 0)
+
+    top: List[Dict[str, Any]] = []
+    if snapshot is not None:
+        for stat in snapshot.statistics("lineno")[:_TOP_ALLOCATIONS]:
+            frame = stat.traceback[0]
+            top.append(
+                {
+                    "location": f"{frame.filename}:{frame.lineno}",
+                    "size_mb": stat.size / _MB,
+                    "count": stat.count,
+                }
+            )
+
+    return {
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "traced_current_mb": current / _MB,
+        "traced_peak_mb": peak / _MB,
+        "rss_mb": (_current_rss() or 0) / _MB,
+        "blocks": {
+            label: {
+                "calls": s.calls,
+                "seconds": s.seconds,
+                "max_peak_mb": s.max_peak / _MB,
+                "max_retained_mb": s.max_retained / _MB,
+                "max_rss_mb": s.max_rss / _MB if s.max_rss is not None else None,
+            }
+            for label, s in sorted(
+                stats.items(), key=lambda item: item[1].max_peak, reverse=True
+            )
+        },
+        "top_allocations_at": snapshot_label,
+        "top_allocations": top,
+    }
+
+
+def write_report(name: str, directory: Optional[Path] = None) -> Optional[Path]:
+    """
+    Ghi báo cáo profiling ra tệp JSON.
+
+    Args:
+        name: Tên lệnh/tiến trình (dùng trong tên tệp), ví dụ `run-etl`.
+        directory: Thư mục chứa báo cáo (mặc định: `PROFILE_DIR`).
+
+    Returns:
+        Đường dẫn tệp báo cáo, hoặc None nếu profiling không bật.
+    """
+    if not _enabled:
+        return None
+    directory = directory or settings.PROFILE_DIR
+    directory.mkdir(parents=True, exist_ok=True)
+    stamp = f"{datetime.now():%Y%m%d%H%M%S}_{os.getpid()}"
+    path = directory / f"memory_{name}_{stamp}.json"
+    data = report()
+    with path.open("w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+
+    for label, block in list(data["blocks"].items())[:5]:
+        logger.info(
+            f"🔬 {label}: đỉnh {block['max_peak_mb']:,.1f} MB, "
+            f"giữ lại {block['max_retained_mb']:,.1f} MB ({block['calls']} lần)"
+        )
+    logger.info(f"🔬 Báo cáo memory profiling: '{path}'")
+    return path
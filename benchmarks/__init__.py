@@ -0,0 +1 @@
+"""Các kịch bản đo hiệu năng (benchmark) cho pipeline ETL."""
@@ -0,0 +1,164 @@
+"""
+Benchmark thời gian import của API (cold start).
+
+Chạy `python -X importtime -c "import app.main"` trong các tiến trình riêng,
+lấy thời gian import tích lũy của `app.main` (trung vị của các lần chạy) và
+liệt kê các module tốn thời gian nhất. Đây là phần lớn thời gian một worker
+cần trước khi mở port, nên quyết định độ dài của mỗi lần khởi động lại.
+
+Benchmark cũng kiểm tra API không import các module chỉ pipeline ETL dùng
+(`app.etl`, SQLAlchemy, pandera, PyYAML...), và thoát với mã lỗi 1 nếu thời
+gian import vượt `--budget-ms` hoặc có module bị cấm được import.
+
+Cách chạy:
+    python -m benchmarks.api_startup
+    python -m benchmarks.api_startup --runs 10 --budget-ms 1500
+"""
+
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+import typer
+
+ROOT = Path(__file__).resolve().parent.parent
+TARGET = "app.main"
+
+# Các module (và module con) chỉ pipeline ETL hoặc CLI cần.
+ETL_ONLY_MODULES = (
+    "app.etl",
+    "sqlalchemy",
+    "pyodbc",
+    "pandera",
+    "yaml",
+    "requests",
+    "tenacity",
+    "typer",
+)
+
+
+def _parse_importtime(output: str) -> List[Tuple[str, int, int, int]]:
+    """
+    Đọc kết quả của `-X importtime`.
+
+    Returns:
+        Danh sách (module, self_us, cumulative_us, độ sâu) theo thứ tự in ra.
+    """
+    entries = []
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:") :].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((name.strip(), int(self_us), int(cumulative_us), depth))
+    return entries
+
+
+def measure_once() -> List[Tuple[str, int, int, int]]:
+    """Import `app.main` trong một tiến trình mới và trả về kết quả đo."""
+    env = dict(os.environ)
+    # API bắt buộc có token; giá trị không quan trọng khi chỉ import.
+    env.setdefault("INTERNAL_API_TOKEN", "benchmark")
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {TARGET}"],
+        cwd=ROOT,
+        env=env,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        typer.echo(result.stderr[-2000:], err=True)
+        raise typer.Exit(code=2)
+    return _parse_importtime(result.stderr)
+
+
+def _target_entries(
+    entries: List[Tuple[str, int, int, int]],
+) -> List[Tuple[str, int, int, int]]:
+    """
+    Các module được import bởi `app.main` (kể cả chính nó).
+
+    Module con được in trước module cha, nên đó là các dòng nằm giữa module
+    gốc liền trước và dòng của `app.main`.
+    """
+    start = 0
+    for i, (name, _self_us, _cumulative_us, depth) in enumerate(entries):
+        if depth != 0:
+            continue
+        if name == TARGET:
+            return entries[start : i + 1]
+        start = i + 1
+    return []
+
+
+def find_etl_imports(entries: List[Tuple[str, int, int, int]]) -> List[str]:
+    """Các module chỉ dành cho ETL đã bị import theo `app.main`."""
+    return sorted(
+        {
+            name
+            for name, *_ in entries
+            if any(
+                name == module or name.startswith(f"{module}.")
+                for module in ETL_ONLY_MODULES
+            )
+        }
+    )
+
+
+def main(
+    runs: int = typer.Option(5, min=1, help="Số lần đo (mỗi lần một tiến trình)."),
+    budget_ms: float = typer.Option(
+        1500, help="Ngân sách thời gian import của `app.main` (ms)."
+    ),
+    top: int = typer.Option(10, min=0, help="Số module tốn thời gian nhất cần in."),
+):
+    """Đo thời gian import của API và so sánh với ngân sách."""
+    # Lần chạy đầu có thể phải biên dịch bytecode, không tính vào kết quả.
+    measure_once()
+
+    totals: List[float] = []
+    cumulative: Dict[str, List[int]] = {}
+    entries: List[Tuple[str, int, int, int]] = []
+    for _ in range(runs):
+        entries = _target_entries(measure_once())
+        for name, _self_us, cumulative_us, depth in entries:
+            if depth == 0:
+                totals.append(cumulative_us / 1000)
+            elif depth == 1:
+                cumulative.setdefault(name, []).append(cumulative_us)
+
+    total_ms = statistics.median(totals)
+    typer.echo(
+        f"{TARGET}: {total_ms:,.0f} ms (trung vị của {runs} lần, "
+        f"min {min(totals):,.0f} ms, max {max(totals):,.0f} ms)"
+    )
+    slowest = sorted(
+        ((statistics.median(v) / 1000, name) for name, v in cumulative.items()),
+        reverse=True,
+    )
+    for ms, name in slowest[:top]:
+        typer.echo(f"  {ms:>8,.1f} ms  {name}")
+
+    failures = []
+    etl_imports = find_etl_imports(entries)
+    if etl_imports:
+        failures.append(
+            f"API import các module chỉ dành cho ETL: {', '.join(etl_imports)}"
+        )
+    if total_ms > budget_ms:
+        failures.append(
+            f"Thời gian import {total_ms:,.0f} ms > ngân sách {budget_ms:,.0f} ms"
+        )
+    if failures:
+        typer.echo("❌ Khởi động API vượt ngân sách:")
+        for line in failures:
+            typer.echo(f"  - {line}")
+        raise typer.Exit(code=1)
+    typer.echo(f"✅ Thời gian import trong ngân sách {budget_ms:,.0f} ms.")
+
+
+if __name__ == "__main__":
+    typer.run(main)
@@ -0,0 +1,301 @@
+"""
+Benchmark thông lượng end-to-end của pipeline ETL.
+
+Sinh một nguồn dữ liệu tổng hợp (`store`, `num_crowd`, `ErrLog`) dưới dạng tệp
+SQLite hoặc thư mục Parquet (xem `app/etl/sources.py`), rồi chạy đúng pipeline
+thật (`cli._process_table`: extract -> transform -> ParquetLoader ->
+refresh_duckdb_table) cho từng bảng và từng kích thước chunk. Mỗi trường hợp
+chạy trong một tiến trình riêng với thư mục dữ liệu riêng, nên bộ nhớ đỉnh
+(peak RSS) không bị lẫn giữa các trường hợp.
+
+Báo cáo số dòng/giây của từng giai đoạn và bộ nhớ đỉnh. Với `--trace-memory`,
+bộ nhớ Python cao nhất của từng giai đoạn được đo bằng `tracemalloc` (chậm
+hơn đáng kể, chỉ dùng để tìm giai đoạn giữ bộ nhớ).
+
+Kết quả có thể được lưu làm baseline (`--save-baseline`); các lần chạy sau so
+sánh với baseline và thoát với mã lỗi 1 nếu thông lượng giảm (hoặc bộ nhớ
+tăng) quá ngưỡng `--threshold`.
+
+Cách chạy:
+    python -m benchmarks.etl_pipeline --rows 1000000 --chunk-sizes auto,50000,200000
+    python -m benchmarks.etl_pipeline --rows 1000000 --save-baseline
+"""
+
+import json
+import logging
+import multiprocessing
+import os
+import sqlite3
+import tempfile
+import threading
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import typer
+
+from benchmarks.transform_engines import make_err_log, make_num_crowd
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "etl_pipeline.json"
+TABLES = ["store", "num_crowd", "ErrLog"]
+STAGES = ("extract", "transform", "write", "load")
+
+
+def make_store(stores: int = 15) -> pd.DataFrame:
+    """Sinh dữ liệu giống bảng `dbo.store`."""
+    store_ids = np.arange(25, 25 + stores)
+    return pd.DataFrame(
+        {"tid": store_ids, "name": [f" Cửa hàng {i} " for i in store_ids]}
+    )
+
+
+def generate_source(kind: str, directory: Path, rows: int) -> Path:
+    """
+    Sinh nguồn dữ liệu tổng hợp.
+
+    Args:
+        kind: `sqlite` hoặc `parquet`.
+        directory: Thư mục chứa nguồn.
+        rows: Số dòng của `num_crowd`; `ErrLog` có rows/10 dòng.
+
+    Returns:
+        Giá trị cho `ETL_SOURCE_PATH`.
+    """
+    tables = {
+        "store": make_store(),
+        "num_crowd": make_num_crowd(rows).sort_values("recordtime"),
+        "ErrLog": make_err_log(max(1, rows // 10)).sort_values("LogTime"),
+    }
+    if kind == "parquet":
+        path = directory / "source"
+        path.mkdir(parents=True, exist_ok=True)
+        for name, df in tables.items():
+            df.to_parquet(path / f"{name}.parquet", index=False)
+        return path
+
+    path = directory / "source.db"
+    with sqlite3.connect(path) as conn:
+        for name, df in tables.items():
+            df = df.copy()
+            # SQLite không có kiểu thời gian: lưu dạng chuỗi như SQL Server trả về.
+            for col in df.select_dtypes("datetime").columns:
+                df[col] = df[col].dt.strftime("%Y-%m-%d %H:%M:%S")
+            df.to_sql(name, conn, index=False)
+    return path
+
+
+def _run_case(
+    table: str, chunk_size: Optional[int], trace_memory: bool
+) -> Dict[str, Any]:
+    """
+    Chạy pipeline cho một bảng trong tiến trình hiện tại (tiến trình con).
+
+    Môi trường (`ETL_SOURCE`, `ETL_SOURCE_PATH`, `DATA_DIR`) đã được tiến
+    trình cha thiết lập trước khi import `app`.
+    """
+    import duckdb
+    from tenacity import stop_after_attempt
+
+    import cli
+    from app.core.config import settings
+    from app.etl import sources, telemetry
+    from app.etl.duckdb_writer import DuckDBWriter
+
+    logging.disable(logging.WARNING)
+    config = settings.TABLE_CONFIG[table].model_copy(update={"chunk_size": chunk_size})
+    metrics = telemetry.TableMetrics(config.dest_table)
+    process_table = cli._process_table.retry_with(
+        stop=stop_after_attempt(1), reraise=True
+    )
+
+    if trace_memory:
+        tracemalloc.start()
+    source = sources.create_source()
+    settings.DUCKDB_PATH.parent.mkdir(parents=True, exist_ok=True)
+    conn = duckdb.connect(str(settings.DUCKDB_PATH))
+    try:
+        with DuckDBWriter(conn) as writer:
+            process_table(source, writer, config, {}, threading.Lock(), metrics=metrics)
+        metrics.finish("succeeded")
+    finally:
+        conn.close()
+        source.close()
+
+    stages = {}
+    for stage in STAGES:
+        seconds = getattr(metrics, f"{stage}_seconds")
+        rows = (
+            metrics.rows_extracted
+            if stage in ("extract", "transform")
+            else metrics.rows_loaded
+        )
+        stages[stage] = {
+            "seconds": seconds,
+            "rows_per_second": rows / seconds if seconds > 0 else None,
+            "peak_heap_mb": metrics.stage_peak_mb(stage),
+        }
+    return {
+        "table": table,
+        "chunk_size": chunk_size or "auto",
+        "rows": metrics.rows_extracted,
+        "rows_loaded": metrics.rows_loaded,
+        "bytes_written": metrics.bytes_written,
+        "seconds": metrics.total_seconds,
+        "rows_per_second": metrics.rows_per_second,
+        "peak_rss_mb": metrics.peak_rss_mb,
+        "stages": stages,
+    }
+
+
+def _case_key(result: Dict[str, Any]) -> str:
+    return f"{result['table']}@{result['chunk_size']}"
+
+
+def find_regressions(
+    results: List[Dict[str, Any]], baseline: Dict[str, Any], threshold: float
+) -> List[str]:
+    """
+    So sánh kết quả với baseline.
+
+    Returns:
+        Mô tả các chỉ số giảm thông lượng hoặc tăng bộ nhớ quá `threshold`.
+    """
+    if baseline.get("rows") != results[0].get("source_rows"):
+        typer.echo(
+            "⚠️ Baseline được đo với số dòng khác, "
+            "kết quả so sánh chỉ mang tính tham khảo."
+        )
+    previous = {_case_key(r): r for r in baseline.get("results", [])}
+    regressions = []
+    for result in results:
+        key = _case_key(result)
+        base = previous.get(key)
+        if base is None:
+            continue
+        metrics = [("total", result["rows_per_second"], base["rows_per_second"])]
+        metrics += [
+            (
+                stage,
+                result["stages"][stage]["rows_per_second"],
+                base["stages"][stage]["rows_per_second"],
+            )
+            for stage in STAGES
+        ]
+        for name, current, previous_value in metrics:
+            if (
+                current
+                and previous_value
+                and current < previous_value * (1 - threshold)
+            ):
+                regressions.append(
+                    f"{key} {name}: {current:,.0f} rows/s < "
+                    f"baseline {previous_value:,.0f} rows/s"
+                )
+        if (
+            result["peak_rss_mb"]
+            and base.get("peak_rss_mb")
+            and result["peak_rss_mb"] > base["peak_rss_mb"] * (1 + threshold)
+        ):
+            regressions.append(
+                f"{key} peak RSS: {result['peak_rss_mb']:,.0f} MB > "
+                f"baseline {base['peak_rss_mb']:,.0f} MB"
+            )
+    return regressions
+
+
+def main(
+    rows: int = typer.Option(
+        200_000, help="Số dòng của `num_crowd` (ErrLog: rows/10)."
+    ),
+    source: str = typer.Option(
+        "sqlite", help="Loại nguồn tổng hợp: `sqlite` hoặc `parquet`."
+    ),
+    tables: str = typer.Option(
+        ",".join(TABLES), help="Các bảng (khóa trong `tables.yaml`)."
+    ),
+    chunk_sizes: str = typer.Option(
+        "auto", help="Các kích thước chunk, `auto` = theo ngân sách bộ nhớ."
+    ),
+    trace_memory: bool = typer.Option(
+        False, help="Đo bộ nhớ Python của từng giai đoạn bằng tracemalloc."
+    ),
+    baseline: Path = typer.Option(DEFAULT_BASELINE, help="Tệp baseline JSON."),
+    save_baseline: bool = typer.Option(
+        False, help="Ghi kết quả lần chạy này làm baseline."
+    ),
+    threshold: float = typer.Option(
+        0.2, help="Ngưỡng suy giảm cho phép so với baseline (0.2 = 20%)."
+    ),
+):
+    """Chạy benchmark end-to-end và so sánh với baseline."""
+    if source not in ("sqlite", "parquet"):
+        raise typer.BadParameter("Nguồn phải là `sqlite` hoặc `parquet`.")
+    sizes = [None if s.strip() == "auto" else int(s) for s in chunk_sizes.split(",")]
+    results = []
+
+    with tempfile.TemporaryDirectory(prefix="etl-bench-") as tmp:
+        tmp_path = Path(tmp)
+        typer.echo(f"Sinh nguồn {source} với {rows:,} dòng...")
+        source_path = generate_source(source, tmp_path, rows)
+
+        for table in tables.split(","):
+            for size in sizes:
+                data_dir = tmp_path / f"data-{table}-{size or 'auto'}"
+                # Tiến trình con đọc cấu hình từ biến môi trường khi import `app`.
+                os.environ.update(
+                    ETL_SOURCE=source,
+                    ETL_SOURCE_PATH=str(source_path),
+                    DATA_DIR=str(data_dir),
+                )
+                context = multiprocessing.get_context("spawn")
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                    result = executor.submit(
+                        _run_case, table, size, trace_memory
+                    ).result()
+                result["source_rows"] = rows
+                results.append(result)
+
+                stage_report = "  ".join(
+                    f"{stage}={info['rows_per_second'] or 0:>11,.0f}/s"
+                    + (
+                        f" ({info['peak_heap_mb']:,.0f} MB)"
+                        if info["peak_heap_mb"]
+                        else ""
+                    )
+                    for stage, info in result["stages"].items()
+                )
+                typer.echo(
+                    f"{table:<10} chunk={str(result['chunk_size']):>7}  "
+                    f"rows={result['rows']:>10,}  "
+                    f"total={result['rows_per_second']:>11,.0f}/s  "
+                    f"peak_rss={result['peak_rss_mb'] or 0:>7,.0f} MB  {stage_report}"
+                )
+
+    if save_baseline:
+        baseline.parent.mkdir(parents=True, exist_ok=True)
+        with baseline.open("w", encoding="utf-8") as f:
+            json.dump({"rows": rows, "source": source, "results": results}, f, indent=2)
+        typer.echo(f"Đã lưu baseline vào '{baseline}'.")
+        return
+
+    if not baseline.exists():
+        typer.echo(
+            f"Chưa có baseline '{baseline}'. Chạy lại với --save-baseline để tạo."
+        )
+        return
+
+    with baseline.open("r", encoding="utf-8") as f:
+        regressions = find_regressions(results, json.load(f), threshold)
+    if regressions:
+        typer.echo(f"❌ Suy giảm hiệu năng so với baseline (ngưỡng {threshold:.0%}):")
+        for line in regressions:
+            typer.echo(f"  - {line}")
+        raise typer.Exit(code=1)
+    typer.echo(f"✅ Không có suy giảm nào vượt ngưỡng {threshold:.0%} so với baseline.")
+
+
+if __name__ == "__main__":
+    typer.run(main)
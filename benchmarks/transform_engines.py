@@ -0,0 +1,164 @@
+"""
+Benchmark so sánh các transform engine và chế độ xác thực.
+
+Sinh dữ liệu tổng hợp có hình dạng giống các bảng nguồn (`num_crowd`,
+`ErrLog`), chạy lần lượt với cùng `TableConfig`:
+- `pandas`: engine pandas + xác thực Pandera (mặc định).
+- `compiled`: engine pandas + bộ xác thực compiled (`validation.FastValidator`).
+- `arrow`: engine arrow (luôn dùng bộ xác thực compiled).
+
+Đo thời gian và kiểm tra rằng tệp Parquet ghi ra giống hệt nhau từng byte,
+kể cả khi cột thời gian nguồn là chuỗi ở các dạng khác nhau (`STRING_TIME_FORMATS`).
+
+Cách chạy:
+    python -m benchmarks.transform_engines --rows 1000000 --repeat 3
+"""
+
+import io
+import time
+from typing import Callable, Dict
+
+import numpy as np
+import pandas as pd
+import pyarrow.parquet as pq
+import typer
+
+from app.core.config import TableConfig, settings
+from app.etl import transform, transform_arrow
+from app.etl.load import to_arrow_table
+from app.etl.validation import FastValidator
+
+
+def make_num_crowd(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Sinh một chunk dữ liệu thô giống bảng `dbo.num_crowd`."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00:00", "ns")
+    seconds = rng.integers(0, 365 * 24 * 3600, rows).astype("timedelta64[s]")
+    positions = np.array([" Cửa chính ", "Cửa phụ", "Thang cuốn  ", None], dtype=object)
+    return pd.DataFrame(
+        {
+            "recordtime": start + seconds,
+            "in_num": rng.integers(-5, 120, rows),
+            "out_num": rng.integers(-5, 120, rows),
+            "position": positions[rng.integers(0, len(positions), rows)],
+            "storeid": rng.integers(25, 40, rows),
+        }
+    )
+
+
+def make_err_log(rows: int, seed: int = 42) -> pd.DataFrame:
+    """Sinh một chunk dữ liệu thô giống bảng `dbo.ErrLog`."""
+    rng = np.random.default_rng(seed)
+    start = np.datetime64("2024-01-01T00:00:00", "ns")
+    seconds = rng.integers(0, 365 * 24 * 3600, rows).astype("timedelta64[s]")
+    messages = np.array(["Mất kết nối   ", " Lỗi cảm biến", "Quá nhiệt"], dtype=object)
+    return pd.DataFrame(
+        {
+            "ID": np.arange(rows, dtype="int64"),
+            "storeid": rng.integers(25, 40, rows),
+            "DeviceCode": rng.integers(1, 10, rows),
+            "LogTime": start + seconds,
+            "Errorcode": rng.integers(100, 200, rows),
+            "ErrorMessage": messages[rng.integers(0, len(messages), rows)],
+        }
+    )
+
+
+GENERATORS: Dict[str, Callable[[int], pd.DataFrame]] = {
+    "num_crowd": make_num_crowd,
+    "ErrLog": make_err_log,
+}
+
+
+# Các dạng chuỗi thời gian dùng để kiểm tra hai engine parse giống nhau.
+STRING_TIME_FORMATS = (
+    "%Y-%m-%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M:%S.%f",
+    "%Y-%m-%dT%H:%M:%S.%f",
+    "%Y-%m-%d",
+)
+
+
+def with_string_times(raw: pd.DataFrame, fmt: str) -> pd.DataFrame:
+    """
+    Bản sao của `raw` với các cột thời gian được định dạng thành chuỗi.
+
+    Vài dòng được thay bằng chuỗi không hợp lệ (phải trở thành null).
+    """
+    df = raw.copy()
+    for col in df.select_dtypes(include="datetime64[ns]").columns:
+        values = df[col].dt.strftime(fmt).astype(object)
+        values.iloc[1::97] = "không phải thời gian"
+        df[col] = values
+    return df
+
+
+def _parquet_bytes(data, config: TableConfig) -> bytes:
+    """Ghi kết quả transform ra Parquet trong bộ nhớ để so sánh từng byte."""
+    buffer = io.BytesIO()
+    pq.write_table(to_arrow_table(data, config), buffer)
+    return buffer.getvalue()
+
+
+def _best_time(func: Callable, repeat: int) -> float:
+    """Chạy `func` nhiều lần và trả về thời gian tốt nhất (giây)."""
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main(
+    rows: int = typer.Option(1_000_000, help="Số dòng dữ liệu tổng hợp mỗi bảng."),
+    repeat: int = typer.Option(3, help="Số lần lặp để lấy thời gian tốt nhất."),
+):
+    """Chạy benchmark cho từng bảng fact có cấu hình trong `tables.yaml`."""
+    for source_key, generator in GENERATORS.items():
+        config = settings.TABLE_CONFIG.get(source_key)
+        if config is None:
+            continue
+
+        raw = generator(rows)
+        # Engine pandas sửa DataFrame tại chỗ, nên mỗi lần chạy nhận một bản sao.
+        # Mỗi lần chạy dùng một bộ xác thực mới (tương ứng một lần chạy ETL).
+        variants = {
+            "pandas": lambda raw=raw, config=config: transform.run_transformations(
+                raw.copy(), config
+            ),
+            "compiled": lambda raw=raw, config=config: transform.run_transformations(
+                raw.copy(), config, FastValidator(config)
+            ),
+            "arrow": lambda raw=raw, config=config: transform_arrow.run_transformations(
+                raw, config
+            ),
+        }
+
+        timings, outputs = {}, {}
+        for name, run in variants.items():
+            timings[name] = _best_time(run, repeat)
+            outputs[name] = _parquet_bytes(run(), config)
+
+        baseline = timings["pandas"]
+        report = "  ".join(
+            f"{name}={seconds:7.3f}s ({rows / seconds:>11,.0f} rows/s, "
+            f"{baseline / seconds:4.1f}x)"
+            for name, seconds in timings.items()
+        )
+        identical = len(set(outputs.values())) == 1
+        for fmt in STRING_TIME_FORMATS:
+            text_raw = with_string_times(raw, fmt)
+            identical &= _parquet_bytes(
+                transform.run_transformations(text_raw.copy(), config), config
+            ) == _parquet_bytes(
+                transform_arrow.run_transformations(text_raw, config), config
+            )
+        typer.echo(
+            f"{source_key:<10} rows={rows:>10,}  {report}  byte-identical={identical}"
+        )
+
+
+if __name__ == "__main__":
+    typer.run(main)
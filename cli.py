@@ -4,25 +4,35 @@ Module định nghĩa giao diện dòng lệnh (CLI) cho ứng dụng.
 Sử dụng Typer để tạo các câu lệnh tiện ích, bao gồm:
 - `run-etl`: Chạy quy trình ETL đa luồng để đồng bộ dữ liệu.
 - `init-db`: Khởi tạo các đối tượng cần thiết trong DuckDB (ví dụ: VIEWs).
+- `reprocess-rejected`: Nạp lại các dòng trong khu vực cách ly sau khi sửa lỗi.
+- `etl-daemon`: Chạy ETL liên tục theo lô nhỏ cho các bảng incremental.
+- `backfill`: Nạp lại lịch sử của một bảng theo từng tháng, song song.
+- `reapply-offsets`: Dựng lại các tháng bị ảnh hưởng khi `time_offsets.yaml` đổi.
+- `compact`: Gộp các tệp Parquet nhỏ trong staging area theo từng partition.
+- `retention`: Chuyển các tháng giữa bảng DuckDB (nóng) và Parquet (lạnh).
 - `serve`: Khởi chạy web server FastAPI.
 """
 
 import contextlib
 import logging
+import os
+import shutil
+import signal
 from concurrent.futures import ThreadPoolExecutor, as_completed
+from pathlib import Path
 from threading import Lock
-from typing import Iterator
+from typing import Iterator, List, Optional, Tuple, Union
 from typing_extensions import Annotated
 
 import duckdb
+import pandas as pd
 import pandera.errors as pa_errors
+import pyarrow as pa
 import requests
 import typer
 import uvicorn
 from duckdb import DuckDBPyConnection
 from duckdb import Error as DuckdbError
-from sqlalchemy import create_engine, text
-from sqlalchemy.engine import Engine
 from sqlalchemy.exc import SQLAlchemyError
 from tenacity import (
     before_sleep_log,
@@ -32,9 +42,38 @@ from tenacity import (
     wait_fixed,
 )
 
+from app.core import snapshots
 from app.core.config import settings, TableConfig
-from app.etl import extract, state, transform
-from app.etl.load import ParquetLoader, prepare_destination, refresh_duckdb_table
+from app.etl import (
+    extract,
+    daemon,
+    offsets,
+    outliers,
+    quarantine,
+    scheduler,
+    sources,
+    state,
+    telemetry,
+    transform,
+    transform_arrow,
+    validation,
+)
+from app.etl.duckdb_writer import DuckDBWriter
+from app.etl.load import (
+    BASE_DATA_PATH,
+    ParquetLoader,
+    cold_partitions,
+    compact_partitions,
+    create_tiered_view,
+    move_to_cold,
+    move_to_hot,
+    prepare_destination,
+    refresh_duckdb_partitions,
+    refresh_duckdb_table,
+    replace_partition,
+    tiered_view_name,
+)
+from app.utils import prefork, profiling
 from app.utils.logger import setup_logging
 
 # Cấu hình logging ngay từ đầu để áp dụng cho toàn bộ ứng dụng.
@@ -48,33 +87,32 @@ cli_app = typer.Typer(
 
 
 @contextlib.contextmanager
-def _get_database_connections() -> Iterator[tuple[Engine, DuckDBPyConnection]]:
+def _get_database_connections() -> Iterator[Tuple[sources.Source, DuckDBPyConnection]]:
     """
     Context manager để quản lý vòng đời kết nối đến các database.
 
     Yields:
-        Một tuple chứa (SQLAlchemy Engine, DuckDB Connection).
+        Một tuple chứa (nguồn dữ liệu theo `ETL_SOURCE`, DuckDB Connection).
 
     Raises:
         SQLAlchemyError: Nếu không thể kết nối tới MS SQL Server.
         DuckdbError: Nếu không thể kết nối tới DuckDB.
     """
-    sql_engine, duckdb_conn = None, None
+    source, duckdb_conn = None, None
     try:
-        logger.info("Đang thiết lập kết nối tới MS SQL Server...")
-        sql_engine = create_engine(
-            settings.db.sqlalchemy_db_uri, pool_pre_ping=True
+        logger.info(
+            f"Đang thiết lập kết nối tới nguồn dữ liệu ({settings.ETL_SOURCE})..."
         )
-        with sql_engine.connect() as conn:
-            conn.execute(text("SELECT 1"))  # Ping để kiểm tra
-        logger.info("✅ Kết nối MS SQL Server thành công.")
+        source = sources.create_source()
+        source.check()
+        logger.info(f"✅ Kết nối nguồn dữ liệu ({source.name}) thành công.")
 
         logger.info("Đang thiết lập kết nối tới DuckDB...")
         duckdb_path = str(settings.DUCKDB_PATH.resolve())
         duckdb_conn = duckdb.connect(database=duckdb_path, read_only=False)
         logger.info(f"✅ Kết nối DuckDB ('{duckdb_path}') thành công.\n")
 
-        yield sql_engine, duckdb_conn
+        yield source, duckdb_conn
 
     except SQLAlchemyError as e:
         logger.critical(f"❌ Lỗi nghiêm trọng khi kết nối SQL Server: {e}", exc_info=True)
@@ -83,9 +121,9 @@ def _get_database_connections() -> Iterator[tuple[Engine, DuckDBPyConnection]]:
         logger.critical(f"❌ Lỗi nghiêm trọng khi kết nối DuckDB: {e}", exc_info=True)
         raise
     finally:
-        if sql_engine:
-            sql_engine.dispose()
-            logger.debug("Kết nối SQL Server đã được đóng.")
+        if source:
+            source.close()
+            logger.debug("Kết nối nguồn dữ liệu đã được đóng.")
         if duckdb_conn:
             duckdb_conn.close()
             logger.debug("Kết nối DuckDB đã được đóng.")
@@ -96,6 +134,20 @@ def _is_retryable_exception(exception: BaseException) -> bool:
     return isinstance(exception, (SQLAlchemyError, DuckdbError, IOError))
 
 
+def _transform_chunk(
+    chunk: pd.DataFrame,
+    config: TableConfig,
+    validator: Optional[validation.FastValidator],
+    quarantine_writer: quarantine.QuarantineWriter,
+) -> Union[pd.DataFrame, pa.Table]:
+    """Biến đổi một chunk bằng engine được cấu hình cho bảng (`transform_engine`)."""
+    if config.transform_engine == "arrow":
+        return transform_arrow.run_transformations(
+            chunk, config, validator, quarantine_writer
+        )
+    return transform.run_transformations(chunk, config, validator, quarantine_writer)
+
+
 @retry(
     stop=stop_after_attempt(3),
     wait=wait_fixed(15),
@@ -103,64 +155,160 @@ def _is_retryable_exception(exception: BaseException) -> bool:
     retry=retry_if_exception(_is_retryable_exception),
 )
 def _process_table(
-    sql_engine: Engine,
-    duckdb_conn: DuckDBPyConnection,
+    source: sources.Source,
+    duckdb_writer: DuckDBWriter,
     config: TableConfig,
     etl_state: dict,
     state_lock: Lock,
-):
+    partial_refresh: bool = False,
+    metrics: Optional[telemetry.TableMetrics] = None,
+) -> int:
     """
     Xử lý toàn bộ pipeline ETL cho một bảng duy nhất (Extract -> Transform -> Load).
 
     Hàm này được bọc bởi decorator @retry để tự động thử lại nếu gặp lỗi
-    liên quan đến kết nối hoặc I/O.
+    liên quan đến kết nối hoặc I/O. Mọi thao tác ghi vào DuckDB được chuyển
+    cho `duckdb_writer` để thực hiện tuần tự với các bảng khác.
+
+    Args:
+        partial_refresh: Chỉ nạp lại các partition vừa có dữ liệu mới thay vì
+            toàn bộ bảng (dùng cho chế độ daemon). Bảng có `primary_key` luôn
+            được nạp theo partition.
+        metrics: Nơi ghi nhận số liệu của bảng trong lần chạy (telemetry).
+
+    Returns:
+        Số dòng mới hoặc đã thay đổi đã được nạp (không tính các dòng được
+        trích xuất lại trong cửa sổ `lookback` mà không thay đổi).
     """
     logger.info(
         f"Bắt đầu xử lý bảng: '{config.source_table}' -> '{config.dest_table}' "
         f"(Incremental: {config.incremental})"
     )
+    metrics = metrics or telemetry.TableMetrics(config.dest_table)
+    metrics.begin_attempt()
     prepare_destination(config)
 
-    last_timestamp = state.get_last_timestamp(etl_state, config.dest_table)
-    data_iterator = extract.from_sql_server(sql_engine, config, last_timestamp)
+    watermark = state.get_watermark(etl_state, config.dest_table)
+    metrics.watermark_before = watermark.timestamp
+    with metrics.stage("extract"):
+        data_iterator = source.extract(config, watermark)
+    validator = validation.create_validator(config)
+    quarantine_writer = quarantine.QuarantineWriter(config)
+
+    # Các partition đã checkpoint ở lần chạy bị gián đoạn trước đó nhưng
+    # chưa được nạp vào DuckDB.
+    resumed_partitions = state.get_pending_partitions(etl_state, config.dest_table)
+    if resumed_partitions:
+        logger.info(
+            f"Tiếp tục '{config.dest_table}' từ checkpoint "
+            f"({watermark.timestamp}, {watermark.key}), "
+            f"{len(resumed_partitions)} partition đang chờ nạp vào DuckDB."
+        )
 
-    total_rows, max_ts_in_run = 0, None
+    new_watermark, chunks_since_checkpoint = None, 0
 
     try:
         with ParquetLoader(config) as loader:
-            for chunk in data_iterator:
-                transformed_chunk = transform.run_transformations(chunk, config)
-                if transformed_chunk.empty:
-                    continue
+            for chunk in metrics.timed(data_iterator, "extract"):
+                metrics.rows_extracted += len(chunk)
+                # Lấy high-water mark từ dữ liệu gốc, trước khi bị biến đổi.
+                if config.incremental and len(chunk) > 0:
+                    new_watermark = extract.watermark_of(chunk, config)
 
-                loader.write_chunk(transformed_chunk)
-                total_rows += len(transformed_chunk)
+                with metrics.stage("transform"):
+                    transformed_chunk = _transform_chunk(
+                        chunk, config, validator, quarantine_writer
+                    )
+                metrics.rows_transformed += len(transformed_chunk)
+                if len(transformed_chunk) > 0:
+                    with metrics.stage("write"):
+                        loader.write_chunk(transformed_chunk)
 
-                current_max_ts = transform.get_max_timestamp(
-                    transformed_chunk, config
-                )
-                if current_max_ts and (
-                    max_ts_in_run is None or current_max_ts > max_ts_in_run
+                # Checkpoint định kỳ: công bố các tệp đã ghi và lưu high-water
+                # mark, để lần thử lại tiếp tục ngay sau chunk này.
+                chunks_since_checkpoint += 1
+                if (
+                    new_watermark
+                    and chunks_since_checkpoint >= settings.ETL_CHECKPOINT_INTERVAL
                 ):
-                    max_ts_in_run = current_max_ts
+                    with metrics.stage("write"):
+                        loader.checkpoint()
+                    pending_partitions = sorted(
+                        set(resumed_partitions) | set(loader.written_partitions)
+                    )
+                    with state_lock:
+                        state.update_watermark(
+                            etl_state, config.dest_table, new_watermark
+                        )
+                        state.set_pending_partitions(
+                            etl_state, config.dest_table, pending_partitions
+                        )
+                        state.save_etl_state(etl_state)
+                    logger.debug(
+                        f"Checkpoint '{config.dest_table}' tại "
+                        f"({new_watermark.timestamp}, {new_watermark.key})."
+                    )
+                    chunks_since_checkpoint = 0
 
-        if total_rows > 0:
-            logger.info(
-                f"Đã xử lý {total_rows:,} dòng. Bắt đầu nạp vào DuckDB..."
+            # Đóng các tệp còn lại và gộp theo khóa chính ngay tại đây để tính
+            # vào giai đoạn write.
+            with metrics.stage("write"):
+                loader.finalize()
+
+        # Các tệp cuối cùng đã được công bố: lưu high-water mark (kể cả khi
+        # mọi dòng mới đều bị cách ly, để chúng không bị trích xuất lại) cùng
+        # các partition chờ nạp trước khi nạp DuckDB. Nếu bước nạp thất bại,
+        # lần chạy sau không trích xuất lại mà chỉ nạp tiếp các partition này.
+        pending_partitions = sorted(
+            set(resumed_partitions) | set(loader.written_partitions)
+        )
+        if new_watermark:
+            with state_lock:
+                state.update_watermark(etl_state, config.dest_table, new_watermark)
+                state.set_pending_partitions(
+                    etl_state, config.dest_table, pending_partitions
+                )
+                state.save_etl_state(etl_state)
+
+        total_rows = loader.new_rows
+        metrics.bytes_written = loader.bytes_written
+        metrics.rows_rejected = quarantine_writer.rejected_rows
+        if quarantine_writer.rejected_rows > 0:
+            logger.warning(
+                f"⚠️ {quarantine_writer.rejected_rows:,} dòng của '{config.dest_table}' "
+                f"không hợp lệ đã được cách ly tại '{quarantine_writer.dest_path}'. "
+                f"Chạy `reprocess-rejected` sau khi sửa dữ liệu."
             )
-            refresh_duckdb_table(duckdb_conn, config, loader.has_written_data)
-            logger.info(f"Nạp dữ liệu vào DuckDB '{config.dest_table}' hoàn tất.")
 
-            if config.incremental and max_ts_in_run:
-                with state_lock:
-                    state.update_timestamp(
-                        etl_state, config.dest_table, max_ts_in_run
+        if loader.has_written_data or pending_partitions:
+            logger.info(
+                f"Có {total_rows:,} dòng mới hoặc đã thay đổi. "
+                f"Bắt đầu nạp vào DuckDB..."
+            )
+            with metrics.stage("load"):
+                # Bảng có khóa chính chỉ cần nạp lại các partition vừa thay
+                # đổi, không phải dựng lại cả bảng từ mọi tệp Parquet.
+                if config.partition_cols and (partial_refresh or config.primary_key):
+                    duckdb_writer.execute(
+                        refresh_duckdb_partitions, config, pending_partitions
                     )
-                    state.save_etl_state(etl_state)
+                else:
+                    duckdb_writer.execute(
+                        refresh_duckdb_table, config, True, pending_partitions
+                    )
+            metrics.rows_loaded = total_rows
+            logger.info(f"Nạp dữ liệu vào DuckDB '{config.dest_table}' hoàn tất.")
         else:
             logger.info(f"Không có dữ liệu mới cho bảng '{config.dest_table}'.")
 
-        return config.dest_table
+        # Đã nạp xong: không còn partition nào chờ nạp.
+        if pending_partitions:
+            with state_lock:
+                state.set_pending_partitions(etl_state, config.dest_table, [])
+                state.save_etl_state(etl_state)
+        metrics.watermark_after = (new_watermark or watermark).timestamp
+
+        return total_rows
 
     except pa_errors.SchemaErrors as e:
         logger.error(
@@ -177,6 +325,29 @@ def _process_table(
         raise
 
 
+def _publish_snapshot(duckdb_conn: DuckDBPyConnection):
+    """
+    Công bố snapshot DuckDB mới cho API sau khi nạp dữ liệu.
+
+    Lỗi chỉ được ghi log: API tiếp tục đọc snapshot trước đó.
+    """
+    try:
+        snapshots.publish(duckdb_conn)
+    except (DuckdbError, OSError) as e:
+        logger.error(f"❌ Không thể công bố snapshot DuckDB cho API: {e}", exc_info=True)
+
+
+def _find_table_config(table_name: str) -> TableConfig:
+    """Tìm cấu hình bảng theo tên bảng đích hoặc khóa trong `tables.yaml`."""
+    if table_name in settings.TABLE_CONFIG:
+        return settings.TABLE_CONFIG[table_name]
+    for config in settings.TABLE_CONFIG.values():
+        if config.dest_table == table_name:
+            return config
+    logger.error(f"❌ Không tìm thấy cấu hình cho bảng '{table_name}'.")
+    raise typer.Exit(code=1)
+
+
 def _trigger_cache_clear(host: str, port: int):
     """Gửi yêu cầu POST đến API server để xóa cache."""
     if not settings.INTERNAL_API_TOKEN:
@@ -213,56 +384,89 @@ def run_etl(
         "127.0.0.1", help="Host của API server đang chạy."
     ),
     api_port: int = typer.Option(8000, help="Port của API server đang chạy."),
+    profile: bool = typer.Option(
+        False, help="Đo bộ nhớ từng giai đoạn và ghi báo cáo vào `PROFILE_DIR`."
+    ),
 ):
     """Chạy quy trình ETL đa luồng để đồng bộ dữ liệu từ SQL Server sang DuckDB."""
+    if profile or settings.PROFILE_MEMORY:
+        profiling.enable()
     logger.info("=" * 60)
     logger.info(f"🚀 BẮT ĐẦU QUY TRÌNH ETL (Tối đa {max_workers} luồng)")
     logger.info("=" * 60)
 
-    succeeded, failed = [], []
     etl_state = state.load_etl_state()
     state_lock = Lock()
+    results = {}
+    run_telemetry = telemetry.RunTelemetry("run-etl")
 
-    tables_to_process = sorted(
-        settings.TABLE_CONFIG.values(), key=lambda cfg: cfg.processing_order
-    )
-    total_tables = len(tables_to_process)
+    try:
+        table_scheduler = scheduler.TableScheduler(settings.TABLE_CONFIG, max_workers)
+    except ValueError as e:
+        logger.critical(f"❌ Cấu hình phụ thuộc giữa các bảng không hợp lệ: {e}")
+        raise typer.Exit(code=1) from e
+    total_tables = len(table_scheduler.configs)
 
     try:
-        with _get_database_connections() as (sql_engine, duckdb_conn):
-            with ThreadPoolExecutor(max_workers=max_workers) as executor:
-                future_to_table = {
-                    executor.submit(
-                        _process_table,
-                        sql_engine,
-                        duckdb_conn,
-                        config,
-                        etl_state,
-                        state_lock,
-                    ): config
-                    for config in tables_to_process
-                }
+        with _get_database_connections() as (source, duckdb_conn):
+            # Worker song song ở bước Extract/Transform, ghi DuckDB tuần tự.
+            with DuckDBWriter(duckdb_conn) as duckdb_writer:
 
-                for future in as_completed(future_to_table):
-                    config = future_to_table[future]
+                def _run_table(config: TableConfig) -> int:
+                    """Xử lý một bảng và ghi log kết quả ngay khi hoàn tất."""
+                    metrics = run_telemetry.table(config.dest_table)
                     try:
-                        result = future.result()
-                        succeeded.append(result)
-                        logger.info(f"✅ Xử lý thành công '{config.dest_table}'.\n")
-                    except Exception:
-                        failed.append(config.dest_table)
+                        result = _process_table(
+                            source,
+                            duckdb_writer,
+                            config,
+                            etl_state,
+                            state_lock,
+                            metrics=metrics,
+                        )
+                    except Exception as e:
+                        metrics.finish(scheduler.FAILED, e)
                         logger.error(
                             f"❌ Xử lý '{config.dest_table}' thất bại sau tất cả "
                             f"các lần thử lại.\n"
                         )
+                        raise
+                    metrics.finish(scheduler.SUCCEEDED)
+                    logger.info(f"✅ Xử lý thành công '{config.dest_table}'.\n")
+                    return result
+
+                results = table_scheduler.run(_run_table)
+                for r in results.values():
+                    if r.status == scheduler.SKIPPED:
+                        run_telemetry.table(r.dest_table).finish(scheduler.SKIPPED)
+
+                # Số liệu không được làm hỏng kết quả của lần chạy.
+                try:
+                    duckdb_writer.execute(telemetry.save_run, run_telemetry)
+                except DuckdbError as e:
+                    logger.warning(f"Không thể lưu số liệu lần chạy vào DuckDB: {e}")
+                duckdb_writer.execute(_publish_snapshot)
     except Exception as e:
         logger.critical(
             f"Quy trình ETL bị dừng đột ngột do lỗi kết nối ban đầu: {e}"
         )
 
     finally:
+        succeeded = [
+            r.dest_table for r in results.values() if r.status == scheduler.SUCCEEDED
+        ]
+        failed = [
+            r.dest_table for r in results.values() if r.status == scheduler.FAILED
+        ]
+        skipped = [
+            r.dest_table for r in results.values() if r.status == scheduler.SKIPPED
+        ]
+
         if clear_cache and succeeded:
             _trigger_cache_clear(host=api_host, port=api_port)
+        if succeeded and not offsets.APPLIED_OFFSETS_FILE.exists():
+            # Mốc để `reapply-offsets` biết cấu hình nào đã được dùng.
+            offsets.save_applied_offsets()
 
         logger.info("=" * 60)
         logger.info("📊 TÓM TẮT KẾT QUẢ ETL")
@@ -271,50 +475,654 @@ def run_etl(
         logger.info(f"❌ Thất bại: {len(failed)}")
         if failed:
             logger.warning(f"Danh sách bảng thất bại: {', '.join(failed)}")
+        if skipped:
+            logger.warning(
+                f"⏭️ Bỏ qua do phụ thuộc thất bại: {', '.join(skipped)}"
+            )
+        if results:
+            path, duration = table_scheduler.critical_path()
+            logger.info(
+                f"⏱️ Đường găng: {' -> '.join(path)} ({duration:.1f}s)"
+            )
+        for metrics in run_telemetry.tables.values():
+            if metrics.status == scheduler.SUCCEEDED:
+                logger.info(
+                    f"📈 {metrics.dest_table}: {metrics.rows_loaded:,} dòng, "
+                    f"{metrics.rows_per_second:,.0f} dòng/s (extract "
+                    f"{metrics.extract_seconds:.1f}s, transform "
+                    f"{metrics.transform_seconds:.1f}s, write "
+                    f"{metrics.write_seconds:.1f}s, load {metrics.load_seconds:.1f}s)"
+                )
+        if run_telemetry.tables:
+            try:
+                report_path = run_telemetry.write_report()
+                logger.info(f"Báo cáo lần chạy: '{report_path}'")
+            except OSError as e:
+                logger.warning(f"Không thể ghi báo cáo lần chạy: {e}")
+        try:
+            profiling.write_report("run-etl")
+        except OSError as e:
+            logger.warning(f"Không thể ghi báo cáo memory profiling: {e}")
         logger.info("=" * 60 + "\n")
 
 
+@cli_app.command()
+def etl_daemon(
+    clear_cache: bool = typer.Option(
+        True, help="Xóa cache của API server mỗi khi có dữ liệu mới."
+    ),
+    api_host: str = typer.Option(
+        "127.0.0.1", help="Host của API server đang chạy."
+    ),
+    api_port: int = typer.Option(8000, help="Port của API server đang chạy."),
+):
+    """Chạy ETL liên tục theo lô nhỏ cho các bảng incremental (Ctrl+C để dừng)."""
+    logger.info("=" * 60)
+    logger.info("🚀 KHỞI ĐỘNG ETL DAEMON")
+    logger.info("=" * 60)
+
+    etl_state = state.load_etl_state()
+    state_lock = Lock()
+    # Daemon tự lùi lịch khi gặp lỗi, nên mỗi lô chỉ chạy một lần.
+    process_batch = _process_table.retry_with(
+        stop=stop_after_attempt(1), reraise=True
+    )
+
+    def _notify(tables: list):
+        logger.info(f"✅ Dữ liệu mới: {', '.join(tables)}")
+        duckdb_writer.execute(_publish_snapshot)
+        if clear_cache:
+            _trigger_cache_clear(host=api_host, port=api_port)
+
+    try:
+        with _get_database_connections() as (source, duckdb_conn):
+            with DuckDBWriter(duckdb_conn) as duckdb_writer:
+                etl_daemon = daemon.EtlDaemon(
+                    settings.TABLE_CONFIG,
+                    task=lambda config: process_batch(
+                        source,
+                        duckdb_writer,
+                        config,
+                        etl_state,
+                        state_lock,
+                        partial_refresh=True,
+                    ),
+                    on_new_data=_notify,
+                )
+                signal.signal(signal.SIGINT, etl_daemon.stop)
+                signal.signal(signal.SIGTERM, etl_daemon.stop)
+                etl_daemon.run()
+    except Exception as e:
+        logger.critical(f"❌ ETL daemon bị dừng đột ngột: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
+
 @cli_app.command()
 def init_db():
     """Khởi tạo hoặc cập nhật các VIEWs cần thiết trong DuckDB."""
     logger.info("Bắt đầu khởi tạo/cập nhật VIEW 'v_traffic_normalized'...")
 
-    scale = settings.OUTLIER_SCALE_RATIO
-    then_logic_in = (
-        f"CAST(ROUND(a.visitors_in * {scale}, 0) AS INTEGER)" if scale > 0 else "1"
-    )
-    then_logic_out = (
-        f"CAST(ROUND(a.visitors_out * {scale}, 0) AS INTEGER)" if scale > 0 else "1"
+    # Bảng phân tầng được đọc qua view gộp tầng nóng và tầng lạnh; `year`,
+    # `month` được giữ lại để điều kiện lọc theo partition được đẩy xuống.
+    tiered_configs = [c for c in settings.TABLE_CONFIG.values() if c.hot_months]
+    traffic_source = next(
+        (tiered_view_name(c) for c in tiered_configs if c.dest_table == "fact_traffic"),
+        "fact_traffic",
     )
 
+    # Outlier đã được hiệu chỉnh khi nạp dữ liệu (xem `app/etl/outliers.py`),
+    # VIEW chỉ đọc các cột `in_count`, `out_count` đã làm sạch.
     create_view_sql = f"""
     CREATE OR REPLACE VIEW v_traffic_normalized AS
     SELECT
         CAST(a.recorded_at AS TIMESTAMP) AS record_time,
         b.store_name,
-        CASE
-            WHEN a.visitors_in > {settings.OUTLIER_THRESHOLD} THEN {then_logic_in}
-            ELSE a.visitors_in
-        END AS in_count,
-        CASE
-            WHEN a.visitors_out > {settings.OUTLIER_THRESHOLD} THEN {then_logic_out}
-            ELSE a.visitors_out
-        END AS out_count,
+        a.in_count,
+        a.out_count,
+        a.is_outlier,
+        a.year,
+        a.month,
         -- Dịch chuyển thời gian để ngày làm việc bắt đầu từ 00:00
         (record_time - INTERVAL '{settings.WORKING_HOUR_START} hours') AS adjusted_time
-    FROM fact_traffic AS a
+    FROM {traffic_source} AS a
     LEFT JOIN dim_stores AS b ON a.store_id = b.store_id;
     """
 
     try:
         db_path = str(settings.DUCKDB_PATH.resolve())
         with duckdb.connect(database=db_path, read_only=False) as conn:
+            # Dữ liệu nạp trước khi có các cột outlier được tính bổ sung một lần.
+            for config in settings.TABLE_CONFIG.values():
+                outliers.flag_outliers(conn, config)
+            for config in tiered_configs:
+                create_tiered_view(conn, config)
             conn.execute(create_view_sql)
+            _publish_snapshot(conn)
         logger.info("✅ Đã tạo/cập nhật thành công VIEW 'v_traffic_normalized'.")
     except Exception as e:
         logger.error(f"❌ Lỗi khi khởi tạo VIEW: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
+
+@cli_app.command()
+def reprocess_rejected(
+    table: str = typer.Option(
+        ..., help="Bảng cần xử lý lại (tên bảng đích hoặc khóa trong tables.yaml)."
+    ),
+    clear_cache: bool = typer.Option(
+        True, help="Tự động xóa cache của API server sau khi nạp thành công."
+    ),
+    api_host: str = typer.Option(
+        "127.0.0.1", help="Host của API server đang chạy."
+    ),
+    api_port: int = typer.Option(8000, help="Port của API server đang chạy."),
+):
+    """Xác thực lại và nạp các dòng trong khu vực cách ly của một bảng."""
+    config = _find_table_config(table)
+    if not config.incremental:
+        logger.warning(
+            f"Bảng '{config.dest_table}' chạy full-load, dữ liệu sẽ được tải lại "
+            f"toàn bộ ở lần `run-etl` tiếp theo. Không cần xử lý lại."
+        )
+        return
+
+    validator = validation.create_validator(config)
+    still_rejected = quarantine.QuarantineWriter(config)
+    processed_files, recovered_rows = [], 0
+
+    try:
+        db_path = str(settings.DUCKDB_PATH.resolve())
+        with duckdb.connect(database=db_path, read_only=False) as duckdb_conn:
+            with ParquetLoader(config) as loader:
+                for file_path, df in quarantine.iter_quarantined(config):
+                    valid_df = transform.revalidate(
+                        df, config, validator, still_rejected
+                    )
+                    loader.write_chunk(valid_df)
+                    recovered_rows += len(valid_df)
+                    processed_files.append(file_path)
+            refresh_duckdb_table(
+                duckdb_conn,
+                config,
+                loader.has_written_data,
+                changed_partitions=loader.written_partitions,
+            )
+            if loader.has_written_data:
+                _publish_snapshot(duckdb_conn)
+    except Exception as e:
+        logger.error(f"❌ Lỗi khi xử lý lại dữ liệu cách ly: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
+    # Chỉ xóa các tệp cũ sau khi dữ liệu đã được nạp thành công. Các dòng vẫn
+    # còn lỗi đã được ghi sang tệp cách ly mới.
+    for file_path in processed_files:
+        file_path.unlink(missing_ok=True)
+
+    logger.info(
+        f"✅ '{config.dest_table}': đã nạp lại {recovered_rows:,} dòng từ "
+        f"{len(processed_files)} tệp cách ly, "
+        f"{still_rejected.rejected_rows:,} dòng vẫn còn lỗi."
+    )
+    if clear_cache and recovered_rows:
+        _trigger_cache_clear(host=api_host, port=api_port)
+
+
+def _is_month_partitioned(config: TableConfig) -> bool:
+    """Bảng có thể được dựng lại theo từng tháng (`backfill`) hay không."""
+    return bool(config.timestamp_col) and set(config.partition_cols) == {
+        "year",
+        "month",
+    }
+
+
+def _month_partition(config: TableConfig, month: pd.Period) -> Tuple:
+    """Giá trị `partition_cols` của một tháng."""
+    values = {"year": month.year, "month": month.month}
+    return tuple(values[col] for col in config.partition_cols)
+
+
+def _source_window(
+    config: TableConfig, month: pd.Period
+) -> Tuple[pd.Timestamp, pd.Timestamp]:
+    """
+    Khoảng thời gian gốc ở nguồn cần trích xuất để dựng lại một tháng.
+
+    Timestamp được điều chỉnh bằng time offsets sau khi trích xuất, nên khoảng
+    được nới rộng theo offset lớn nhất của bảng; các dòng thuộc tháng khác
+    được loại bỏ khi thay partition.
+    """
+    schedule = offsets.get_schedule(config.source_table.split(".")[-1])
+    min_offset, max_offset = schedule.bounds() if schedule else (0, 0)
+    start = month.start_time + pd.Timedelta(minutes=min_offset)
+    end = (month + 1).start_time + pd.Timedelta(minutes=max_offset)
+    return start, end
+
+
+def _backfill_month(
+    source: sources.Source,
+    config: TableConfig,
+    month: pd.Period,
+    watermark: Optional[state.Watermark],
+) -> int:
+    """
+    Dựng lại partition của một tháng từ nguồn và thay thế nó trong staging area.
+
+    Dữ liệu được ghi vào một thư mục tạm và chỉ thay partition hiện tại khi đã
+    ghi xong. Các dòng sau high-water mark bị bỏ qua vì chúng thuộc về lần
+    chạy incremental tiếp theo.
+
+    Returns:
+        Số dòng của partition mới.
+    """
+    work_path = BASE_DATA_PATH / ".backfill" / config.dest_table / str(month)
+    if work_path.exists():
+        shutil.rmtree(work_path)
+
+    start, end = _source_window(config, month)
+    validator = validation.create_validator(config)
+    quarantine_writer = quarantine.QuarantineWriter(config)
+
+    try:
+        with ParquetLoader(config, dest_path=work_path) as loader:
+            chunks = source.extract_range(config, start, end)
+            for chunk in chunks:
+                if watermark is not None:
+                    chunk = chunk[
+                        extract.not_after_watermark(chunk, config, watermark)
+                    ]
+                if len(chunk) == 0:
+                    continue
+                loader.write_chunk(
+                    _transform_chunk(chunk, config, validator, quarantine_writer)
+                )
+
+        return replace_partition(config, _month_partition(config, month), work_path)
+    finally:
+        shutil.rmtree(work_path, ignore_errors=True)
+
+
+def _backfill_months(
+    source: sources.Source,
+    duckdb_conn: DuckDBPyConnection,
+    config: TableConfig,
+    months: List[pd.Period],
+    watermark: Optional[state.Watermark],
+    max_connections: int,
+) -> Tuple[List[pd.Period], List[pd.Period]]:
+    """
+    Dựng lại song song các tháng của một bảng rồi làm mới chúng trong DuckDB.
+
+    Returns:
+        Danh sách các tháng đã thay thế và các tháng thất bại (giữ dữ liệu cũ).
+    """
+    replaced: List[pd.Period] = []
+    failed: List[pd.Period] = []
+    with ThreadPoolExecutor(max_workers=max_connections) as executor:
+        future_to_month = {
+            executor.submit(_backfill_month, source, config, month, watermark): month
+            for month in months
+        }
+        for future in as_completed(future_to_month):
+            month = future_to_month[future]
+            try:
+                rows = future.result()
+                replaced.append(month)
+                logger.info(f"✅ {month}: {rows:,} dòng.")
+            except Exception as e:
+                failed.append(month)
+                logger.error(f"❌ {month}: {e}", exc_info=True)
+    shutil.rmtree(BASE_DATA_PATH / ".backfill" / config.dest_table, ignore_errors=True)
+
+    if replaced:
+        refresh_duckdb_partitions(
+            duckdb_conn,
+            config,
+            [_month_partition(config, month) for month in replaced],
+        )
+    return replaced, failed
+
+
+def _current_watermark(config: TableConfig) -> Optional[state.Watermark]:
+    """High-water mark hiện tại của bảng (None nếu bảng không incremental)."""
+    etl_state = state.load_etl_state()
+    if config.incremental and config.dest_table in etl_state:
+        return state.get_watermark(etl_state, config.dest_table)
+    return None
+
+
+@cli_app.command()
+def backfill(
+    table: str = typer.Option(
+        ..., help="Bảng cần nạp lại (tên bảng đích hoặc khóa trong tables.yaml)."
+    ),
+    from_month: str = typer.Option(..., "--from", help="Tháng bắt đầu (YYYY-MM)."),
+    to_month: str = typer.Option(
+        ..., "--to", help="Tháng kết thúc, bao gồm (YYYY-MM)."
+    ),
+    max_connections: int = typer.Option(
+        4, help="Số tháng (kết nối tới SQL Server) được xử lý song song tối đa."
+    ),
+    clear_cache: bool = typer.Option(
+        True, help="Tự động xóa cache của API server sau khi nạp thành công."
+    ),
+    api_host: str = typer.Option(
+        "127.0.0.1", help="Host của API server đang chạy."
+    ),
+    api_port: int = typer.Option(8000, help="Port của API server đang chạy."),
+):
+    """Nạp lại lịch sử của một bảng theo từng tháng (không chạy cùng `run-etl`)."""
+    config = _find_table_config(table)
+    if not _is_month_partitioned(config):
+        logger.error(
+            f"❌ Bảng '{config.dest_table}' phải có 'timestamp_col' và được "
+            f"partition theo năm/tháng để backfill."
+        )
+        raise typer.Exit(code=1)
+
+    try:
+        months = list(pd.period_range(from_month, to_month, freq="M"))
+    except ValueError as e:
+        logger.error(f"❌ Khoảng thời gian không hợp lệ: {e}")
+        raise typer.Exit(code=1) from e
+    if not months:
+        logger.error(
+            f"❌ '--from' ({from_month}) phải không muộn hơn '--to' ({to_month})."
+        )
         raise typer.Exit(code=1)
 
+    watermark = _current_watermark(config)
+
+    logger.info("=" * 60)
+    logger.info(
+        f"🚀 BACKFILL '{config.dest_table}': {months[0]} -> {months[-1]} "
+        f"({len(months)} tháng, tối đa {max_connections} kết nối)"
+    )
+    logger.info("=" * 60)
+
+    try:
+        with _get_database_connections() as (source, duckdb_conn):
+            replaced, failed = _backfill_months(
+                source, duckdb_conn, config, months, watermark, max_connections
+            )
+            if replaced:
+                _publish_snapshot(duckdb_conn)
+    except Exception as e:
+        logger.critical(f"❌ Backfill bị dừng đột ngột: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
+    logger.info(
+        f"📊 Backfill '{config.dest_table}': {len(replaced)} tháng thành công, "
+        f"{len(failed)} tháng thất bại."
+    )
+    if clear_cache and replaced:
+        _trigger_cache_clear(host=api_host, port=api_port)
+    if failed:
+        logger.warning(
+            f"Các tháng thất bại (giữ nguyên dữ liệu cũ): "
+            f"{', '.join(str(m) for m in sorted(failed))}"
+        )
+        raise typer.Exit(code=1)
+
+
+def _offset_change_months(
+    duckdb_conn: DuckDBPyConnection,
+    config: TableConfig,
+    change: offsets.OffsetChange,
+) -> List[pd.Period]:
+    """
+    Các tháng (theo thời gian đã điều chỉnh) bị ảnh hưởng bởi một thay đổi offset.
+
+    Khoảng gốc [start, end) được dịch theo số phút cũ và mới, nên dòng của
+    cửa hàng có thể rời khỏi tháng cũ hoặc chuyển sang tháng mới. Đầu không
+    giới hạn được thay bằng phạm vi dữ liệu hiện có của cửa hàng, gồm cả các
+    partition ở tầng lạnh (qua view `<bảng>_all`).
+    """
+    ts_col = config.rename_map.get(config.timestamp_col, config.timestamp_col)
+    store_col = config.rename_map.get("storeid", "storeid")
+    table = tiered_view_name(config) if cold_partitions(config) else config.dest_table
+    data_min, data_max = duckdb_conn.execute(
+        f'SELECT min("{ts_col}"), max("{ts_col}") FROM {table} '
+        f'WHERE "{store_col}" = ?',
+        [change.store_id],
+    ).fetchone()
+    if data_min is None:
+        return []
+
+    span = pd.Timedelta(minutes=change.max_minutes - change.min_minutes)
+    lower = pd.Timestamp(data_min) - span
+    upper = pd.Timestamp(data_max) + span
+    start = (
+        change.start - pd.Timedelta(minutes=change.max_minutes)
+        if change.start is not None
+        else lower
+    )
+    end = (
+        change.end - pd.Timedelta(minutes=change.min_minutes)
+        if change.end is not None
+        else upper
+    )
+    start, end = max(start, lower), min(end, upper)
+    if start > end:
+        return []
+    return list(pd.period_range(start.to_period("M"), end.to_period("M"), freq="M"))
+
+
+@cli_app.command()
+def reapply_offsets(
+    previous: Path = typer.Option(
+        offsets.APPLIED_OFFSETS_FILE,
+        help="Cấu hình offset đã dùng để dựng dữ liệu hiện tại.",
+    ),
+    table: str = typer.Option(
+        None, help="Chỉ xử lý bảng này (mặc định: mọi bảng có time offsets)."
+    ),
+    max_connections: int = typer.Option(
+        4, help="Số tháng (kết nối tới SQL Server) được xử lý song song tối đa."
+    ),
+    dry_run: bool = typer.Option(
+        False, help="Chỉ liệt kê các tháng bị ảnh hưởng, không dựng lại."
+    ),
+    clear_cache: bool = typer.Option(
+        True, help="Tự động xóa cache của API server sau khi nạp thành công."
+    ),
+    api_host: str = typer.Option(
+        "127.0.0.1", help="Host của API server đang chạy."
+    ),
+    api_port: int = typer.Option(8000, help="Port của API server đang chạy."),
+):
+    """Dựng lại các tháng bị ảnh hưởng khi `time_offsets.yaml` thay đổi."""
+    if not previous.exists():
+        if not dry_run:
+            offsets.save_applied_offsets()
+        logger.warning(
+            f"Không tìm thấy cấu hình offset đã áp dụng '{previous}'. Cấu hình "
+            f"hiện tại được ghi nhận làm mốc, không có gì để so sánh."
+        )
+        return
+    try:
+        old_offsets = offsets.load_offsets_file(previous)
+    except (OSError, ValueError) as e:
+        logger.error(f"❌ Không đọc được '{previous}': {e}")
+        raise typer.Exit(code=1) from e
+
+    configs = (
+        [_find_table_config(table)]
+        if table
+        else list(settings.TABLE_CONFIG.values())
+    )
+    # Bảng cần dựng lại -> (tháng bị ảnh hưởng, số cửa hàng thay đổi).
+    plan = {}
+    failed_tables: List[str] = []
+    try:
+        with _get_database_connections() as (source, duckdb_conn):
+            for config in configs:
+                key = config.source_table.split(".")[-1]
+                old = old_offsets.get(key)
+                changes = offsets.changed_windows(
+                    offsets.OffsetSchedule(old) if old else None,
+                    offsets.get_schedule(key),
+                )
+                if not changes:
+                    continue
+                if not _is_month_partitioned(config):
+                    logger.warning(
+                        f"⚠️ Offset của '{key}' đã thay đổi nhưng bảng "
+                        f"'{config.dest_table}' không được partition theo "
+                        f"năm/tháng: cần nạp lại toàn bộ."
+                    )
+                    failed_tables.append(config.dest_table)
+                    continue
+
+                months = set()
+                for change in changes:
+                    months.update(_offset_change_months(duckdb_conn, config, change))
+                months = sorted(months)
+                plan[config.dest_table] = months
+                logger.info(
+                    f"🕒 '{config.dest_table}': offset của "
+                    f"{len({c.store_id for c in changes})} cửa hàng thay đổi, "
+                    f"{len(months)} tháng bị ảnh hưởng"
+                    + (f" ({', '.join(str(m) for m in months)})" if months else "")
+                )
+                if dry_run or not months:
+                    continue
+
+                _, failed = _backfill_months(
+                    source,
+                    duckdb_conn,
+                    config,
+                    months,
+                    _current_watermark(config),
+                    max_connections,
+                )
+                if failed:
+                    failed_tables.append(config.dest_table)
+                    logger.warning(
+                        f"Các tháng thất bại của '{config.dest_table}' (giữ nguyên "
+                        f"dữ liệu cũ): {', '.join(str(m) for m in sorted(failed))}"
+                    )
+            if not dry_run and any(plan.values()):
+                _publish_snapshot(duckdb_conn)
+    except Exception as e:
+        logger.critical(f"❌ Dựng lại theo offset bị dừng đột ngột: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
+    if dry_run:
+        return
+    if not plan and not failed_tables:
+        logger.info("✅ Cấu hình offset không thay đổi, không cần dựng lại.")
+    if failed_tables:
+        # Giữ mốc cũ để lần chạy sau dựng lại cả các tháng thất bại.
+        raise typer.Exit(code=1)
+    offsets.save_applied_offsets()
+    if clear_cache and any(plan.values()):
+        _trigger_cache_clear(host=api_host, port=api_port)
+
+
+@cli_app.command()
+def compact(
+    table: str = typer.Option(
+        None, help="Chỉ gộp tệp cho bảng này (mặc định: tất cả các bảng incremental)."
+    ),
+):
+    """Gộp các tệp Parquet nhỏ trong staging area thành các tệp lớn hơn."""
+    configs = (
+        [_find_table_config(table)]
+        if table
+        else [c for c in settings.TABLE_CONFIG.values() if c.incremental]
+    )
+
+    try:
+        for config in configs:
+            compacted = compact_partitions(config)
+            logger.info(
+                f"✅ '{config.dest_table}': đã gộp {compacted} partition."
+            )
+    except (OSError, pa.ArrowException) as e:
+        logger.error(f"❌ Lỗi khi gộp tệp Parquet: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
+
+@cli_app.command()
+def retention(
+    table: str = typer.Option(
+        None, help="Chỉ xử lý bảng này (mặc định: mọi bảng có `hot_months`)."
+    ),
+    as_of: str = typer.Option(
+        None, "--as-of", help="Tháng hiện tại (YYYY-MM), mặc định: tháng này."
+    ),
+    hot_months: Optional[int] = typer.Option(
+        None, min=1, help="Số tháng giữ trong DuckDB (ghi đè `hot_months`)."
+    ),
+    dry_run: bool = typer.Option(
+        False, help="Chỉ liệt kê các tháng sẽ được chuyển, không thay đổi dữ liệu."
+    ),
+):
+    """
+    Chuyển các tháng cũ sang Parquet (tầng lạnh), các tháng gần đây về DuckDB.
+
+    Kết quả truy vấn qua view `<bảng>_all` không đổi, chỉ nơi lưu dữ liệu thay
+    đổi, nên không cần xóa cache của API. Không chạy cùng `run-etl`.
+    """
+    configs = (
+        [_find_table_config(table)]
+        if table
+        else [c for c in settings.TABLE_CONFIG.values() if c.hot_months]
+    )
+    untiered = [c.dest_table for c in configs if c.hot_months is None]
+    if untiered or not configs:
+        logger.error(
+            f"❌ Chưa cấu hình 'hot_months' cho bảng: {', '.join(untiered) or '-'}."
+        )
+        raise typer.Exit(code=1)
+
+    try:
+        current = pd.Period(as_of, freq="M") if as_of else pd.Period.now(freq="M")
+    except ValueError as e:
+        logger.error(f"❌ Tháng không hợp lệ: {e}")
+        raise typer.Exit(code=1) from e
+
+    try:
+        db_path = str(settings.DUCKDB_PATH.resolve())
+        with duckdb.connect(database=db_path, read_only=False) as conn:
+            moved = False
+            for config in configs:
+                cutoff = current - ((hot_months or config.hot_months) - 1)
+                boundary = _month_partition(config, cutoff)
+                exists = conn.execute(
+                    "SELECT count(*) FROM information_schema.tables "
+                    "WHERE table_name = ?",
+                    [config.dest_table],
+                ).fetchone()[0]
+                if not exists:
+                    logger.warning(f"Bảng '{config.dest_table}' chưa tồn tại, bỏ qua.")
+                    continue
+                cols = ", ".join(config.partition_cols)
+                hot = conn.execute(
+                    f"SELECT DISTINCT {cols} FROM {config.dest_table} ORDER BY ALL"
+                ).fetchall()
+                demote = [tuple(key) for key in hot if tuple(key) < boundary]
+                promote = [key for key in cold_partitions(config) if key >= boundary]
+
+                logger.info(
+                    f"'{config.dest_table}': giữ trong DuckDB từ tháng {cutoff}; "
+                    f"{len(demote)} tháng sang tầng lạnh, "
+                    f"{len(promote)} tháng về tầng nóng."
+                )
+                if dry_run or not (promote or demote):
+                    continue
+                moved = True
+                move_to_hot(conn, config, promote)
+                move_to_cold(conn, config, demote)
+                # Giải phóng dung lượng của các dòng đã xóa trong tệp DuckDB.
+                conn.execute("CHECKPOINT;")
+                logger.info(f"✅ Đã cập nhật phân tầng cho '{config.dest_table}'.")
+            if moved:
+                _publish_snapshot(conn)
+    except (DuckdbError, OSError, pa.ArrowException) as e:
+        logger.error(f"❌ Lỗi khi chuyển dữ liệu giữa các tầng: {e}", exc_info=True)
+        raise typer.Exit(code=1) from e
+
 
 @cli_app.command()
 def serve(
@@ -325,8 +1133,55 @@ def serve(
     reload: Annotated[
         bool, typer.Option(help="Tự động tải lại khi code thay đổi.")
     ] = True,
+    profile: Annotated[
+        bool, typer.Option(help="Bật memory profiling cho các request API.")
+    ] = False,
+    workers: Annotated[
+        int,
+        typer.Option(
+            min=0, help="Số tiến trình worker (0 = số nhân CPU), >1 thì tắt reload."
+        ),
+    ] = 1,
+    max_requests: Annotated[
+        int,
+        typer.Option(
+            min=0, help="Thay mới worker sau số request này (0 = không giới hạn)."
+        ),
+    ] = 0,
+    max_requests_jitter: Annotated[
+        int, typer.Option(min=0, help="Độ lệch ngẫu nhiên thêm vào --max-requests.")
+    ] = 0,
+    graceful_timeout: Annotated[
+        int, typer.Option(min=1, help="Số giây chờ worker hoàn tất request khi dừng.")
+    ] = 30,
 ):
-    """Khởi chạy ứng dụng web FastAPI với Uvicorn."""
+    """
+    Khởi chạy ứng dụng web FastAPI với Uvicorn.
+
+    Với `--workers` lớn hơn 1 (hoặc khi đặt `--max-requests`), ứng dụng được
+    nạp một lần ở tiến trình master rồi fork thành các worker dùng chung
+    socket (xem `app/utils/prefork.py`). Gửi SIGHUP tới master để thay mới
+    lần lượt các worker.
+    """
+    if profile:
+        # Server có thể chạy ở tiến trình con (reload), nên truyền qua biến môi trường.
+        os.environ["PROFILE_MEMORY"] = "true"
+        settings.PROFILE_MEMORY = True
+    workers = workers or os.cpu_count() or 1
+    if workers > 1 or max_requests > 0:
+        if reload:
+            logger.warning("Chế độ nhiều worker không hỗ trợ reload, bỏ qua --reload.")
+        prefork.PreforkServer(
+            "app.main:api_app",
+            host=host,
+            port=port,
+            workers=workers,
+            max_requests=max_requests,
+            max_requests_jitter=max_requests_jitter,
+            graceful_timeout=graceful_timeout,
+        ).run()
+        return
+
     logger.info(f"🚀 Khởi chạy FastAPI server tại http://{host}:{port}")
     uvicorn.run(
         "app.main:api_app",
@@ -334,6 +1189,7 @@ def serve(
         port=port,
         reload=reload,
         reload_dirs=["app", "configs", "template"],
+        timeout_graceful_shutdown=graceful_timeout,
     )
 
 